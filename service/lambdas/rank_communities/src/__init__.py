@@ -1,6 +1,5 @@
 import os
 
-import topshelfsoftware_aws_util
 import topshelfsoftware_util
 from topshelfsoftware_util.log import add_log_stream
 # ----------------------------------------------------------------------------#
@@ -9,9 +8,26 @@ from topshelfsoftware_util.log import add_log_stream
 MODULE_NAME = "rank_communities"
 COMMUNITY_DATA_BUCKET_NAME = os.environ["COMMUNITY_DATA_BUCKET_NAME"]
 COMMUNITY_DATA_OBJECT_NAME = os.environ["COMMUNITY_DATA_OBJECT_NAME"]
+# emit stage timings of every ranking as CloudWatch EMF metrics
+STAGE_METRICS = os.environ.get("STAGE_METRICS", "false").lower() == "true"
+# frequency table of popular profiles in the community bucket (optional) and
+# how many of them the warm-up precomputes
+WARMUP_PROFILES_OBJECT_NAME = os.environ.get("WARMUP_PROFILES_OBJECT_NAME", "")
+WARMUP_N_PROFILES = int(os.environ.get("WARMUP_N_PROFILES", "50"))
+# default page size of paginated rankings and how many ranked orders (one
+# per dataset version and profile) are kept for their later pages
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "10"))
+RANKING_CACHE_SIZE = int(os.environ.get("RANKING_CACHE_SIZE", "32"))
+# default number of Pareto fronts and the most communities returned per front
+PARETO_N_FRONTS = int(os.environ.get("PARETO_N_FRONTS", "3"))
+PARETO_MAX_FRONT_SIZE = int(os.environ.get("PARETO_MAX_FRONT_SIZE", "25"))
+# default trade-off of score against similarity of diversified top communities
+DIVERSITY_WEIGHT = float(os.environ.get("DIVERSITY_WEIGHT", "0.3"))
+# default horizon (years) of the total cost of ownership
+TCO_YEARS = int(os.environ.get("TCO_YEARS", "10"))
 
 # ----------------------------------------------------------------------------#
 #                               --- Logging ---                               #
 # ----------------------------------------------------------------------------#
-[add_log_stream(logger) for logger in topshelfsoftware_aws_util.get_package_loggers()]
+# topshelfsoftware_aws_util (and boto3) are imported on first use of the s3 client
 [add_log_stream(logger) for logger in topshelfsoftware_util.get_package_loggers()]
@@ -1,25 +1,53 @@
-from botocore.exceptions import ClientError as BotoClientError
-import pandas as pd
+from collections import OrderedDict
+import copy
+import json
+import os
 
-from topshelfsoftware_aws_util.client import create_boto3_client
+from observability.profiling import profile_handler
+from observability.tracing import current_span, trace_handler
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.io import cdtmp
 from topshelfsoftware_util.log import get_logger
 
-from .communities import (
-    compile_top_communities, filter_communities,
-    rank_communities, score_communities
-)
-from .excel import read_excel_sheet
+from .diversity import mmr_select
 from .exceptions import UnprocessableContentError
+from .facets import facet_counts
+from .metrics import NULL_TIMER, StageTimer
+from .pagination import decode_cursor, encode_cursor
+from .pareto import objective_costs, pareto_fronts
+from .profiles import (
+    canonical_profile, load_packaged_profiles, profile_hash, read_frequency_table
+)
+from .relaxation import suggest_relaxations
+from .store import (
+    SORT_KEYS, CommunityStore, compile_communities, compile_fronts, compile_page,
+    compile_top_communities
+)
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
 from .__init__ import (
-    MODULE_NAME, COMMUNITY_DATA_BUCKET_NAME, COMMUNITY_DATA_OBJECT_NAME
+    MODULE_NAME, COMMUNITY_DATA_BUCKET_NAME, COMMUNITY_DATA_OBJECT_NAME,
+    STAGE_METRICS, WARMUP_PROFILES_OBJECT_NAME, WARMUP_N_PROFILES, PAGE_SIZE,
+    RANKING_CACHE_SIZE, PARETO_N_FRONTS, PARETO_MAX_FRONT_SIZE, DIVERSITY_WEIGHT,
+    TCO_YEARS
 )
-from .communities import PRIMARY_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS
-s3_client = create_boto3_client("s3")
+from .columns import PRIMARY_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS
+s3_client = None  # created on first use, see get_s3_client
+# community store of the most recently loaded dataset, reused by warm invocations
+store_cache = {
+    "dataset_version": None,
+    "store": None
+}
+# rankings precomputed by the warm-up for popular profiles (by profile hash),
+# only valid for the dataset version they were computed on
+result_cache = {
+    "dataset_version": None,
+    "results": {}
+}
+# ranked rows and scores of recently paginated profiles, by (dataset version,
+# profile hash or ordering key, see `ordering_key`), least recently used first
+ranking_cache = OrderedDict()
 
 # ----------------------------------------------------------------------------#
 #                               --- Logging ---                               #
@@ -29,57 +57,472 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("RankCommunities", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
+    if event.get("warmup", False):
+        return warm_up(event)
     hb_needs: dict = event["needs"]
     hb_wants: dict = event["wants"]
+    # stage timings are returned to the caller on request
+    timings: bool = event.get("timings", False)
+    # score contribution of each feature of the returned communities
+    explain: bool = event.get("explain", False)
+    # order of the returned communities other than by score
+    sort_by: dict = resolve_sort(event.get("sort_by"))
+    timer = StageTimer(enabled=STAGE_METRICS or timings)
 
-    with cdtmp():
-        if "excel_file" in event:
-            xlsx_fn = event["excel_file"]
-        else:
-            xlsx_fn = COMMUNITY_DATA_OBJECT_NAME
-            try:
-                logger.info(f"downloading s3 obj {COMMUNITY_DATA_OBJECT_NAME} " \
-                            f"from bucket {COMMUNITY_DATA_BUCKET_NAME}")
-                s3_client.download_file(COMMUNITY_DATA_BUCKET_NAME,
-                                        COMMUNITY_DATA_OBJECT_NAME,
-                                        xlsx_fn)
-            except BotoClientError as e:
-                logger.error(e)
-                raise e
-        
-        # read excel sheets into memory
-        df_needs = read_excel_sheet(xlsx_fn, SHEET_NAME_NEEDS, PRIMARY_KEY)
-        df_wants = read_excel_sheet(xlsx_fn, SHEET_NAME_WANTS, PRIMARY_KEY)
+    store = load_community_store(event.get("excel_file"), timer)
+    dataset_version = store_cache["dataset_version"]
+    current_span().set_attribute("dataset_version", dataset_version)
+    timer.set_property("dataset_version", dataset_version)
 
     response = {
         "email_address": event["email_address"]
     }
+    try:
+        if "what_if" in event:
+            # rank the base profile changed by the delta
+            hb_needs, hb_wants = apply_what_if(store, hb_needs, hb_wants, event["what_if"], timer)
+        # the canonical profile is logged so popular profiles can be counted
+        # from the spans (tools/profile_frequency.py)
+        hb_profile_hash = profile_hash(hb_needs, hb_wants)
+        current_span().set_attribute("profile_hash", hb_profile_hash)
+        current_span().set_attribute("profile", canonical_profile(hb_needs, hb_wants))
+        if event.get("facets", False):
+            # communities each choice of a need would leave, for the filter UI
+            with timer.stage("facets"):
+                response["facets"] = facet_counts(store, hb_needs)
+
+        if "compare" in event:
+            response.update(compare_communities(store, hb_needs, hb_wants, hb_profile_hash,
+                                                event["compare"], explain, timer))
+        elif "pareto" in event:
+            response.update(rank_pareto(store, hb_needs, hb_wants, hb_profile_hash,
+                                        event["pareto"], explain, timer))
+        elif "diversity" in event:
+            response.update(rank_diverse(store, hb_needs, hb_wants, hb_profile_hash,
+                                         event["diversity"], explain, timer))
+        elif "page_size" in event or "cursor" in event:
+            response.update(rank_page(store, hb_needs, hb_wants, hb_profile_hash,
+                                      event.get("cursor"), event.get("page_size"),
+                                      explain, timer, sort_by))
+        elif sort_by is not None:
+            response.update(rank_store(store, hb_needs, hb_wants, explain, timer,
+                                       ranked=sort_rows(store, hb_needs, hb_wants,
+                                                        hb_profile_hash, sort_by, timer),
+                                       sort_by=sort_by))
+        elif "what_if" in event:
+            response.update(rank_store(store, hb_needs, hb_wants, explain, timer,
+                                       ranked=get_cached_ranking(hb_profile_hash)))
+        else:
+            # precomputed rankings hold no explanations
+            cached = None if explain else get_cached_result(dataset_version, hb_profile_hash)
+            timer.set_property("result_cache", "miss" if cached is None else "hit")
+            response.update(cached or rank_store(store, hb_needs, hb_wants, explain, timer))
+    except UnprocessableContentError as e:
+        # the facets show which choices would leave communities
+        if "facets" in response and e.details is not None:
+            e.details["facets"] = response["facets"]
+        raise
+    finally:
+        timer.emit()
+    if sort_by is not None:
+        response["sort_by"] = sort_by
+    if timings:
+        response["timings"] = timer.as_dict()
+    logger.info(fmt_json(response))
+
+    return response
+
+
+def rank_store(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+               explain: bool = False, timer: StageTimer = NULL_TIMER,
+               ranked: tuple = None, sort_by: dict = None) -> dict:
+    """Filter, score and rank the communities of the store for a profile,
+    unless its `ranked` (or `sort_by` ordered) rows are already known, and
+    compile the top communities (explaining their scores if `explain`)."""
+    ranking, rows, scores = ranked or rank_rows(store, hb_needs, hb_wants, timer)
+    ranking = dict(ranking)
+
+    # get the top 3 communities (at most)
+    with timer.stage("compile"):
+        ranking["top_communities"] = compile_top_communities(
+            store, rows, scores, n=3, hb_wants=hb_wants if explain else None,
+            cost_years=cost_horizon(hb_needs, sort_by)
+        )
+    return ranking
+
+
+def rank_page(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+              hb_profile_hash: str, cursor: str = None, page_size: int = None,
+              explain: bool = False, timer: StageTimer = NULL_TIMER,
+              sort_by: dict = None) -> dict:
+    """Page of the ranked (or `sort_by` ordered) communities of a profile,
+    from the start or from the position of a cursor, and the cursor of the
+    next page (None on the last page). Later pages slice the cached order."""
+    dataset_version = store_cache["dataset_version"]
+    key = ordering_key(hb_profile_hash, sort_by)
+    offset = 0
+    if cursor is not None:
+        offset, cursor_page_size = decode_cursor(cursor, dataset_version, key)
+        page_size = page_size or cursor_page_size
+    page_size = page_size or PAGE_SIZE
+
+    if sort_by is not None:
+        ranked = sort_rows(store, hb_needs, hb_wants, hb_profile_hash, sort_by, timer)
+    else:
+        ranked = get_cached_ranking(hb_profile_hash)
+        timer.set_property("ranking_cache", "miss" if ranked is None else "hit")
+        if ranked is None:
+            ranked = rank_rows(store, hb_needs, hb_wants, timer)
+            cache_ranking(hb_profile_hash, ranked)
+    counts, rows, scores = ranked
+
+    with timer.stage("compile"):
+        page = compile_page(store, rows, scores, offset, page_size,
+                            hb_wants=hb_wants if explain else None,
+                            cost_years=cost_horizon(hb_needs, sort_by))
+    next_offset = offset + page_size
+    return {
+        **counts,
+        "communities": page,
+        "next_cursor": encode_cursor(dataset_version, key, next_offset, page_size)
+                       if next_offset < len(rows) else None
+    }
+
+
+def apply_what_if(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+                  what_if: dict, timer: StageTimer = NULL_TIMER) -> tuple[dict, dict]:
+    """Needs and wants of the base profile changed by a what-if delta
+    ({"needs": {...}, "wants": {...}}), with the ranked order of the changed
+    profile cached. A change of wants only updates the scores of the base
+    profile's ranked communities by the changed features; a change of needs
+    filters and scores again."""
+    new_needs = {**hb_needs, **what_if.get("needs", {})}
+    new_wants = {**hb_wants, **what_if.get("wants", {})}
+    new_hash = profile_hash(new_needs, new_wants)
+    if get_cached_ranking(new_hash) is not None:
+        timer.set_property("ranking_cache", "hit")
+        return new_needs, new_wants
+
+    if canonical_profile(new_needs, {}) != canonical_profile(hb_needs, {}):
+        timer.set_property("ranking_cache", "miss")
+        ranked = rank_rows(store, new_needs, new_wants, timer)
+    else:
+        base_hash = profile_hash(hb_needs, hb_wants)
+        base = get_cached_ranking(base_hash)
+        timer.set_property("ranking_cache", "miss" if base is None else "hit")
+        if base is None:
+            base = rank_rows(store, hb_needs, hb_wants, timer)
+            cache_ranking(base_hash, base)
+        counts, rows, scores = base
+        with timer.stage("rescore"):
+            rows, scores = store.rescore(rows, scores, hb_wants, new_wants)
+        with timer.stage("rank"):
+            rows, scores = store.rank(rows, scores)
+        ranked = (counts, rows, scores)
+    cache_ranking(new_hash, ranked)
+    return new_needs, new_wants
+
+
+def compare_communities(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+                        hb_profile_hash: str, names: list, explain: bool = False,
+                        timer: StageTimer = NULL_TIMER) -> dict:
+    """Key information, score and rank among the communities meeting the
+    needs of the named communities, in the order named, found by the primary
+    key index. Ranks are counted from the scores of the filtered communities
+    (those of the profile's cached ranking if any), without sorting them.
+    Communities not meeting the needs are still scored but get no rank."""
+    rows = store.lookup(names)
+    ranked = get_cached_ranking(hb_profile_hash)
+    timer.set_property("ranking_cache", "miss" if ranked is None else "hit")
+    if ranked is not None:
+        counts, filtered, scores = ranked
+    else:
+        with timer.stage("filter"):
+            filtered = store.filter(hb_needs)
+        with timer.stage("score"):
+            scores = store.score(hb_wants, filtered)
+        counts = {"n_communities_total": len(store), "n_communities_filtered": len(filtered)}
+
+    found = [row for row in rows if row is not None]
+    with timer.stage("compare"):
+        found, found_scores, ranks = store.rank_of(found, filtered, scores, hb_wants)
+    with timer.stage("compile"):
+        communities = compile_communities(store, found, found_scores, ranks,
+                                          hb_wants=hb_wants if explain else None,
+                                          cost_years=cost_horizon(hb_needs))
+    return {
+        **counts,
+        "communities": communities,
+        "not_found": [name for name,row in zip(names, rows) if row is None]
+    }
+
+
+def rank_pareto(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+                hb_profile_hash: str, pareto: dict, explain: bool = False,
+                timer: StageTimer = NULL_TIMER) -> dict:
+    """Layered Pareto fronts of the communities meeting the needs over the
+    objectives of `pareto` ({"objectives": [...], "n_fronts": n}), each
+    ordered by score."""
+    ranked = get_cached_ranking(hb_profile_hash)
+    timer.set_property("ranking_cache", "miss" if ranked is None else "hit")
+    counts, rows, scores = ranked or rank_rows(store, hb_needs, hb_wants, timer)
+    with timer.stage("pareto"):
+        costs = objective_costs(store, rows, scores, pareto["objectives"])
+        fronts = pareto_fronts(costs, pareto.get("n_fronts", PARETO_N_FRONTS))
+    with timer.stage("compile"):
+        compiled = compile_fronts(store, rows, scores, fronts, PARETO_MAX_FRONT_SIZE,
+                                  hb_wants=hb_wants if explain else None,
+                                  cost_years=cost_horizon(hb_needs))
+    return {**counts, "objectives": pareto["objectives"], "pareto_fronts": compiled}
+
+
+def rank_diverse(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+                 hb_profile_hash: str, diversity: dict, explain: bool = False,
+                 timer: StageTimer = NULL_TIMER) -> dict:
+    """Top communities picked for both score and diversity (see `mmr_select`)
+    by the settings of `diversity` ({"weight": w, "k": k})."""
+    ranked = get_cached_ranking(hb_profile_hash)
+    timer.set_property("ranking_cache", "miss" if ranked is None else "hit")
+    counts, rows, scores = ranked or rank_rows(store, hb_needs, hb_wants, timer)
+    k = diversity.get("k", 3)
+    with timer.stage("diversify"):
+        picked = mmr_select(store, rows, scores, k,
+                            diversity.get("weight", DIVERSITY_WEIGHT))
+    with timer.stage("compile"):
+        top_communities = compile_top_communities(store, rows[picked], scores[picked], n=k,
+                                                  hb_wants=hb_wants if explain else None,
+                                                  cost_years=cost_horizon(hb_needs))
+    return {**counts, "top_communities": top_communities}
+
+
+def resolve_sort(sort_by: dict = None) -> dict:
+    """Sort option of a request ({"key": ..., "order": ...}) with the default
+    order of its key filled in, or None to rank by score."""
+    if sort_by is None:
+        return None
+    return {"key": sort_by["key"], "order": sort_by.get("order", SORT_KEYS[sort_by["key"]][1])}
+
+
+def cost_horizon(hb_needs: dict, sort_by: dict = None) -> int:
+    """Horizon (years) of the total cost of ownership returned with the
+    communities, if the needs set a budget or horizon or the communities are
+    sorted by total cost, else None."""
+    if "max_total_cost" in hb_needs or "total_cost_years" in hb_needs \
+            or (sort_by is not None and sort_by["key"] == "total_cost"):
+        return hb_needs.get("total_cost_years", TCO_YEARS)
+    return None
+
+
+def ordering_key(hb_profile_hash: str, sort_by: dict = None) -> str:
+    """Key of the order of a profile's communities in the ranking cache and
+    in cursors: the profile hash, qualified by the sort option if any."""
+    if sort_by is None:
+        return hb_profile_hash
+    return f"{hb_profile_hash}:{sort_by['key']}:{sort_by['order']}"
+
+
+def sort_rows(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+              hb_profile_hash: str, sort_by: dict,
+              timer: StageTimer = NULL_TIMER) -> tuple:
+    """Community counts and the rows and scores of a profile ordered by the
+    `sort_by` column, cached. The filtered and scored communities (from the
+    profile's cached ranking if any) are read off the store's presorted index."""
+    key = ordering_key(hb_profile_hash, sort_by)
+    ordered = get_cached_ranking(key)
+    timer.set_property("ranking_cache", "miss" if ordered is None else "hit")
+    if ordered is None:
+        counts, rows, scores = get_cached_ranking(hb_profile_hash) \
+                               or rank_rows(store, hb_needs, hb_wants, timer, rank=False)
+        with timer.stage("sort"):
+            rows, scores = store.sort(rows, scores, sort_by["key"], sort_by["order"],
+                                      hb_needs.get("total_cost_years", TCO_YEARS))
+        ordered = (counts, rows, scores)
+        cache_ranking(key, ordered)
+    return ordered
+
+
+def rank_rows(store: CommunityStore, hb_needs: dict, hb_wants: dict,
+              timer: StageTimer = NULL_TIMER, rank: bool = True) -> tuple:
+    """Community counts and the ranked rows and scores of a profile (in store
+    order unless `rank`). Raises UnprocessableContentError if the needs filter
+    out every community."""
+    ranking = {}
 
     # filter communties by needs
-    df_needs = filter_communities(df_needs, hb_needs)
-    n_communities_total = len(df_wants.index)
-    n_communities_filtered = len(df_needs.index)
-    response["n_communities_total"] = n_communities_total
-    response["n_communities_filtered"] = n_communities_filtered
+    with timer.stage("filter"):
+        rows = store.filter(hb_needs)
+    n_communities_total = len(store)
+    n_communities_filtered = len(rows)
+    ranking["n_communities_total"] = n_communities_total
+    ranking["n_communities_filtered"] = n_communities_filtered
     if n_communities_filtered == 0:
         # payload has filtered out all communities so
         # the client (CPU) should modify the request
         err_msg = "All communities have been filtered out leaving none to rank. " \
                   "Modify homebuyer needs in request payload."
         logger.error(err_msg)
-        raise UnprocessableContentError(err_msg)
+        # suggest the changes of needs that would leave communities to rank
+        with timer.stage("relax"):
+            relaxations = suggest_relaxations(store, hb_needs)
+        raise UnprocessableContentError(err_msg, {"relaxations": relaxations})
 
-    # score communities by wants
-    df_wants = score_communities(df_wants, hb_wants)
+    # score the remaining communities by wants and sort scores to rank
+    with timer.stage("score"):
+        scores = store.score(hb_wants, rows)
+    if rank:
+        with timer.stage("rank"):
+            rows, scores = store.rank(rows, scores)
+    return ranking, rows, scores
 
-    # apply filter and sort scores to rank
-    df = pd.merge(df_needs, df_wants, left_index=True, right_index=True)
-    df = rank_communities(df)
 
-    # get the top 3 communities (at most)
-    response["top_communities"] = compile_top_communities(df, n=3)
-    logger.info(fmt_json(response))
+def warm_up(event: dict) -> dict:
+    """Load the latest dataset into the community store and precompute the
+    rankings of the most popular profiles, so the first requests after a
+    dataset is published take the warm path."""
+    timer = StageTimer(enabled=STAGE_METRICS)
+    store = load_community_store(event.get("excel_file"), timer)
+    dataset_version = store_cache["dataset_version"]
+    current_span().set_attribute("dataset_version", dataset_version)
+    published_version = event.get("s3_version_id")
+    if published_version is not None and published_version != dataset_version:
+        logger.warning(f"published dataset version {published_version} is not the latest, " \
+                       f"warming up version {dataset_version}")
 
-    return response
+    profiles, source = load_warmup_profiles()
+    results = {}
+    with timer.stage("warmup"):
+        for profile in profiles[:WARMUP_N_PROFILES]:
+            try:
+                results[profile_hash(profile["needs"], profile["wants"])] = \
+                    rank_store(store, profile["needs"], profile["wants"])
+            except UnprocessableContentError:
+                continue  # nothing to cache for a profile that ranks no community
+    result_cache["dataset_version"] = dataset_version
+    result_cache["results"] = results
+    timer.emit()
+
+    summary = {
+        "dataset_version": dataset_version,
+        "profiles_source": source,
+        "n_profiles": min(len(profiles), WARMUP_N_PROFILES),
+        "n_cached": len(results),
+    }
+    logger.info(f"warm-up: {fmt_json(summary)}")
+    return summary
+
+
+def get_cached_ranking(hb_profile_hash: str) -> tuple:
+    """Cached ranked order (see `rank_rows`) of a profile on the current
+    dataset version, None if not cached."""
+    key = (store_cache["dataset_version"], hb_profile_hash)
+    ranked = ranking_cache.get(key)
+    if ranked is not None:
+        ranking_cache.move_to_end(key)
+    return ranked
+
+
+def cache_ranking(hb_profile_hash: str, ranked: tuple):
+    """Cache the ranked order of a profile on the current dataset version,
+    evicting the least recently used beyond `RANKING_CACHE_SIZE`."""
+    ranking_cache[(store_cache["dataset_version"], hb_profile_hash)] = ranked
+    while len(ranking_cache) > RANKING_CACHE_SIZE:
+        ranking_cache.popitem(last=False)
+
+
+def get_cached_result(dataset_version: str, hb_profile_hash: str) -> dict:
+    """Precomputed ranking of a profile on the dataset version, None if the
+    warm-up did not compute it."""
+    if result_cache["dataset_version"] != dataset_version:
+        return None
+    cached = result_cache["results"].get(hb_profile_hash)
+    return copy.deepcopy(cached) if cached is not None else None
+
+
+def load_warmup_profiles() -> tuple[list[dict], str]:
+    """Popular profiles, most frequent first, and where they came from: the
+    frequency table in the community bucket if configured and present, else
+    the list packaged with the Lambda."""
+    if WARMUP_PROFILES_OBJECT_NAME:
+        from botocore.exceptions import ClientError as BotoClientError
+        try:
+            obj = get_s3_client().get_object(Bucket=COMMUNITY_DATA_BUCKET_NAME,
+                                             Key=WARMUP_PROFILES_OBJECT_NAME)
+            table = json.loads(obj["Body"].read())
+            return read_frequency_table(table), f"s3://{COMMUNITY_DATA_BUCKET_NAME}/" \
+                                                f"{WARMUP_PROFILES_OBJECT_NAME}"
+        except BotoClientError as e:
+            logger.warning(f"frequency table unavailable, using the packaged profiles: {e}")
+    return load_packaged_profiles(), "packaged"
+
+
+def load_community_store(excel_file: str = None,
+                         timer: StageTimer = NULL_TIMER) -> CommunityStore:
+    """Load the community dataset into a `CommunityStore`. The store is kept
+    between invocations and only rebuilt when the dataset version changes."""
+    with cdtmp():
+        if excel_file is not None:
+            xlsx_fn = excel_file
+            dataset_version = f"{os.path.abspath(xlsx_fn)}@{os.path.getmtime(xlsx_fn)}"
+            download_args = None
+        else:
+            # botocore is only imported with the s3 client (see get_s3_client)
+            from botocore.exceptions import ClientError as BotoClientError
+            xlsx_fn = COMMUNITY_DATA_OBJECT_NAME
+            try:
+                head = get_s3_client().head_object(Bucket=COMMUNITY_DATA_BUCKET_NAME,
+                                                   Key=COMMUNITY_DATA_OBJECT_NAME)
+            except BotoClientError as e:
+                logger.error(e)
+                raise e
+            version_id = head.get("VersionId")
+            dataset_version = version_id or head["ETag"].strip('"')
+            # pin the download to the version the cache is keyed on
+            download_args = {"VersionId": version_id} if version_id else None
+
+        if store_cache["dataset_version"] == dataset_version:
+            logger.info(f"reusing community store of dataset version {dataset_version}")
+            timer.set_property("dataset_cache", "hit")
+            return store_cache["store"]
+        timer.set_property("dataset_cache", "miss")
+
+        if excel_file is None:
+            try:
+                logger.info(f"downloading s3 obj {COMMUNITY_DATA_OBJECT_NAME} " \
+                            f"from bucket {COMMUNITY_DATA_BUCKET_NAME}")
+                with timer.stage("s3_download"):
+                    get_s3_client().download_file(COMMUNITY_DATA_BUCKET_NAME,
+                                                  COMMUNITY_DATA_OBJECT_NAME,
+                                                  xlsx_fn,
+                                                  ExtraArgs=download_args)
+            except BotoClientError as e:
+                logger.error(e)
+                raise e
+
+        # read excel sheets into memory (pandas is only needed to ingest the data)
+        from .excel import optimize_dtypes, read_excel_sheet
+        with timer.stage("read_sheet_needs"):
+            df_needs = optimize_dtypes(read_excel_sheet(xlsx_fn, SHEET_NAME_NEEDS, PRIMARY_KEY))
+        with timer.stage("read_sheet_wants"):
+            df_wants = optimize_dtypes(read_excel_sheet(xlsx_fn, SHEET_NAME_WANTS, PRIMARY_KEY))
+
+    store = CommunityStore.from_frames(df_needs, df_wants, timer)
+    store_cache["dataset_version"] = dataset_version
+    store_cache["store"] = store
+    return store
+
+
+def get_s3_client():
+    """Create the s3 client on first use. Importing boto3 is a large share of the
+    cold start and is not needed when the community data is read locally."""
+    global s3_client
+    if s3_client is None:
+        import topshelfsoftware_aws_util
+        from topshelfsoftware_aws_util.client import create_boto3_client
+        from topshelfsoftware_util.log import add_log_stream
+        [add_log_stream(logger) for logger in topshelfsoftware_aws_util.get_package_loggers()]
+        s3_client = create_boto3_client("s3")
+    return s3_client
@@ -0,0 +1,76 @@
+"""Column names of the community spreadsheet and related constants. Kept free
+of heavy imports so any module can use them."""
+
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PRIMARY_KEY = "Community Name"
+
+# homebuyer needs
+SHEET_NAME_NEEDS = "Sheet1"
+CITY_KEY = "City"
+LOC_KEY = "Location"
+PRICE_AVG_KEY = "Average Single Family Home Price (90 Days)"
+PRICE_LOW_KEY = "Price Range Low"
+PRICE_HIGH_KEY = "Price Range High"
+HOA_KEY = "HOA/Rec Fee - 2 People Annual Total"
+HOME_TOT_KEY = "Total Homes in community"
+HOME_AGE_KEY = "Average Age of Home"
+PRES_KEY = "Preservation Fee"
+LINK_KEY = "Links"
+HEADERS_NEEDS = [
+    CITY_KEY, LOC_KEY, PRICE_AVG_KEY, PRICE_LOW_KEY, PRICE_HIGH_KEY,
+    HOA_KEY, HOME_TOT_KEY, HOME_AGE_KEY, PRES_KEY, LINK_KEY
+]
+SIZE_KEY = "Size of Community"
+
+# homebuyer wants
+SHEET_NAME_WANTS = "Sheet2"
+MAX_PREFERENCE = MAX_RATING = 5
+MIN_PREFERENCE = MIN_RATING = 1
+N_GOLF_COURSE_KEY = "# of Golf Courses"
+N_CLUBS_KEY = "# of Clubs Offered"
+N_REC_CENTER_KEY = "# of Rec Centers"
+GOLF_COURSE_QLTY_KEY = "Golf Course Quality"
+TRAILS_QLTY_KEY = "Walking/Biking Trails"
+FISH_KEY = "Fishing in Community"
+DOG_PARK_KEY = "Dog Park?"
+GATE_KEY = "Gated?"
+POOL_KEY = "Indoor + Outdoor Pool"
+WOODWORK_KEY = "Woodwork Shop?"
+MTN_VIEW_KEY = "Nearby Mountain Views?"
+SOFTBALL_KEY = "Softball Field?"
+ISOLATED_KEY = "Isolated From Rest of City"
+PICKLEBALL_KEY = "Competitive Pickleball?"
+HEADERS_WANTS = [
+    N_GOLF_COURSE_KEY, N_CLUBS_KEY, N_REC_CENTER_KEY, GOLF_COURSE_QLTY_KEY,
+    TRAILS_QLTY_KEY, FISH_KEY, DOG_PARK_KEY, GATE_KEY, POOL_KEY, WOODWORK_KEY,
+    MTN_VIEW_KEY, SOFTBALL_KEY, ISOLATED_KEY, PICKLEBALL_KEY
+]
+SCORE_KEY = "Homebuyer Score"
+
+# community features scored by homebuyer wants (in scoring order)
+YES_NO_FEATURES = [
+    GATE_KEY, MTN_VIEW_KEY, SOFTBALL_KEY, ISOLATED_KEY,
+    FISH_KEY, WOODWORK_KEY, POOL_KEY, DOG_PARK_KEY
+]
+FEATURE_PREFERENCES = {
+    GATE_KEY: "gated",
+    MTN_VIEW_KEY: "mountain_views",
+    SOFTBALL_KEY: "softball_field",
+    ISOLATED_KEY: "isolated_from_city",
+    FISH_KEY: "fishing",
+    WOODWORK_KEY: "woodwork_shop",
+    POOL_KEY: "indoor_pool",
+    DOG_PARK_KEY: "dog_park",
+    PICKLEBALL_KEY: "competitive_pickleball",
+    GOLF_COURSE_QLTY_KEY: "quality_golf_courses",
+    TRAILS_QLTY_KEY: "quality_trails",
+    N_GOLF_COURSE_KEY: "mult_golf_courses",
+    N_CLUBS_KEY: "many_social_clubs",
+}
+FEATURE_KEYS = list(FEATURE_PREFERENCES.keys())
+
+# memory-lean dtypes applied at load time (see `optimize_dtypes`)
+CATEGORICAL_KEYS = YES_NO_FEATURES + [GOLF_COURSE_QLTY_KEY, TRAILS_QLTY_KEY, LOC_KEY]
+INTERNED_KEYS = [CITY_KEY]
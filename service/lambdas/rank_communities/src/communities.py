@@ -1,6 +1,6 @@
-from enum import Enum
+import numbers
+import re
 from statistics import fmean
-from typing import Callable
 
 import numpy as np
 import pandas as pd
@@ -9,55 +9,27 @@ from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
 
 from .enum_needs import Filter, Price, Location, Size
-from .enum_wants import HasFeature, GolfCourseQuality, TrailsQuality
+from .enum_wants import (
+    HasFeature, GOLF_COURSE_QLTY_CODES, TRAILS_QLTY_CODES, quality_key
+)
+from .scoring import (
+    encode_locations, feature_contributions, feature_preferences, size_codes,
+    sum_contributions, total_costs
+)
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
-from .__init__ import MODULE_NAME
-PRIMARY_KEY = "Community Name"
-
-# homebuyer needs
-SHEET_NAME_NEEDS = "Sheet1"
-CITY_KEY = "City"
-LOC_KEY = "Location"
-PRICE_AVG_KEY = "Average Single Family Home Price (90 Days)"
-PRICE_LOW_KEY = "Price Range Low"
-PRICE_HIGH_KEY = "Price Range High"
-HOA_KEY = "HOA/Rec Fee - 2 People Annual Total"
-HOME_TOT_KEY = "Total Homes in community"
-HOME_AGE_KEY = "Average Age of Home"
-PRES_KEY = "Preservation Fee"
-LINK_KEY = "Links"
-HEADERS_NEEDS = [
-    CITY_KEY, LOC_KEY, PRICE_AVG_KEY, PRICE_LOW_KEY, PRICE_HIGH_KEY,
-    HOA_KEY, HOME_TOT_KEY, HOME_AGE_KEY, PRES_KEY, LINK_KEY
-]
-SIZE_KEY = "Size of Community"
-
-# homebuyer wants
-SHEET_NAME_WANTS = "Sheet2"
-MAX_PREFERENCE = MAX_RATING = 5
-MIN_PREFERENCE = MIN_RATING = 1
-N_GOLF_COURSE_KEY = "# of Golf Courses"
-N_CLUBS_KEY = "# of Clubs Offered"
-N_REC_CENTER_KEY = "# of Rec Centers"
-GOLF_COURSE_QLTY_KEY = "Golf Course Quality"
-TRAILS_QLTY_KEY = "Walking/Biking Trails"
-FISH_KEY = "Fishing in Community"
-DOG_PARK_KEY = "Dog Park?"
-GATE_KEY = "Gated?"
-POOL_KEY = "Indoor + Outdoor Pool"
-WOODWORK_KEY = "Woodwork Shop?"
-MTN_VIEW_KEY = "Nearby Mountain Views?"
-SOFTBALL_KEY = "Softball Field?"
-ISOLATED_KEY = "Isolated From Rest of City"
-PICKLEBALL_KEY = "Competitive Pickleball?"
-HEADERS_WANTS = [
-    N_GOLF_COURSE_KEY, N_CLUBS_KEY, N_REC_CENTER_KEY, GOLF_COURSE_QLTY_KEY,
-    TRAILS_QLTY_KEY, FISH_KEY, DOG_PARK_KEY, GATE_KEY, POOL_KEY, WOODWORK_KEY,
-    MTN_VIEW_KEY, SOFTBALL_KEY, ISOLATED_KEY, PICKLEBALL_KEY
-]
-SCORE_KEY = "Homebuyer Score"
+from .__init__ import MODULE_NAME, TCO_YEARS
+from .columns import (
+    CITY_KEY, DOG_PARK_KEY, FEATURE_KEYS, FISH_KEY, GATE_KEY,
+    GOLF_COURSE_QLTY_KEY, HOA_KEY, HOME_AGE_KEY, HOME_TOT_KEY, ISOLATED_KEY,
+    LINK_KEY, LOC_KEY, MAX_RATING, MIN_RATING, MTN_VIEW_KEY, N_CLUBS_KEY,
+    N_GOLF_COURSE_KEY, N_REC_CENTER_KEY, PICKLEBALL_KEY, POOL_KEY, PRES_KEY,
+    PRICE_AVG_KEY, PRICE_HIGH_KEY, PRICE_LOW_KEY, SCORE_KEY, SIZE_KEY,
+    SOFTBALL_KEY, TRAILS_QLTY_KEY, WOODWORK_KEY, YES_NO_FEATURES
+)
+PERCENTAGE_PATTERN = re.compile(r"(\d*\.?\d+)\s*%")
+PERCENTAGE_OF_PATTERN = re.compile(r"\s*of\s*", re.IGNORECASE)  # joins a rate of a rate
 
 # ----------------------------------------------------------------------------#
 #                               --- Logging ---                               #
@@ -108,6 +80,13 @@ def filter_communities(df: pd.DataFrame, hb_needs: dict) -> pd.DataFrame:
             (df[PRICE_LOW_KEY].isin(range(price_range_lower, price_range_upper+1))) | \
             (df[PRICE_HIGH_KEY].isin(range(price_range_lower, price_range_upper+1)))]
     df = df[df[HOME_AGE_KEY] > year_built]
+    if "max_total_cost" in hb_needs:
+        years = hb_needs.get("total_cost_years", TCO_YEARS)
+        cost = total_costs(df[PRICE_AVG_KEY].to_numpy(dtype=float),
+                           df[HOA_KEY].to_numpy(dtype=float),
+                           preservation_fees(df[PRES_KEY], df[PRICE_AVG_KEY].to_numpy(dtype=float)),
+                           years)
+        df = df[cost <= hb_needs["max_total_cost"]]
     logger.debug(df.to_string())
 
     return df
@@ -117,131 +96,104 @@ def score_communities(df: pd.DataFrame, hb_wants: dict) -> pd.DataFrame:
     """Score communities by homebuyer wants."""
     logger.info(f"Scoring communities using homebuyer wants:\n" \
                 f"{fmt_json(hb_wants)}")
-    
-    def calc_score(multiplier: float, preference: int):
-        """Calculate a score given a multiplier and a homebuyer preference."""
-        return multiplier*(preference-MIN_PREFERENCE)/(MAX_PREFERENCE-MIN_PREFERENCE)
-
-    def score_feature_yes_no(community: str, score: float, feature_present: str, **kwargs) -> float:
-        """Score a feature that is either present or not in a community."""
-        preference = int(kwargs["preference"])
-        if pd.isnull(feature_present):
-            new_score = score
-        else:
-            mult = 1 if HasFeature.YES.value in feature_present else 0
-            new_score = score + calc_score(mult, preference)
-        logger.debug(f"community: {community:25} | " \
-                     f"new_score: {new_score:.2f} | " \
-                     f"feature_present: {feature_present:8} | " \
-                     f"preference: {preference}")
-        return new_score
-
-    def score_competition(community: str, score: float, competition: int, **kwargs) -> float:
-        """Score a feature based on its competition rating."""
-        preference = int(kwargs["preference"])
-        if pd.isnull(competition):
-            new_score = score
-        else:
-            mult = (competition-MIN_RATING)/(MAX_RATING-MIN_RATING)
-            new_score = score + calc_score(mult, preference)
-        logger.debug(f"community: {community:25} | " \
-                     f"new_score: {new_score:.2f} | " \
-                     f"competition: {competition} | " \
-                     f"preference: {preference}")
-        return new_score
-
-    def score_quality(community: str, score: float, quality: str, **kwargs) -> float:
-        """Score a feature based on its quality rating."""
-        preference = int(kwargs["preference"])
-        quality_enum: Enum = kwargs["quality_enum"]
-        if pd.isnull(quality):
-            new_score = score
-        else:
-            for i,q in enumerate(quality_enum):
-                # q is a string option of an Enum so use q.value to get the string repr
-                if q.value.replace(" ", "") in quality.replace(" ", "").upper():
-                    mult = i/(len(quality_enum)-1)
-                    break
-            new_score = score + calc_score(mult, preference)
-        logger.debug(f"community: {community:25} | " \
-                     f"new_score: {new_score:.2f} | " \
-                     f"quality: {quality:10} | " \
-                     f"preference: {preference}")
-        return new_score
-    
-    def score_number_offerings(community: str, score: float, n_offerings: int, **kwargs) -> float:
-        """Score a feature based on its number of offerings."""
-        preference = int(kwargs["preference"])
-        max_offerings = int(kwargs["max_offerings"])
-        if pd.isnull(n_offerings):
-            new_score = score
-        else:
-            mult = n_offerings/max_offerings
-            new_score = score + calc_score(mult, preference)
-        logger.debug(f"community: {community:25} | " \
-                     f"new_score: {new_score:.2f} | " \
-                     f"n_offerings: {n_offerings} | " \
-                     f"preference: {preference}")
-        return new_score
-
-    def apply_score_func(df: pd.DataFrame, scoring_func: Callable, feature: str, **kwargs) -> pd.Series:
-        """Generic function to apply a supplied scoring function to an entire DataFrame column."""
-        logger.debug(feature)
-        score_series = df.apply(lambda x: scoring_func(x.name, x[SCORE_KEY], x[feature], **kwargs), axis=1)
-        return score_series
 
     # further clean the column data
+    df = clean_offerings(df)
+
+    mults = feature_multipliers(df)
+    prefs = feature_preferences(hb_wants)
+    df[SCORE_KEY] = sum_contributions(feature_contributions(mults, prefs))
+    logger.debug(df[SCORE_KEY].to_string())
+
+    return df
+
+
+def clean_offerings(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the number of offerings columns to numbers."""
     df[N_GOLF_COURSE_KEY] = pd.to_numeric(df[N_GOLF_COURSE_KEY], errors="coerce", downcast="integer")
     df[N_CLUBS_KEY] = pd.to_numeric(df[N_CLUBS_KEY].astype(str).str.extract(r'(\d+)', expand=False),
                                              errors="coerce",
                                              downcast="integer")  # if any cells are NaN, then column gets upcast to float
+    return df
 
-    community_features = {
-        GATE_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["gated"] }
-        },
-        MTN_VIEW_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["mountain_views"] }
-        },
-        SOFTBALL_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["softball_field"] }
-        },
-        ISOLATED_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["isolated_from_city"] }
-        },
-        FISH_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["fishing"] }
-        },
-        WOODWORK_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["woodwork_shop"] }
-        },
-        POOL_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["indoor_pool"] }
-        },
-        DOG_PARK_KEY: {
-            "func": score_feature_yes_no, "kwargs": { "preference": hb_wants["dog_park"] }
-        },
-        PICKLEBALL_KEY: {
-            "func": score_competition, "kwargs": { "preference": hb_wants["competitive_pickleball"] } 
-        },
-        GOLF_COURSE_QLTY_KEY: {
-            "func": score_quality, "kwargs": { "preference": hb_wants["quality_golf_courses"], "quality_enum": GolfCourseQuality } 
-        },
-        TRAILS_QLTY_KEY: {
-            "func": score_quality, "kwargs": { "preference": hb_wants["quality_trails"], "quality_enum": TrailsQuality } 
-        },
-        N_GOLF_COURSE_KEY: {
-            "func": score_number_offerings, "kwargs": { "preference": hb_wants["mult_golf_courses"], "max_offerings": df[N_GOLF_COURSE_KEY].max() } 
-        },
-        N_CLUBS_KEY: {
-            "func": score_number_offerings, "kwargs": { "preference": hb_wants["many_social_clubs"], "max_offerings": df[N_CLUBS_KEY].max() } 
-        }
-    }
-    df[SCORE_KEY] = np.zeros(len(df.index))  # initialize the community scores
-    for feature,scoring in community_features.items():
-        df[SCORE_KEY] = apply_score_func(df, scoring["func"], feature, **scoring["kwargs"])
 
-    return df
+def feature_multipliers(df: pd.DataFrame) -> np.ndarray:
+    """Compute the multiplier of each community feature scored by homebuyer
+    wants. Returns a matrix with a row per community and a column per feature
+    (in `FEATURE_KEYS` order). Missing features are NaN.
+    
+    The multipliers do not depend on the homebuyer, so they only need to be
+    computed once per dataset."""
+    mults = np.full((len(df.index), len(FEATURE_KEYS)), np.nan)
+    for j,feature in enumerate(FEATURE_KEYS):
+        col: pd.Series = df[feature]
+        if feature in YES_NO_FEATURES:
+            mults[:, j] = _map_values(col, lambda v: float(HasFeature.YES.value in str(v)))
+        elif feature == PICKLEBALL_KEY:
+            competition = pd.to_numeric(col, errors="coerce").astype(float)
+            mults[:, j] = ((competition-MIN_RATING)/(MAX_RATING-MIN_RATING)).to_numpy(dtype=float)
+        elif feature == GOLF_COURSE_QLTY_KEY:
+            mults[:, j] = _quality_multipliers(col, GOLF_COURSE_QLTY_CODES)
+        elif feature == TRAILS_QLTY_KEY:
+            mults[:, j] = _quality_multipliers(col, TRAILS_QLTY_CODES)
+        else:
+            if feature == N_CLUBS_KEY:
+                col = col.astype(str).str.extract(r'(\d+)', expand=False)
+            n_offerings = pd.to_numeric(col, errors="coerce").astype(float)
+            mults[:, j] = (n_offerings/n_offerings.max()).to_numpy(dtype=float)
+    return mults
+
+
+def parse_fee(value) -> tuple[float, float]:
+    """Parse a fee cell into a dollar amount and a rate of the sale price: a
+    number is an amount, a text with a percentage (e.g. '.25% of Sale Price')
+    is a rate, and percentages of percentages (e.g. '.5% of 1% of price') are
+    multiplied into one. Text without either, or with percentages joined any
+    other way, is NaN."""
+    if isinstance(value, numbers.Number):
+        return float(value), 0.0
+    text = str(value)
+    matches = list(PERCENTAGE_PATTERN.finditer(text))
+    if matches:
+        joins = [text[a.end():b.start()] for a,b in zip(matches, matches[1:])]
+        if not all(PERCENTAGE_OF_PATTERN.fullmatch(j) for j in joins):
+            return np.nan, 0.0
+        return 0.0, float(np.prod([float(m.group(1))/100 for m in matches]))
+    try:
+        return float(text.replace("$", "").replace(",", "")), 0.0
+    except ValueError:
+        return np.nan, 0.0
+
+
+def preservation_fees(col: pd.Series, price_avg: np.ndarray) -> np.ndarray:
+    """Preservation fee of every community in dollars, with a rate of the sale
+    price taken of the average home price. Each distinct cell is parsed once
+    (see `parse_fee`). Missing fees are 0."""
+    codes, uniques = pd.factorize(col)
+    parsed = np.array([parse_fee(v) for v in uniques] + [(0.0, 0.0)]).reshape(-1, 2)
+    amount, rate = parsed[codes, 0], parsed[codes, 1]  # missing (code -1) -> no fee
+    return amount + rate*price_avg
+
+
+def location_codes(col: pd.Series) -> np.ndarray:
+    """Encode a location column as bitmasks (see `encode_locations`). A
+    categorical column is encoded once per category."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        lookup = np.append(encode_locations(col.cat.categories), np.uint8(0))
+        return lookup[col.cat.codes.to_numpy()]  # missing (code -1) -> 0
+    return encode_locations(col.to_numpy())
+
+
+def cluster_size_codes(home_total: np.ndarray) -> np.ndarray:
+    """Cluster community sizes (see `_cluster_community_sizes`) into size codes.
+    Communities without a total number of homes get a code of -1."""
+    codes = np.full(len(home_total), -1, dtype=np.int8)
+    valid = np.flatnonzero(~np.isnan(home_total))
+    if len(valid) == 0:
+        return codes
+    order = valid[np.argsort(home_total[valid], kind="stable")]
+    codes[order] = size_codes(_cluster_community_sizes(home_total[order]))
+    return codes
 
 
 def rank_communities(df: pd.DataFrame) -> pd.DataFrame:
@@ -335,3 +287,26 @@ def _cluster_kmeans(data: np.ndarray, centroids: list) \
                 cluster_assignments_changed = True
                 break
     return clusters
+
+
+def _quality_multipliers(col: pd.Series, quality_codes: dict) -> np.ndarray:
+    """Convert quality ratings into multipliers by their ordinal code (see
+    `quality_lookup`). Each distinct rating is looked up once; ratings that are
+    not in the lookup are NaN."""
+    max_code = max(quality_codes.values())
+    def quality_mult(quality: str) -> float:
+        code = quality_codes.get(quality_key(quality))
+        return np.nan if code is None else code/max_code
+
+    return _map_values(col, quality_mult)
+
+
+def _map_values(col: pd.Series, func) -> np.ndarray:
+    """Apply `func` to each distinct value of a column (the categories of a
+    categorical column) and gather the results for every row. Missing values
+    map to NaN."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        lookup = np.array([func(c) for c in col.cat.categories] + [np.nan], dtype=float)
+        return lookup[col.cat.codes.to_numpy()]  # missing (code -1) -> NaN
+    lookup = {value: func(value) for value in col.dropna().unique()}
+    return col.map(lookup).to_numpy(dtype=float)
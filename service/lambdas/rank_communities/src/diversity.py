@@ -0,0 +1,86 @@
+"""Diversified top-k selection by maximal marginal relevance (MMR)."""
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+from .columns import CITY_KEY
+from .enum_needs import Location
+# weight of each part of the similarity of two communities (summing to 1)
+SIMILARITY_WEIGHTS = {
+    "wants": 0.6,     # cosine of the feature multipliers
+    "city": 0.25,     # same city
+    "location": 0.15  # cosine of the location bits
+}
+SIMILARITY_CACHE_KEY = "similarity_features"
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def mmr_select(store, rows: np.ndarray, scores: np.ndarray, k: int,
+               weight: float) -> np.ndarray:
+    """Positions in the ranked `rows` of `k` communities picked one at a time
+    by maximal marginal relevance: the one maximizing
+        (1 - weight)*relevance - weight*(max similarity to those picked)
+    where relevance is the score scaled to [0, 1]. A weight of 0 keeps the
+    ranking order. The max similarities are updated with the similarities to
+    the last pick only (O(k n) for n candidates)."""
+    features = similarity_features(store)
+    wants = features["wants"][rows]
+    city = features["city"][rows]
+    location = features["location"][rows]
+
+    span = scores.max() - scores.min() if len(scores) else 0
+    relevance = (scores - scores.min())/span if span > 0 else np.ones(len(scores))
+    max_similarity = np.zeros(len(rows))
+    available = np.ones(len(rows), dtype=bool)
+    picked = []
+    for _ in range(min(k, len(rows))):
+        objective = (1 - weight)*relevance - weight*max_similarity
+        objective[~available] = -np.inf
+        i = int(np.argmax(objective))  # ties go to the higher ranked
+        picked.append(i)
+        available[i] = False
+        similarity = SIMILARITY_WEIGHTS["wants"]*(wants @ wants[i]) \
+            + SIMILARITY_WEIGHTS["city"]*((city == city[i]) & (city >= 0)) \
+            + SIMILARITY_WEIGHTS["location"]*(location @ location[i])
+        np.maximum(max_similarity, similarity, out=max_similarity)
+    return np.array(picked, dtype=int)
+
+
+def similarity_features(store) -> dict:
+    """Unit-length feature multipliers and location bits and city codes (-1
+    if missing) of every community of the store, computed once per store."""
+    if SIMILARITY_CACHE_KEY not in store.derived_cache:
+        store.derived_cache[SIMILARITY_CACHE_KEY] = {
+            "wants": _unit_rows(np.nan_to_num(store.multipliers.astype(float))),
+            "city": store.columns[CITY_KEY].astype(int) if CITY_KEY in store.categories
+                    else _codes(store.columns[CITY_KEY]),
+            "location": _unit_rows(np.stack(
+                [(store.location >> bit) & 1 for bit in range(len(Location))], axis=1
+            ).astype(float)),
+        }
+    return store.derived_cache[SIMILARITY_CACHE_KEY]
+
+
+def _unit_rows(arr: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (zero rows stay zero)."""
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    return np.divide(arr, norms, out=np.zeros_like(arr), where=norms > 0)
+
+
+def _codes(values: np.ndarray) -> np.ndarray:
+    """Integer codes of the distinct strings of a column, -1 for missing."""
+    present = np.array([isinstance(v, str) for v in values], dtype=bool)
+    codes = np.full(len(values), -1)
+    if present.any():
+        _, codes[present] = np.unique(values[present].astype(str), return_inverse=True)
+    return codes
@@ -1,4 +1,6 @@
 from io import BytesIO
+import logging
+import sys
 from typing import Union
 
 import numpy as np
@@ -11,6 +13,8 @@ from .exceptions import WorksheetNotFoundError
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
 from . import MODULE_NAME
+from .columns import CATEGORICAL_KEYS, INTERNED_KEYS
+FLOAT32_MAX_EXACT_INT = 2**24  # integers up to this are exact in float32
 
 # ----------------------------------------------------------------------------#
 #                               --- Logging ---                               #
@@ -42,5 +46,32 @@ def read_excel_sheet(xlsx: Union[str, BytesIO],
     df[pk].replace(to_replace='', value=np.nan, inplace=True)
     df = df[df[pk].notnull()]  # drop row if PK cell is NaN
     df.set_index(pk, inplace=True)
-    logger.debug(df.to_string())
+    if logger.isEnabledFor(logging.DEBUG):  # formatting large sheets is costly
+        logger.debug(df.to_string())
+    return df
+
+
+def optimize_dtypes(df: pd.DataFrame,
+                    categorical: list = CATEGORICAL_KEYS,
+                    interned: list = INTERNED_KEYS) -> pd.DataFrame:
+    """Convert the columns of a sheet to memory-lean dtypes. Enumerated string
+    columns become categoricals, repeated strings are interned and numeric
+    columns are downcast to the smallest type holding their values exactly.
+    Columns not in the sheet are ignored."""
+    mem_before = df.memory_usage(deep=True).sum()
+    for key in df.columns:
+        col = df[key]
+        if key in categorical:
+            df[key] = col.astype("category")
+        elif key in interned:
+            df[key] = col.map(lambda x: sys.intern(x) if isinstance(x, str) else x)
+        elif pd.api.types.is_integer_dtype(col.dtype):
+            df[key] = pd.to_numeric(col, downcast="integer")
+        elif pd.api.types.is_float_dtype(col.dtype):
+            values = col.dropna()
+            if (values == values.round()).all() \
+                    and (values.abs() <= FLOAT32_MAX_EXACT_INT).all():
+                df[key] = col.astype(np.float32)
+    mem_after = df.memory_usage(deep=True).sum()
+    logger.info(f"Optimized column dtypes: {mem_before} -> {mem_after} bytes")
     return df
@@ -1,12 +1,19 @@
+import json
+
 from topshelfsoftware_util.exceptions import ModuleError
 
 
 class UnprocessableContentError(ModuleError):
-    """Raised to indicate the content was not able to be processed."""
-    def __init__(self, value):
+    """Raised to indicate the content was not able to be processed. Details
+    for the client (e.g. suggested relaxations) make the message JSON, which
+    the API Lambda returns in the error."""
+    def __init__(self, value, details: dict = None):
         self.value = value
+        self.details = details
     
     def __str__(self):
+        if self.details is not None:
+            return json.dumps({"message": self.value, **self.details})
         return(repr(self.value))
 
 
@@ -17,3 +24,12 @@ class WorksheetNotFoundError(ModuleError):
     
     def __str__(self):
         return(repr(self.value))
+
+
+class InvalidCursorError(ModuleError):
+    """Raised to indicate a pagination cursor cannot be resumed."""
+    def __init__(self, value):
+        self.value = value
+    
+    def __str__(self):
+        return(repr(self.value))
@@ -0,0 +1,67 @@
+"""Counts of the communities each choice of a need would leave."""
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+
+from .enum_needs import Location, Size
+from .relaxation import component_masks, needs_domain
+from .scoring import age_mask, location_mask, price_mask, size_mask
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+# mask of a single choice of each filter component (see `component_masks`)
+OPTION_MASKS = {
+    "location": lambda store, loc: location_mask([loc], store.location),
+    "size": lambda store, size: size_mask([size], store.size),
+    "price": lambda store, bucket: price_mask(*bucket, store.price_low, store.price_high),
+    "age": lambda store, age: age_mask(age, store.home_age),
+}
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def facet_counts(store, hb_needs: dict) -> dict:
+    """Number of communities left by each choice of a need when the other
+    needs are kept: per location, size cluster, price bucket (between
+    consecutive price bounds of the payload schema) and age of home."""
+    domain = needs_domain()
+    buckets = list(zip(domain["price_range_lower"], domain["price_range_upper"]))
+    base = component_masks(store, hb_needs)
+    facets = {
+        "location": ("location", [l.value for l in Location], lambda loc: loc),
+        "size_of_community": ("size", [s.value for s in Size], lambda size: size),
+        "price_range": ("price", buckets, lambda bucket: "-".join(bucket)),
+        "age_of_home": ("age", domain["age_of_home"], lambda age: age),
+    }
+    counts = {}
+    for facet,(component,options,label) in facets.items():
+        rest = _other_components(base, component)
+        counts[facet] = {
+            label(option): int(np.count_nonzero(rest & option_mask(store, component, option)))
+            for option in options
+        }
+    return counts
+
+
+def option_mask(store, component: str, option) -> np.ndarray:
+    """Mask of a single choice of a filter component, computed once per store."""
+    key = (component, option)
+    if key not in store.derived_cache:
+        store.derived_cache[key] = OPTION_MASKS[component](store, option)
+    return store.derived_cache[key]
+
+
+def _other_components(base: dict, component: str) -> np.ndarray:
+    """Communities meeting every filter component but one."""
+    mask = np.ones(len(next(iter(base.values()))), dtype=bool)
+    for c,m in base.items():
+        if c != component:
+            mask &= m
+    return mask
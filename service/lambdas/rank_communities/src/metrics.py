@@ -0,0 +1,154 @@
+"""Per-stage latency and memory of a ranking, emitted as CloudWatch embedded
+metric format (EMF) log lines."""
+
+from contextlib import contextmanager
+import json
+import os
+import resource
+import sys
+import time
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+METRICS_NAMESPACE = "RealEstateCommunityRanking"
+METRICS_DIMENSION = "Module"
+# peak RSS over the lifetime of the process (it only grows across warm
+# invocations) and over a single stage (linux only, see StageTimer.stage)
+PROCESS_PEAK_RSS_KEY = "process_peak_rss_mb"
+PEAK_RSS_KEY = "peak_rss_mb"
+PROC_STATM_FN = "/proc/self/statm"
+PROC_STATUS_FN = "/proc/self/status"
+PROC_CLEAR_REFS_FN = "/proc/self/clear_refs"
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class StageTimer:
+    """Wall-clock duration and peak resident memory of the named stages of an
+    invocation. A disabled timer records nothing, so the stages can stay
+    instrumented in production."""
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = {}
+        self.properties = {}
+        self._open_peaks = []  # peak RSS of the open stages so far, innermost last
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name`. On linux the RSS high-water
+        mark is reset when the stage starts and read when it ends, so memory
+        the stage allocates and frees again still counts. A nested stage
+        resets the mark of its parent, which takes the peak of the nested
+        stage over."""
+        if not self.enabled:
+            yield
+            return
+        if self._open_peaks:
+            self._open_peaks[-1] = max(self._open_peaks[-1], peak_rss_mb() or 0)
+        tracked = reset_peak_rss()
+        self._open_peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "duration_ms": round((time.perf_counter() - start)*1000, 3)
+            }
+            peak = self._open_peaks.pop()
+            if tracked:
+                peak = max(peak, peak_rss_mb() or 0)
+                self.stages[name][PEAK_RSS_KEY] = peak
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+
+    def set_property(self, key: str, value):
+        """Attach a value describing the invocation (not a metric)."""
+        if self.enabled:
+            self.properties[key] = value
+
+    def as_dict(self) -> dict:
+        """Stage timings of the invocation."""
+        return {
+            "stages": self.stages,
+            "total_ms": round(sum(s["duration_ms"] for s in self.stages.values()), 3),
+            PROCESS_PEAK_RSS_KEY: process_peak_rss_mb(),
+            **self.properties
+        }
+
+    def emit(self):
+        """Log the stage timings as an EMF record. CloudWatch only parses EMF from
+        lines that are a bare JSON object, so the record bypasses the logger."""
+        if not self.enabled or not self.stages:
+            return
+        metrics = {f"{name}_ms": s["duration_ms"] for name,s in self.stages.items()}
+        metrics.update({f"{name}_{PEAK_RSS_KEY}": s[PEAK_RSS_KEY]
+                        for name,s in self.stages.items() if PEAK_RSS_KEY in s})
+        metrics[PROCESS_PEAK_RSS_KEY] = process_peak_rss_mb()
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time()*1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [[METRICS_DIMENSION]],
+                    "Metrics": [
+                        {"Name": key, "Unit": "Megabytes" if key.endswith("_mb") else "Milliseconds"}
+                        for key in metrics
+                    ]
+                }]
+            },
+            METRICS_DIMENSION: MODULE_NAME,
+            **metrics,
+            **self.properties
+        }
+        print(json.dumps(record), flush=True)
+
+
+NULL_TIMER = StageTimer(enabled=False)
+
+
+def process_peak_rss_mb() -> float:
+    """Peak resident set size of the process so far, over all invocations."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # bytes on macOS, KB on linux
+    return round(maxrss/scale, 1)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size since the last `reset_peak_rss`, None outside of
+    linux."""
+    try:
+        with open(PROC_STATUS_FN, "r") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1])/2**10, 1)  # kB
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS to the current RSS. Whether it could be (linux only)."""
+    try:
+        with open(PROC_CLEAR_REFS_FN, "w") as fp:
+            fp.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def current_rss_mb() -> float:
+    """Current resident set size of the process, None outside of linux."""
+    try:
+        with open(PROC_STATM_FN, "r") as fp:
+            resident_pages = int(fp.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages*os.sysconf("SC_PAGE_SIZE")/2**20
@@ -0,0 +1,49 @@
+"""Opaque cursors over the ranked communities of a profile."""
+
+import base64
+import binascii
+import json
+
+from topshelfsoftware_util.log import get_logger
+
+from .exceptions import InvalidCursorError
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def encode_cursor(dataset_version: str, hb_profile_hash: str, offset: int,
+                  page_size: int) -> str:
+    """Cursor of the page starting at `offset` of a profile's ranking."""
+    position = {"v": dataset_version, "p": hb_profile_hash, "o": offset, "n": page_size}
+    data = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, dataset_version: str, hb_profile_hash: str) -> tuple[int, int]:
+    """Offset and page size of a cursor issued for the dataset version and
+    profile. Raises InvalidCursorError if the cursor is malformed, belongs to
+    another profile (or sort order) or was issued before the dataset was republished."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "="*(-len(cursor) % 4))
+        position = json.loads(data)
+        offset, page_size = int(position["o"]), int(position["n"])
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError(f"Malformed cursor: {e}")
+    if position.get("p") != hb_profile_hash:
+        raise InvalidCursorError("Cursor was issued for different homebuyer needs, wants " \
+                                 "or sort order.")
+    if position.get("v") != dataset_version:
+        raise InvalidCursorError("Community data has been updated since the cursor was issued. " \
+                                 "Request the first page again.")
+    if offset < 0 or page_size < 1:
+        raise InvalidCursorError("Malformed cursor: negative offset or page size.")
+    return offset, page_size
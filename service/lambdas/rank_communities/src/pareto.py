@@ -0,0 +1,109 @@
+"""Pareto fronts (skylines) of communities over several objectives."""
+
+import bisect
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+from .columns import HOA_KEY, HOME_AGE_KEY, PRICE_AVG_KEY
+# objective (response key) -> (spreadsheet column or None for the wants score,
+# 1 if higher is better or -1 if lower is better)
+OBJECTIVES = {
+    "homebuyer_score": (None, 1),
+    "price_avg": (PRICE_AVG_KEY, -1),
+    "hoa_fee": (HOA_KEY, -1),
+    "age_avg": (HOME_AGE_KEY, 1),  # year built, newer is better
+}
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def objective_costs(store, rows: np.ndarray, scores: np.ndarray,
+                    objectives: list[str]) -> np.ndarray:
+    """Objectives of the communities in `rows` as costs to minimize (one
+    column per objective). Missing values are the worst cost."""
+    costs = np.empty((len(rows), len(objectives)))
+    for j,objective in enumerate(objectives):
+        key, sense = OBJECTIVES[objective]
+        values = scores if key is None else store.columns[key][rows].astype(float)
+        costs[:, j] = -sense*values
+    costs[np.isnan(costs)] = np.inf
+    return costs
+
+
+def pareto_fronts(costs: np.ndarray, n_fronts: int) -> np.ndarray:
+    """Front of every point (0 for the non-dominated set, 1 for the set
+    non-dominated once it is removed, ...), -1 beyond the first `n_fronts`.
+    A point dominates another if it costs no more in every objective and less
+    in one; equal points share a front."""
+    if len(costs) == 0:
+        return np.full(0, -1)
+    # distinct points in lexicographic order (first objective first)
+    order = np.lexsort(costs.T[::-1])
+    ordered = costs[order]
+    new = np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis=1)])
+    unique = ordered[new]
+    group = np.empty(len(costs), dtype=int)
+    group[order] = np.cumsum(new) - 1
+
+    unique_front = np.full(len(unique), -1)
+    remaining = np.arange(len(unique))
+    for k in range(n_fronts):
+        if len(remaining) == 0:
+            break
+        on_front = skyline(unique[remaining])
+        unique_front[remaining[on_front]] = k
+        remaining = remaining[~on_front]
+    return unique_front[group]
+
+
+def skyline(points: np.ndarray) -> np.ndarray:
+    """Mask of the non-dominated points among distinct points in lexicographic
+    order, where no point can dominate an earlier one. Two and three
+    objectives take a sweep (O(n log n) with the sort); more fall back to
+    comparing every point with the skyline found so far."""
+    n, d = points.shape
+    on_skyline = np.zeros(n, dtype=bool)
+    if n == 0:
+        return on_skyline
+    if d == 1:
+        on_skyline[0] = True
+    elif d == 2:
+        # a point is dominated iff an earlier point costs no more in the second
+        second = points[:, 1]
+        running_min = np.minimum.accumulate(np.concatenate([[np.inf], second[:-1]]))
+        on_skyline[:] = second < running_min
+        on_skyline[0] = True  # even at an infinite cost
+    elif d == 3:
+        # staircase of the skyline so far projected on the last two objectives:
+        # increasing second cost, decreasing third cost
+        stair_2, stair_3 = [], []
+        for i,(_, c2, c3) in enumerate(points.tolist()):
+            pos = bisect.bisect_right(stair_2, c2)
+            if pos > 0 and stair_3[pos - 1] <= c3:
+                continue
+            on_skyline[i] = True
+            if pos > 0 and stair_2[pos - 1] == c2:
+                pos -= 1  # the point covers the step of the same second cost
+            end = pos
+            while end < len(stair_2) and stair_3[end] >= c3:
+                end += 1
+            stair_2[pos:end] = [c2]
+            stair_3[pos:end] = [c3]
+    else:
+        found = []
+        for i in range(n):
+            if found and np.any(np.all(points[found] <= points[i], axis=1)):
+                continue
+            on_skyline[i] = True
+            found.append(i)
+    return on_skyline
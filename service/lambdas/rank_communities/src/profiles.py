@@ -0,0 +1,50 @@
+"""Canonical homebuyer profiles: the part of a ranking request that decides
+its result, and a hash identifying it across requests."""
+
+import hashlib
+import json
+import os
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME
+WARMUP_PROFILES_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                    "warmup_profiles.json")
+PROFILE_HASH_LENGTH = 16
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def canonical_profile(hb_needs: dict, hb_wants: dict) -> dict:
+    """Needs and wants with list values sorted, so requests that only differ
+    in the order of their choices are the same profile."""
+    return {
+        "needs": {k: sorted(v) if isinstance(v, list) else v for k,v in hb_needs.items()},
+        "wants": dict(hb_wants),
+    }
+
+
+def profile_hash(hb_needs: dict, hb_wants: dict) -> str:
+    """Hash of the canonical profile."""
+    canonical = json.dumps(canonical_profile(hb_needs, hb_wants), sort_keys=True,
+                           separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:PROFILE_HASH_LENGTH]
+
+
+def read_frequency_table(table: dict) -> list[dict]:
+    """Profiles of a frequency table ({"profiles": [{"needs", "wants",
+    "count"}, ...]}, see tools/profile_frequency.py), most frequent first."""
+    return sorted(table["profiles"], key=lambda p: -p.get("count", 0))
+
+
+def load_packaged_profiles() -> list[dict]:
+    """Configured list of popular profiles shipped with the package."""
+    with open(WARMUP_PROFILES_FILE, "r") as fp:
+        return read_frequency_table(json.load(fp))
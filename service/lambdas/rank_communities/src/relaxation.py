@@ -0,0 +1,184 @@
+"""Cheapest relaxations of homebuyer needs that leave communities to rank."""
+
+import itertools
+import json
+import os
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+
+from .scoring import age_mask, budget_mask, location_mask, price_mask, size_mask
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME, TCO_YEARS
+# copy of the payload schema of validate_rank_inputs, for the needs domain
+PAYLOAD_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   "payload_schema.json")
+# direction a single-valued need relaxes in, along the order of its schema values
+RELAX_DIRECTION = {
+    "price_range_lower": -1,
+    "price_range_upper": 1,
+    "age_of_home": -1,
+}
+# list-valued needs whose schema values are ordered, so adding a value next to
+# a chosen one is cheaper than one further away
+ORDERED_LIST_NEEDS = ["size_of_community"]
+# filter component (see `component_masks`) of every need
+NEED_COMPONENTS = {
+    "price_range_lower": "price",
+    "price_range_upper": "price",
+    "age_of_home": "age",
+    "location": "location",
+    "size_of_community": "size",
+    "max_total_cost": "total_cost",
+    "total_cost_years": "total_cost",
+}
+# budget relaxations are rounded up to and cost one per step of the price bounds
+BUDGET_STEP = 200_000
+MAX_RELAXATIONS = 3
+needs_domain_cache = {}
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def suggest_relaxations(store, hb_needs: dict, n: int = MAX_RELAXATIONS) -> list[dict]:
+    """The `n` cheapest relaxations of the needs that leave communities to
+    rank, each with the needs it changes, its cost (steps away from the
+    homebuyer's needs) and the number of communities it would leave. Changes
+    of a single need are tried first, pairs of changes only if none of them
+    leaves any community."""
+    base = component_masks(store, hb_needs)
+    candidates = []
+    relaxations = candidate_relaxations(hb_needs, needs_domain())
+    if "total_cost" in base:
+        relaxations += budget_relaxation(store, hb_needs, base)
+    for changes,cost in relaxations:
+        masks = component_masks(store, {**hb_needs, **changes}, _components(changes))
+        candidates.append((changes, cost, masks))
+
+    suggestions = [(changes, cost, _count(base, masks)) for changes,cost,masks in candidates]
+    if not any(n_communities for _, _, n_communities in suggestions):
+        suggestions = []
+        for (changes_a, cost_a, masks_a),(changes_b, cost_b, masks_b) in \
+                itertools.combinations(candidates, 2):
+            if not set(changes_a).isdisjoint(changes_b):
+                continue
+            changes = {**changes_a, **changes_b}
+            if _components(changes_a) & _components(changes_b):
+                masks = component_masks(store, {**hb_needs, **changes}, _components(changes))
+            else:
+                masks = {**masks_a, **masks_b}
+            suggestions.append((changes, cost_a + cost_b, _count(base, masks)))
+        if "total_cost" in base:
+            # the budget raise that goes with a relaxation of another need
+            for changes_a,cost_a,masks_a in candidates:
+                if "total_cost" in _components(changes_a):
+                    continue
+                for changes_b,cost_b in budget_relaxation(store, hb_needs, {**base, **masks_a}):
+                    masks = {**masks_a, **component_masks(store, {**hb_needs, **changes_b},
+                                                          {"total_cost"})}
+                    suggestions.append(({**changes_a, **changes_b}, cost_a + cost_b,
+                                        _count(base, masks)))
+
+    suggestions = sorted((s for s in suggestions if s[2] > 0), key=lambda s: (s[1], -s[2]))
+    return [
+        {"needs": changes, "cost": cost, "n_communities": n_communities}
+        for changes,cost,n_communities in suggestions[:n]
+    ]
+
+
+def candidate_relaxations(hb_needs: dict, domain: dict) -> list[tuple[dict, int]]:
+    """Relaxations of a single need and their cost: the steps a single-valued
+    need moves along its values, or the distance of a value added to a
+    list-valued need from the closest chosen one (1 if unordered)."""
+    candidates = []
+    for need,values in domain.items():
+        current = hb_needs.get(need)
+        if need in RELAX_DIRECTION:
+            if current not in values:
+                continue
+            i = values.index(current)
+            step = RELAX_DIRECTION[need]
+            stop = -1 if step < 0 else len(values)
+            candidates += [({need: values[j]}, abs(j - i)) for j in range(i + step, stop, step)]
+        elif isinstance(current, list):
+            chosen = [values.index(v) for v in current if v in values]
+            for j,value in enumerate(values):
+                if value in current:
+                    continue
+                cost = min((abs(j - k) for k in chosen), default=1) \
+                    if need in ORDERED_LIST_NEEDS else 1
+                candidates.append(({need: current + [value]}, cost))
+    return candidates
+
+
+def budget_relaxation(store, hb_needs: dict, masks: dict) -> list[tuple[dict, int]]:
+    """Raise of the budget to the lowest total cost of ownership among the
+    communities meeting the other needs (by their component `masks`, which
+    may be relaxed), rounded up to a `BUDGET_STEP`, and its cost (steps
+    raised). Empty if none has a known cost."""
+    rest = np.ones(len(store), dtype=bool)
+    for component,mask in masks.items():
+        if component != "total_cost":
+            rest &= mask
+    cost = store.total_cost(hb_needs.get("total_cost_years", TCO_YEARS))[rest]
+    cost = cost[~np.isnan(cost)]
+    if len(cost) == 0:
+        return []
+    budget = int(np.ceil(cost.min()/BUDGET_STEP))*BUDGET_STEP
+    steps = int(np.ceil((budget - hb_needs["max_total_cost"])/BUDGET_STEP))
+    return [({"max_total_cost": budget}, max(steps, 1))]
+
+
+def component_masks(store, hb_needs: dict, components: set = None) -> dict:
+    """Masks of the filter components (see `needs_mask`) of the needs, all
+    of them or only `components`. The budget is only a component if given."""
+    masks = {
+        "size": lambda: size_mask(hb_needs["size_of_community"], store.size),
+        "location": lambda: location_mask(hb_needs["location"], store.location),
+        "price": lambda: price_mask(hb_needs["price_range_lower"], hb_needs["price_range_upper"],
+                                    store.price_low, store.price_high),
+        "age": lambda: age_mask(hb_needs["age_of_home"], store.home_age),
+    }
+    if "max_total_cost" in hb_needs:
+        masks["total_cost"] = lambda: budget_mask(
+            hb_needs["max_total_cost"],
+            store.total_cost(hb_needs.get("total_cost_years", TCO_YEARS))
+        )
+    return {k: mask() for k,mask in masks.items() if components is None or k in components}
+
+
+def needs_domain() -> dict:
+    """Allowed values of every enumerated need, in the order of the payload
+    schema."""
+    if not needs_domain_cache:
+        with open(PAYLOAD_SCHEMA_FILE, "r") as fp:
+            schema = json.load(fp)
+        for need,prop in schema["properties"]["needs"]["properties"].items():
+            if prop["type"] == "array":
+                needs_domain_cache[need] = prop["items"]["enum"]
+            elif "enum" in prop:
+                needs_domain_cache[need] = prop["enum"]
+    return needs_domain_cache
+
+
+def _components(changes: dict) -> set:
+    """Filter components of the changed needs."""
+    return {NEED_COMPONENTS[need] for need in changes}
+
+
+def _count(base: dict, masks: dict) -> int:
+    """Communities meeting the needs of the `base` component masks with the
+    components of `masks` replaced."""
+    mask = None
+    for component,m in base.items():
+        m = masks.get(component, m)
+        mask = m if mask is None else mask & m
+    return int(np.count_nonzero(mask))
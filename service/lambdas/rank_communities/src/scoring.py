@@ -0,0 +1,126 @@
+"""Scoring and filtering kernels that work on plain numpy arrays, so
+communities can be ranked without pandas (e.g. from a `FeatureBlock`)."""
+
+import numpy as np
+
+from .enum_needs import Filter, Price, Location, Size
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .columns import (
+    FEATURE_KEYS, FEATURE_PREFERENCES, MAX_PREFERENCE, MIN_PREFERENCE
+)
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def feature_preferences(hb_wants: dict) -> np.ndarray:
+    """Homebuyer preference for each community feature (in `FEATURE_KEYS` order)."""
+    return np.array([int(hb_wants[FEATURE_PREFERENCES[feature]]) for feature in FEATURE_KEYS],
+                    dtype=float)
+
+
+def feature_contributions(mults: np.ndarray, prefs: np.ndarray) -> np.ndarray:
+    """Calculate the score each feature contributes to each community given the
+    feature multipliers and the homebuyer preferences. Missing features contribute
+    nothing to the score."""
+    contributions = mults*(prefs-MIN_PREFERENCE)/(MAX_PREFERENCE-MIN_PREFERENCE)
+    contributions[np.isnan(contributions)] = 0
+    return contributions
+
+
+def sum_contributions(contributions: np.ndarray) -> np.ndarray:
+    """Sum the feature contributions of each community into a score. Features are
+    added one at a time (in `FEATURE_KEYS` order) so the scores are reproducible."""
+    scores = np.zeros(len(contributions))
+    for j in range(contributions.shape[1]):
+        scores += contributions[:, j]
+    return scores
+
+
+def needs_mask(hb_needs: dict, price_low: np.ndarray, price_high: np.ndarray,
+               home_age: np.ndarray, location: np.ndarray, size: np.ndarray,
+               total_cost: np.ndarray = None) -> np.ndarray:
+    """Boolean mask of the communities meeting the homebuyer needs. Uses the same
+    semantics as `filter_communities` on the columns of an entire dataset, where
+    `location` holds bitmasks from `encode_locations`, `size` holds codes from
+    `cluster_size_codes` and `total_cost` the total costs of ownership over the
+    horizon of the needs (only used with a budget)."""
+    mask = size_mask(hb_needs["size_of_community"], size)
+    mask &= location_mask(hb_needs["location"], location)
+    mask &= price_mask(hb_needs["price_range_lower"], hb_needs["price_range_upper"],
+                       price_low, price_high)
+    mask &= age_mask(hb_needs["age_of_home"], home_age)
+    if "max_total_cost" in hb_needs:
+        if total_cost is None:
+            raise ValueError("needs with a max_total_cost need the total costs of ownership")
+        mask &= budget_mask(hb_needs["max_total_cost"], total_cost)
+    return mask
+
+
+def size_mask(size_of_community: list, size: np.ndarray) -> np.ndarray:
+    """Communities of one of the sizes."""
+    return np.isin(size, size_codes(size_of_community))
+
+
+def location_mask(locations: list, location: np.ndarray) -> np.ndarray:
+    """Communities in one of the locations (all of them if none is given)."""
+    if not locations:
+        return np.ones(len(location), dtype=bool)
+    return (location & encode_locations(["/".join(locations)])[0]) != 0
+
+
+def price_mask(price_range_lower: str, price_range_upper: str,
+               price_low: np.ndarray, price_high: np.ndarray) -> np.ndarray:
+    """Communities whose price range overlaps the homebuyer's."""
+    price_range_lower = 1000*int(''.join(filter(str.isdigit, price_range_lower)))
+    if price_range_upper.capitalize() == Price.MAX.value:
+        price_range_upper = np.nanmax(price_high) if len(price_high) else 0
+    else:
+        price_range_upper = 1000*int(''.join(filter(str.isdigit, price_range_upper)))
+    return ((price_low <= price_range_lower) & (price_high >= price_range_lower)) | \
+           ((price_low <= price_range_upper) & (price_high >= price_range_upper)) | \
+           ((price_low >= price_range_lower) & (price_low <= price_range_upper)) | \
+           ((price_high >= price_range_lower) & (price_high <= price_range_upper))
+
+
+def age_mask(age_of_home: str, home_age: np.ndarray) -> np.ndarray:
+    """Communities built after the year of the age need."""
+    if age_of_home.capitalize() == Filter.DOES_NOT_MATTER.value:
+        year_built = 0
+    else:
+        year_built = int(''.join(filter(str.isdigit, age_of_home)))
+    return home_age > year_built
+
+
+def budget_mask(max_total_cost: int, total_cost: np.ndarray) -> np.ndarray:
+    """Communities whose total cost of ownership is within the budget. An
+    unknown cost is not."""
+    return total_cost <= max_total_cost
+
+
+def total_costs(price_avg: np.ndarray, hoa_fee: np.ndarray, preservation_fee: np.ndarray,
+                years: int) -> np.ndarray:
+    """Total cost of owning a home for `years`: the average price, the annual
+    HOA fee over the years and the preservation fee. NaN if the price or HOA
+    fee is missing or the preservation fee could not be parsed (see
+    `parse_fee`), so `budget_mask` excludes the community."""
+    return price_avg + years*hoa_fee + preservation_fee
+
+
+def encode_locations(locations) -> np.ndarray:
+    """Encode location strings as bitmasks of the `Location` values they contain."""
+    codes = np.zeros(len(locations), dtype=np.uint8)
+    for i,loc in enumerate(locations):
+        if not isinstance(loc, str):
+            continue
+        for bit,l in enumerate(Location):
+            if l.value in loc:
+                codes[i] |= 1 << bit
+    return codes
+
+
+def size_codes(sizes: list) -> list:
+    """Convert `Size` values into size codes (position in `Size`)."""
+    size_values = [s.value for s in Size]
+    return [size_values.index(s) for s in sizes if s in size_values]
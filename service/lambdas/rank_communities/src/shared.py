@@ -0,0 +1,179 @@
+"""Read-only, memory-mapped block of the community scoring inputs so that worker
+processes can attach to the dataset without copying or re-parsing it. The block
+is written from a `CommunityStore`, the one columnar form of the dataset."""
+
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+
+from .scoring import (
+    feature_contributions, feature_preferences, needs_mask, sum_contributions,
+    total_costs
+)
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME, TCO_YEARS
+from .columns import FEATURE_KEYS, HOA_KEY, HOME_TOT_KEY, PRICE_AVG_KEY
+BLOCK_ALIGNMENT = 64  # bytes; keeps every array cache-line aligned
+SHM_DIR = "/dev/shm"  # RAM-backed on linux, otherwise fall back to the tmp dir
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class FeatureBlock:
+    """Read-only array views of the community scoring inputs backed by a
+    memory-mapped block. Rows are the rows of the `CommunityStore` the block
+    was written from (communities ordered by total homes).
+
+    Attributes
+    ----------
+    names: np.ndarray
+        Community names (primary key).
+    multipliers: np.ndarray
+        Feature multiplier matrix, a column per feature in `FEATURE_KEYS` order.
+    price_low, price_high, home_total, home_age: np.ndarray
+        Filter columns.
+    location: np.ndarray
+        Location bitmasks (see `encode_locations`).
+    size: np.ndarray
+        Size codes (see `cluster_size_codes`).
+    price_avg, hoa_fee, preservation_fee: np.ndarray
+        Inputs of the total cost of ownership (see `total_costs`).
+    """
+    def __init__(self, buf: mmap.mmap, descriptor: dict, owner: bool = False):
+        self.descriptor = descriptor
+        self._buf = buf
+        self._owner = owner
+        for key,layout in descriptor["arrays"].items():
+            dtype = np.dtype(layout["dtype"])
+            shape = tuple(layout["shape"])
+            arr = np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape)),
+                                offset=layout["offset"]).reshape(shape)
+            setattr(self, key, arr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def __len__(self):
+        return self.descriptor["n_communities"]
+
+    def score(self, hb_wants: dict) -> np.ndarray:
+        """Score every community in the block by homebuyer wants."""
+        prefs = feature_preferences(hb_wants)
+        return sum_contributions(feature_contributions(self.multipliers, prefs))
+
+    def filter(self, hb_needs: dict) -> np.ndarray:
+        """Boolean mask of the communities in the block meeting the homebuyer needs."""
+        total_cost = self.total_cost(hb_needs.get("total_cost_years", TCO_YEARS)) \
+                     if "max_total_cost" in hb_needs else None
+        return needs_mask(hb_needs, self.price_low, self.price_high,
+                          self.home_age, self.location, self.size, total_cost)
+
+    def total_cost(self, years: int) -> np.ndarray:
+        """Total cost of ownership of every community in the block over `years`."""
+        return total_costs(self.price_avg, self.hoa_fee, self.preservation_fee, years)
+
+    def close(self):
+        """Release the array views and the memory map."""
+        for key in self.descriptor["arrays"]:
+            setattr(self, key, None)
+        try:
+            self._buf.close()
+        except BufferError:
+            # views handed out by this block are still referenced somewhere,
+            # the map is released once they are garbage collected
+            logger.warning("feature block still in use, deferring close")
+
+    def unlink(self):
+        """Remove the backing file. Processes already attached keep their map."""
+        try:
+            os.remove(self.descriptor["path"])
+        except FileNotFoundError:
+            pass
+
+
+def create_feature_block(store, path: str = None) -> FeatureBlock:
+    """Write the scoring inputs of a `CommunityStore` to a memory-mapped block,
+    so the block holds the same arrays the store ranks with. Returns the block
+    owned by the caller; hand `block.descriptor` to the workers so they can
+    `attach_feature_block`."""
+    arrays = {
+        "names": np.array(store.names.tolist(), dtype=str),
+        "multipliers": store.multipliers,
+        "price_low": store.price_low.astype(float),
+        "price_high": store.price_high.astype(float),
+        "home_total": store.columns[HOME_TOT_KEY].astype(float),
+        "home_age": store.home_age.astype(float),
+        "location": store.location,
+        "size": store.size,
+        "price_avg": store.columns[PRICE_AVG_KEY].astype(float),
+        "hoa_fee": store.columns[HOA_KEY].astype(float),
+        "preservation_fee": store.preservation_fee,
+    }
+
+    if path is None:
+        shm_dir = SHM_DIR if os.access(SHM_DIR, os.W_OK) else None
+        fd, path = tempfile.mkstemp(prefix="community_features_", suffix=".bin", dir=shm_dir)
+        os.close(fd)
+    descriptor = {
+        "path": path,
+        "n_communities": len(store),
+        "feature_keys": FEATURE_KEYS,
+        "arrays": _write_block(path, arrays),
+    }
+    logger.info(f"Wrote feature block for {len(store)} communities to {path}")
+
+    with open(path, "rb") as fp:
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return FeatureBlock(buf, descriptor, owner=True)
+
+
+def attach_feature_block(descriptor: dict) -> FeatureBlock:
+    """Attach to a block created by `create_feature_block`. The arrays are
+    read-only views of the shared pages, nothing is copied."""
+    with open(descriptor["path"], "rb") as fp:
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return FeatureBlock(buf, descriptor)
+
+
+def filter_and_score(descriptor: dict, hb_needs: dict, hb_wants: dict) -> tuple:
+    """Worker entry point: attach to the block of `descriptor` and return the
+    needs mask and the scores of its communities. Only the descriptor is
+    pickled to the worker, the arrays are read from the shared pages."""
+    with attach_feature_block(descriptor) as block:
+        return block.filter(hb_needs), block.score(hb_wants)
+
+
+def _write_block(path: str, arrays: dict) -> dict:
+    """Write the arrays back to back (aligned) and return their layout."""
+    layout = {}
+    offset = 0
+    with open(path, "wb") as fp:
+        for key,arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            offset = -(-offset//BLOCK_ALIGNMENT)*BLOCK_ALIGNMENT
+            fp.seek(offset)
+            fp.write(arr.tobytes())
+            layout[key] = {
+                "dtype": arr.dtype.str,
+                "shape": list(arr.shape),
+                "offset": offset
+            }
+            offset += arr.nbytes
+        fp.truncate(max(offset, 1))  # cannot map an empty file
+    return layout
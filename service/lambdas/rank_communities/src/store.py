@@ -0,0 +1,410 @@
+"""Compact in-memory store of the community dataset. Each spreadsheet column is
+held as a typed numpy array (one entry per community) so homebuyers can be
+filtered, scored and ranked without pandas."""
+
+import numpy as np
+
+from topshelfsoftware_util.log import get_logger
+
+from .enum_needs import Size
+from .metrics import NULL_TIMER, StageTimer
+from .scoring import (
+    feature_contributions, feature_preferences, needs_mask, sum_contributions,
+    total_costs
+)
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME, TCO_YEARS
+from .columns import (
+    CITY_KEY, DOG_PARK_KEY, FISH_KEY, GATE_KEY, GOLF_COURSE_QLTY_KEY,
+    HEADERS_NEEDS, HEADERS_WANTS, HOA_KEY, HOME_AGE_KEY, HOME_TOT_KEY,
+    ISOLATED_KEY, LINK_KEY, LOC_KEY, MTN_VIEW_KEY, N_CLUBS_KEY,
+    N_GOLF_COURSE_KEY, N_REC_CENTER_KEY, PICKLEBALL_KEY, POOL_KEY, PRES_KEY,
+    PRICE_AVG_KEY, PRICE_HIGH_KEY, PRICE_LOW_KEY, SOFTBALL_KEY,
+    TRAILS_QLTY_KEY, WOODWORK_KEY, FEATURE_KEYS, FEATURE_PREFERENCES
+)
+SIZE_VALUES = [s.value for s in Size]
+MISSING_VALUE = "N/A"
+# response key of each community attribute -> spreadsheet column
+RECORD_FIELDS = {
+    "city": CITY_KEY,
+    "location": LOC_KEY,
+    "age_avg": HOME_AGE_KEY,
+    "price_avg": PRICE_AVG_KEY,
+    "price_lower": PRICE_LOW_KEY,
+    "price_upper": PRICE_HIGH_KEY,
+    "hoa_fee": HOA_KEY,
+    "preservation_fee": PRES_KEY,
+    "size": None,  # derived from the size codes
+    "link": LINK_KEY,
+    "n_golf_courses": N_GOLF_COURSE_KEY,
+    "n_clubs": N_CLUBS_KEY,
+    "n_rec_center": N_REC_CENTER_KEY,
+    "golf_course_qlty": GOLF_COURSE_QLTY_KEY,
+    "trails_qlty": TRAILS_QLTY_KEY,
+    "fish": FISH_KEY,
+    "dog_park": DOG_PARK_KEY,
+    "gated": GATE_KEY,
+    "indoor_pool": POOL_KEY,
+    "woodwork": WOODWORK_KEY,
+    "mtn_view": MTN_VIEW_KEY,
+    "softball": SOFTBALL_KEY,
+    "isolated_from_city": ISOLATED_KEY,
+    "competitive_pickleball": PICKLEBALL_KEY,
+}
+# sort key (response key) -> (spreadsheet column, default order)
+SORT_KEYS = {
+    "price_avg": (PRICE_AVG_KEY, "asc"),
+    "hoa_fee": (HOA_KEY, "asc"),
+    "age_avg": (HOME_AGE_KEY, "desc"),  # year built, newest first
+    "size": (HOME_TOT_KEY, "asc"),
+    "total_cost": (None, "asc"),  # derived, see `total_cost`
+}
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class CommunityRecord:
+    """View of a single community in a `CommunityStore` used for output."""
+    __slots__ = ("store", "row", "name", "homebuyer_score")
+
+    def __init__(self, store: "CommunityStore", row: int, homebuyer_score: float):
+        self.store = store
+        self.row = row
+        self.name: str = store.names[row]
+        self.homebuyer_score = homebuyer_score
+
+    def __repr__(self):
+        return f"CommunityRecord({self.name!r}, homebuyer_score={self.homebuyer_score})"
+
+    def to_dict(self) -> dict:
+        """Key information of the community. Missing values are 'N/A'."""
+        record = {"homebuyer_score": _output_value(self.homebuyer_score)}
+        for field,key in RECORD_FIELDS.items():
+            if key is None:
+                code = self.store.size[self.row]
+                record[field] = SIZE_VALUES[code] if code >= 0 else MISSING_VALUE
+            else:
+                record[field] = _output_value(self.store.value(key, self.row))
+        return record
+
+
+class CommunityStore:
+    """Community dataset held as parallel typed arrays. Rows are communities
+    ordered by total homes (ascending), which is also the order ties are ranked in.
+
+    Attributes
+    ----------
+    names: np.ndarray
+        Community names (primary key).
+    row_of: dict
+        Community name -> row, the primary key index.
+    columns: dict
+        Spreadsheet column -> array, as read from the spreadsheet. Categorical
+        columns are held as integer codes (-1 when missing).
+    categories: dict
+        Spreadsheet column -> categories of the columns held as codes.
+    multipliers: np.ndarray
+        Feature multiplier matrix (see `feature_multipliers`).
+    price_low, price_high, home_age, location, size: np.ndarray
+        Filter columns (see `needs_mask`).
+    preservation_fee: np.ndarray
+        Preservation fee in dollars, parsed once from the mixed-type column
+        (see `preservation_fees`).
+    derived_cache: dict
+        Arrays derived from the columns on first use, e.g. the masks of single
+        filter choices (see `facets`), the similarity features (see
+        `diversity`) and the presorted indexes (see `sort_index`).
+    """
+    def __init__(self, names: np.ndarray, columns: dict, categories: dict,
+                 multipliers: np.ndarray, location: np.ndarray, size: np.ndarray,
+                 preservation_fee: np.ndarray = None):
+        self.names = names
+        self.row_of = {name: row for row,name in enumerate(names.tolist())}
+        self.columns = columns
+        self.categories = categories
+        self.multipliers = multipliers
+        self.location = location
+        self.size = size
+        self.price_low = _numeric(columns[PRICE_LOW_KEY])
+        self.price_high = _numeric(columns[PRICE_HIGH_KEY])
+        self.home_age = _numeric(columns[HOME_AGE_KEY])
+        self.preservation_fee = preservation_fee if preservation_fee is not None \
+                                else np.zeros(len(names))
+        self.derived_cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_frames(cls, df_needs, df_wants,
+                    timer: StageTimer = NULL_TIMER) -> "CommunityStore":
+        """Build the store from the needs and wants sheets as read by
+        `read_excel_sheet`. This is the only step that needs pandas."""
+        import pandas as pd
+        from .communities import (
+            clean_offerings, cluster_size_codes, feature_multipliers, location_codes,
+            preservation_fees
+        )
+
+        with timer.stage("merge"):
+            df = df_needs[HEADERS_NEEDS].join(df_wants[HEADERS_WANTS], how="inner")
+            df = df.sort_values(by=HOME_TOT_KEY, kind="stable")
+            df = clean_offerings(df)
+        with timer.stage("cluster"):
+            size = cluster_size_codes(df[HOME_TOT_KEY].to_numpy(dtype=float))
+        with timer.stage("multipliers"):
+            multipliers = feature_multipliers(df)
+        columns, categories = {}, {}
+        for key in HEADERS_NEEDS + HEADERS_WANTS:
+            col = df[key]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                columns[key] = col.cat.codes.to_numpy()
+                categories[key] = col.cat.categories.to_numpy()
+            else:
+                columns[key] = col.to_numpy()
+        store = cls(
+            names=df.index.to_numpy(),
+            columns=columns,
+            categories=categories,
+            multipliers=multipliers,
+            location=location_codes(df[LOC_KEY]),
+            size=size,
+            preservation_fee=preservation_fees(df[PRES_KEY],
+                                               df[PRICE_AVG_KEY].to_numpy(dtype=float))
+        )
+        logger.info(f"Loaded {len(store)} communities into the community store")
+        return store
+
+    def lookup(self, names: list) -> list:
+        """Rows of the communities by name, None for unknown names."""
+        return [self.row_of.get(name) for name in names]
+
+    def value(self, key: str, row: int):
+        """Value of a spreadsheet column for a row, decoding categorical codes."""
+        value = self.columns[key][row]
+        if key in self.categories:
+            return self.categories[key][value] if value >= 0 else None
+        return value
+
+    def filter(self, hb_needs: dict) -> np.ndarray:
+        """Rows of the communities meeting the homebuyer needs."""
+        total_cost = self.total_cost(hb_needs.get("total_cost_years", TCO_YEARS)) \
+                     if "max_total_cost" in hb_needs else None
+        mask = needs_mask(hb_needs, self.price_low, self.price_high,
+                          self.home_age, self.location, self.size, total_cost)
+        return np.flatnonzero(mask)
+
+    def total_cost(self, years: int) -> np.ndarray:
+        """Total cost of ownership of every community over `years` (see
+        `total_costs`), computed once per store and horizon."""
+        cost = self.derived_cache.get(("total_cost", years))
+        if cost is None:
+            cost = total_costs(self.columns[PRICE_AVG_KEY].astype(float),
+                               self.columns[HOA_KEY].astype(float),
+                               self.preservation_fee, years)
+            self.derived_cache[("total_cost", years)] = cost
+        return cost
+
+    def score(self, hb_wants: dict, rows: np.ndarray) -> np.ndarray:
+        """Score the communities in `rows` by homebuyer wants."""
+        prefs = feature_preferences(hb_wants)
+        return sum_contributions(feature_contributions(self.multipliers[rows], prefs))
+
+    def rank(self, rows: np.ndarray, scores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Rank the communities in `rows` by highest to lowest score. Ties keep
+        the store order. Returns the ranked rows and their scores."""
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+    def sort_index(self, key: str, order: str, years: int = TCO_YEARS) -> np.ndarray:
+        """All rows ordered by a `SORT_KEYS` column ("asc" or "desc"), built
+        once per store (and horizon of the total cost). Missing values come
+        last and ties keep the store order."""
+        cache_key = ("sort_index", key, order, years if key == "total_cost" else None)
+        index = self.derived_cache.get(cache_key)
+        if index is None:
+            column = SORT_KEYS[key][0]
+            values = self.total_cost(years) if column is None else self.columns[column].astype(float)
+            index = np.argsort(values if order == "asc" else -values, kind="stable")
+            self.derived_cache[cache_key] = index
+        return index
+
+    def sort(self, rows: np.ndarray, scores: np.ndarray, key: str, order: str,
+             years: int = TCO_YEARS) -> tuple[np.ndarray, np.ndarray]:
+        """Order the communities in `rows` (in any order) by a `SORT_KEYS`
+        column by walking its presorted index, without sorting. Returns the
+        ordered rows and their scores."""
+        index = self.sort_index(key, order, years)
+        member = np.zeros(len(self), dtype=bool)
+        member[rows] = True
+        row_scores = np.empty(len(self))
+        row_scores[rows] = scores
+        rows = index[member[index]]
+        return rows, row_scores[rows]
+
+    def rank_of(self, rows: list, filtered: np.ndarray, scores: np.ndarray,
+                hb_wants: dict) -> tuple[np.ndarray, np.ndarray, list]:
+        """Scores of the communities in `rows` and their ranks (see
+        `rank_position`) among the `filtered` communities of the given scores,
+        None if they are not among them. Returns the rows as an array, their
+        scores and their ranks."""
+        rows = np.asarray(rows, dtype=int)
+        row_scores = self.score(hb_wants, rows)
+        position = np.full(len(self), -1)
+        position[filtered] = np.arange(len(filtered))
+        ranks = []
+        for i,row in enumerate(rows.tolist()):
+            j = position[row]
+            if j < 0:
+                ranks.append(None)
+                continue
+            row_scores[i] = scores[j]  # as ranked, e.g. after a what-if rescore
+            ranks.append(rank_position(filtered, scores, row, row_scores[i]))
+        return rows, row_scores, ranks
+
+    def rescore(self, rows: np.ndarray, scores: np.ndarray, hb_wants: dict,
+                hb_wants_new: dict) -> tuple[np.ndarray, np.ndarray]:
+        """Scores of the communities in `rows` after the homebuyer wants change,
+        updated from their `scores` under `hb_wants` by the contributions of the
+        changed features only. Returns the rows in store order (ready to `rank`)
+        and their new scores, which may differ from a full `score` by rounding."""
+        prefs, prefs_new = feature_preferences(hb_wants), feature_preferences(hb_wants_new)
+        order = np.argsort(rows, kind="stable")
+        rows, scores = rows[order], scores[order]
+        for j in np.flatnonzero(prefs != prefs_new):
+            mults = self.multipliers[rows, j:j+1]
+            delta = feature_contributions(mults, prefs_new[j:j+1]) \
+                    - feature_contributions(mults, prefs[j:j+1])
+            scores = scores + delta[:, 0]
+        return rows, scores
+
+    def explain(self, rows: np.ndarray, hb_wants: dict) -> np.ndarray:
+        """Score each feature contributes to the communities in `rows` (in
+        `FEATURE_KEYS` order). Summed with `sum_contributions` they are the
+        scores of `score`."""
+        return feature_contributions(self.multipliers[rows], feature_preferences(hb_wants))
+
+    def records(self, rows: np.ndarray, scores: np.ndarray) -> list[CommunityRecord]:
+        """Record views of the communities in `rows`."""
+        return [CommunityRecord(self, row, score) for row,score in zip(rows, scores)]
+
+
+def compile_top_communities(store: CommunityStore, rows: np.ndarray,
+                            scores: np.ndarray, n: int, hb_wants: dict = None,
+                            cost_years: int = None) -> dict:
+    """Compile key information for the `n` highest ranked communities given the
+    ranked rows and scores of a store, with the score contribution of each
+    feature if the homebuyer wants are given and the total cost of ownership
+    if its horizon is given."""
+    records = store.records(rows[:n], scores[:n])
+    breakdowns = _feature_breakdowns(store, rows[:n], hb_wants)
+    costs = _total_cost_fields(store, rows[:n], cost_years)
+    return {
+        record.name: {**record.to_dict(), **cost, **breakdown}
+        for record,cost,breakdown in zip(records, costs, breakdowns)
+    }
+
+
+def compile_page(store: CommunityStore, rows: np.ndarray, scores: np.ndarray,
+                 offset: int, n: int, hb_wants: dict = None,
+                 cost_years: int = None) -> list[dict]:
+    """Compile key information for the `n` ranked communities from `offset`,
+    in rank order, with their name and rank (from 1), with the score
+    contribution of each feature if the homebuyer wants are given and the
+    total cost of ownership if its horizon is given."""
+    stop = offset + n
+    records = store.records(rows[offset:stop], scores[offset:stop])
+    breakdowns = _feature_breakdowns(store, rows[offset:stop], hb_wants)
+    costs = _total_cost_fields(store, rows[offset:stop], cost_years)
+    return [
+        {"rank": rank, "name": record.name, **record.to_dict(), **cost, **breakdown}
+        for rank,(record,cost,breakdown) in enumerate(zip(records, costs, breakdowns),
+                                                      start=offset + 1)
+    ]
+
+
+def compile_communities(store: CommunityStore, rows: np.ndarray, scores: np.ndarray,
+                        ranks: list, hb_wants: dict = None, cost_years: int = None) -> list[dict]:
+    """Compile key information for the communities in `rows` in the given
+    order, with their name, whether they meet the needs and their rank among
+    those that do (`ranks`, None if they do not), with the score contribution
+    of each feature if the homebuyer wants are given and the total cost of
+    ownership if its horizon is given."""
+    records = store.records(rows, scores)
+    breakdowns = _feature_breakdowns(store, rows, hb_wants)
+    costs = _total_cost_fields(store, rows, cost_years)
+    return [
+        {"rank": rank, "name": record.name, "meets_needs": rank is not None,
+         **record.to_dict(), **cost, **breakdown}
+        for rank,record,cost,breakdown in zip(ranks, records, costs, breakdowns)
+    ]
+
+
+def rank_position(rows: np.ndarray, scores: np.ndarray, row: int, score: float) -> int:
+    """Rank (from 1) a community of the given row and score has among the
+    communities in `rows` by counting those ranked before it (higher score,
+    or the same score earlier in the store) instead of sorting."""
+    return 1 + int(np.count_nonzero(scores > score)) \
+             + int(np.count_nonzero((scores == score) & (rows < row)))
+
+
+def compile_fronts(store: CommunityStore, rows: np.ndarray, scores: np.ndarray,
+                   fronts: np.ndarray, n: int, hb_wants: dict = None,
+                   cost_years: int = None) -> list[dict]:
+    """Compile the Pareto fronts (see `pareto_fronts`) of the ranked rows: the
+    size of every front and key information of its `n` highest ranked
+    communities, with the score contribution of each feature if the homebuyer
+    wants are given and the total cost of ownership if its horizon is given."""
+    compiled = []
+    for k in range(fronts.max(initial=-1) + 1):
+        idx = np.flatnonzero(fronts == k)
+        compiled.append({
+            "size": len(idx),
+            "communities": compile_page(store, rows[idx], scores[idx], 0, n, hb_wants,
+                                        cost_years)
+        })
+    return compiled
+
+
+def _feature_breakdowns(store: CommunityStore, rows: np.ndarray, hb_wants: dict) -> list[dict]:
+    """Score contribution of each feature (by homebuyer want) to the
+    communities in `rows`, as response fields. Empty if not requested."""
+    if hb_wants is None:
+        return [{}]*len(rows)
+    contributions = store.explain(rows, hb_wants)
+    return [
+        {"feature_contributions": {
+            FEATURE_PREFERENCES[key]: _output_value(c) for key,c in zip(FEATURE_KEYS, row)
+        }}
+        for row in contributions
+    ]
+
+
+def _total_cost_fields(store: CommunityStore, rows: np.ndarray, cost_years: int) -> list[dict]:
+    """Total cost of ownership over `cost_years` of the communities in `rows`,
+    as response fields. Empty if not requested."""
+    if cost_years is None:
+        return [{}]*len(rows)
+    costs = np.round(store.total_cost(cost_years)[rows])
+    return [{"total_cost": _output_value(c)} for c in costs]
+
+
+def _numeric(arr: np.ndarray) -> np.ndarray:
+    """Numeric view of a filter column, only copied if not already numeric."""
+    return arr if arr.dtype.kind in "iuf" else arr.astype(float)
+
+
+def _output_value(value):
+    """Convert an array element to a JSON serializable value."""
+    if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+        return MISSING_VALUE
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,24 @@
+import os
+
+import topshelfsoftware_aws_util
+import topshelfsoftware_util
+from topshelfsoftware_util.log import add_log_stream
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+MODULE_NAME = "run_ranking_canary"
+SRC_PATH = os.path.dirname(os.path.realpath(__file__))
+STATE_MACHINE_ARN = os.environ["STATE_MACHINE_ARN"]
+# latency budgets of a canary run, overridable per run in the event
+CANARY_P50_BUDGET_MS = float(os.environ.get("CANARY_P50_BUDGET_MS", "1500"))
+CANARY_P99_BUDGET_MS = float(os.environ.get("CANARY_P99_BUDGET_MS", "3000"))
+CANARY_COLD_BUDGET_MS = float(os.environ.get("CANARY_COLD_BUDGET_MS", "10000"))
+# profiles ranked per run and how many times each is ranked
+CANARY_N_PROFILES = int(os.environ.get("CANARY_N_PROFILES", "4"))
+CANARY_REPEAT = int(os.environ.get("CANARY_REPEAT", "3"))
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+[add_log_stream(logger) for logger in topshelfsoftware_aws_util.get_package_loggers()]
+[add_log_stream(logger) for logger in topshelfsoftware_util.get_package_loggers()]
@@ -0,0 +1,94 @@
+import json
+import time
+
+from botocore.exceptions import ClientError as BotoClientError
+
+from observability.profiling import profile_handler
+from observability.tracing import span, trace_handler
+from topshelfsoftware_aws_util.sfn import (
+    SfnStatus, get_exec_hist, launch_sfn, poll_sfn
+)
+from topshelfsoftware_util.json import fmt_json
+from topshelfsoftware_util.log import get_logger
+
+from .canary import (
+    canary_settings, emit_report, evaluate, load_profiles, rotation_index,
+    select_profiles
+)
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import MODULE_NAME, STATE_MACHINE_ARN
+TRIGGERED_BY = "RunRankingCanary"
+POLL_STEP_S = 0.1  # finer than the API's so the polling barely adds to the latency
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+@trace_handler("RunRankingCanary", MODULE_NAME)
+@profile_handler(MODULE_NAME)
+def lambda_handler(event, context):
+    logger.info(f"event: {fmt_json(event)}")
+    settings = canary_settings(event)
+    profiles = select_profiles(load_profiles(), settings["n_profiles"], rotation_index(event))
+    logger.info(f"canary profiles: {list(profiles)}")
+
+    # the first request of the run finds the workflow Lambdas cold
+    results = []
+    for _ in range(settings["repeat"]):
+        for name,profile in profiles.items():
+            results.append(run_ranking(name, profile))
+
+    report = evaluate(results, settings["budgets"])
+    emit_report(report)
+    if report["passed"]:
+        logger.info(f"canary passed: {fmt_json(report['latency_ms'])}")
+    else:
+        failed = [check for check,ok in report["checks"].items() if not ok]
+        logger.error(f"canary failed {failed}: {fmt_json(report['latency_ms'])}")
+    return report
+
+
+def run_ranking(name: str, profile: dict) -> dict:
+    """Rank a profile through the ranking workflow and return its latency,
+    status and the stage timings reported by the ranking."""
+    result = {"profile": name}
+    with span("ranking", profile=name) as s:
+        payload = {**profile, "timings": True, "triggered_by": TRIGGERED_BY,
+                   "trace": s.trace_context()}
+        start = time.perf_counter()
+        try:
+            execution_arn = launch_sfn(STATE_MACHINE_ARN, payload=payload)
+            sfn_resp = poll_sfn(execution_arn, step=POLL_STEP_S)
+        except BotoClientError as e:
+            logger.error(f"Boto3 Client Exception: {e}")
+            result["latency_ms"] = round((time.perf_counter() - start)*1000, 3)
+            result["status"] = "ClientError"
+            return result
+        result["latency_ms"] = round((time.perf_counter() - start)*1000, 3)
+        result["status"] = sfn_resp["status"]
+
+        if sfn_resp["status"] == SfnStatus.SUCCEEDED.value:
+            timings = json.loads(str(sfn_resp["output"])).get("timings", {})
+            result["dataset_version"] = timings.get("dataset_version")
+            result["dataset_cache"] = timings.get("dataset_cache")
+            result["stages_ms"] = {k: v["duration_ms"] for k,v in timings.get("stages", {}).items()}
+            s.set_attribute("dataset_version", result["dataset_version"])
+        else:
+            result["error"] = get_failure_error(execution_arn)
+            logger.error(f"ranking of profile {name} failed: {result['error']}")
+    return result
+
+
+def get_failure_error(execution_arn: str) -> str:
+    """Error name of a failed execution, from its history."""
+    fail_param = "executionFailedEventDetails"
+    for exec in get_exec_hist(execution_arn)["events"]:
+        if fail_param in exec:
+            return exec[fail_param]["error"]
+    return None
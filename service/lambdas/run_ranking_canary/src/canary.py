@@ -0,0 +1,129 @@
+"""Profile rotation, latency budgets and the report of a canary run."""
+
+from datetime import datetime, timezone
+import json
+import math
+import os
+import time
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from .__init__ import (
+    MODULE_NAME, SRC_PATH, CANARY_P50_BUDGET_MS, CANARY_P99_BUDGET_MS,
+    CANARY_COLD_BUDGET_MS, CANARY_N_PROFILES, CANARY_REPEAT
+)
+PROFILES_FILE = os.path.join(SRC_PATH, "canary_profiles.json")
+METRICS_NAMESPACE = "RealEstateCommunityRanking"
+METRICS_DIMENSION = "Module"
+SECONDS_PER_DAY = 86400
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"{MODULE_NAME}.{__name__}")
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def canary_settings(event: dict) -> dict:
+    """Budgets and size of the run: the event's values over the env defaults."""
+    budgets = {
+        "p50_ms": CANARY_P50_BUDGET_MS,
+        "p99_ms": CANARY_P99_BUDGET_MS,
+        "cold_ms": CANARY_COLD_BUDGET_MS,
+        **event.get("budgets", {})
+    }
+    return {
+        "budgets": budgets,
+        "n_profiles": int(event.get("n_profiles", CANARY_N_PROFILES)),
+        "repeat": int(event.get("repeat", CANARY_REPEAT)),
+    }
+
+
+def load_profiles() -> dict:
+    """Representative homebuyer profiles, by name."""
+    with open(PROFILES_FILE, "r") as fp:
+        return json.load(fp)
+
+
+def rotation_index(event: dict) -> int:
+    """Rotation of the run: the event's "rotation", else the day of the
+    scheduled event (days since the epoch)."""
+    if "rotation" in event:
+        return int(event["rotation"])
+    if "time" in event:  # EventBridge scheduled events
+        when = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
+    else:
+        when = datetime.now(timezone.utc)
+    return int(when.timestamp()) // SECONDS_PER_DAY
+
+
+def select_profiles(profiles: dict, n_profiles: int, rotation: int) -> dict:
+    """`n_profiles` consecutive profiles (wrapping around) starting at an
+    offset that moves with the rotation, so successive runs cover them all."""
+    names = sorted(profiles)
+    n_profiles = min(n_profiles, len(names))
+    offset = (rotation*n_profiles) % len(names)
+    return {name: profiles[name] for name in (names + names)[offset:offset + n_profiles]}
+
+
+def evaluate(results: list[dict], budgets: dict) -> dict:
+    """Report of a run: cold (first request) and warm latencies against the
+    budgets. The run fails if any budget is exceeded or any ranking failed."""
+    latencies = [r["latency_ms"] for r in results]
+    warm = latencies[1:] or latencies
+    latency_ms = {
+        "cold_ms": round(latencies[0], 3),
+        "p50_ms": round(percentile(warm, 50), 3),
+        "p99_ms": round(percentile(warm, 99), 3),
+    }
+    n_errors = sum(r["status"] != "SUCCEEDED" for r in results)
+    checks = {key: latency_ms[key] <= budget for key,budget in budgets.items()}
+    checks["errors"] = n_errors == 0
+    dataset_versions = sorted({r["dataset_version"] for r in results if r.get("dataset_version")})
+    return {
+        "passed": all(checks.values()),
+        "checks": checks,
+        "latency_ms": latency_ms,
+        "budgets": budgets,
+        "n_requests": len(results),
+        "n_errors": n_errors,
+        "dataset_versions": dataset_versions,
+        "requests": results,
+    }
+
+
+def emit_report(report: dict):
+    """Log the outcome of the run as an EMF record (CloudWatch metrics to
+    alarm on). CloudWatch only parses EMF from lines that are a bare JSON
+    object, so the record bypasses the logger."""
+    metrics = {
+        **report["latency_ms"],
+        "errors": report["n_errors"],
+        "failed": int(not report["passed"]),
+    }
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time()*1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [[METRICS_DIMENSION]],
+                "Metrics": [
+                    {"Name": key, "Unit": "Milliseconds" if key.endswith("_ms") else "Count"}
+                    for key in metrics
+                ]
+            }]
+        },
+        METRICS_DIMENSION: MODULE_NAME,
+        **metrics,
+        "dataset_versions": report["dataset_versions"],
+    }
+    print(json.dumps(record), flush=True)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p/100*len(values)) - 1)]
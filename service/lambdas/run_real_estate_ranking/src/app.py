@@ -3,11 +3,14 @@ import json
 
 from botocore.exceptions import ClientError as BotoClientError
 
+from observability.profiling import profile_handler
+from observability.tracing import current_span, span, trace_handler
 from topshelfsoftware_aws_util.sfn import (
     SfnStatus, get_exec_hist, launch_sfn, poll_sfn
 )
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
+
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
@@ -15,6 +18,7 @@ from .__init__ import MODULE_NAME, STATE_MACHINE_ARN
 KNOWN_ERRORS = {
     "ValidationError": HTTPStatus.BAD_REQUEST,
     "UnprocessableContentError": HTTPStatus.UNPROCESSABLE_ENTITY,
+    "InvalidCursorError": HTTPStatus.BAD_REQUEST,
     # if a worksheet cannot be found when running rankings, this is our fault
     "WorksheetNotFoundError": HTTPStatus.INTERNAL_SERVER_ERROR
 }
@@ -27,6 +31,8 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("RunRealEstateRanking", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
 
@@ -38,15 +44,22 @@ def lambda_handler(event, context):
     logger.info(f"event body: {fmt_json(body)}")
 
     status = HTTPStatus.OK
+    # set when a client call fails, a failed workflow reports its own error
+    err_msg = err_type = None
+    # forward the trace context so the workflow's spans join this request
+    trace = current_span().trace_context()
+    body["trace"] = trace
     resp_body = {
         "metadata": {
-            "stateMachineArn": STATE_MACHINE_ARN
+            "stateMachineArn": STATE_MACHINE_ARN,
+            "correlationId": trace["correlation_id"]
         }
     }
 
     # launch the stepfunction
     try:
-        execution_arn = launch_sfn(STATE_MACHINE_ARN, payload=body)
+        with span("launch_sfn"):
+            execution_arn = launch_sfn(STATE_MACHINE_ARN, payload=body)
         resp_body["metadata"]["executionArn"] = execution_arn
     except BotoClientError as e:
         status = HTTPStatus.BAD_GATEWAY
@@ -63,7 +76,8 @@ def lambda_handler(event, context):
     
     # poll the stepfunction
     try:
-        sfn_resp = poll_sfn(execution_arn, step=0.5)
+        with span("poll_sfn"):
+            sfn_resp = poll_sfn(execution_arn, step=0.5)
         resp_status = sfn_resp["status"]
         resp_body["status"] = resp_status
         
@@ -81,9 +95,14 @@ def lambda_handler(event, context):
         if output:
             resp_body["output"] = json.loads(str(output))
             logger.info(f"output: {output}")
+            # stage timings requested by the caller belong with the metadata
+            timings = resp_body["output"].pop("timings", None)
+            if timings is not None:
+                resp_body["metadata"]["timings"] = timings
         
         if resp_status == SfnStatus.FAILED.value:
-            exec_history = get_exec_hist(execution_arn)
+            with span("get_exec_hist"):
+                exec_history = get_exec_hist(execution_arn)
             
             fail_param = "executionFailedEventDetails"            
             for exec in exec_history["events"]:
@@ -98,6 +117,8 @@ def lambda_handler(event, context):
                         resp_body["error"] = json.loads(exec[fail_param]["cause"])
                     except:
                         resp_body["error"] = exec[fail_param]["cause"]
+                    else:
+                        resp_body["error"] = unpack_error_details(resp_body["error"])
                     break
             
             if resp_body.get("error") is None:
@@ -113,12 +134,26 @@ def lambda_handler(event, context):
         err_type = status.phrase
     finally:
         if status in [HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY]:
-            logger.error(err_msg)
+            if err_msg is not None:
+                logger.error(err_msg)
             return fmt_lambda_resp(status, resp_body, err_msg, err_type)
 
     return fmt_lambda_resp(status, resp_body)
 
 
+def unpack_error_details(error: dict) -> dict:
+    """Error of a failed workflow Lambda with the details its message carries
+    as JSON (e.g. the suggested relaxations of an unprocessable ranking)
+    moved next to the message."""
+    try:
+        details = json.loads(error["errorMessage"])
+    except (KeyError, TypeError, ValueError):
+        return error
+    if not isinstance(details, dict) or "message" not in details:
+        return error
+    return {**error, "errorMessage": details.pop("message"), **details}
+
+
 def fmt_lambda_resp(status: HTTPStatus, body: dict,
                     err_msg: str = None, err_type: str = None) -> dict:
     """Format the Lambda response."""
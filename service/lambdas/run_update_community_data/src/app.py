@@ -4,11 +4,14 @@ import json
 
 from botocore.exceptions import ClientError as BotoClientError
 
+from observability.profiling import profile_handler
+from observability.tracing import current_span, span, trace_handler
 from topshelfsoftware_aws_util.sfn import (
     SfnStatus, get_exec_hist, launch_sfn, poll_sfn
 )
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
+
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
@@ -26,6 +29,8 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("RunUpdateCommunityData", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
     payload_base64_encoded = event["body"]
@@ -47,18 +52,24 @@ def lambda_handler(event, context):
     bin_data_base64_bytes = base64.b64encode(bin_data)
     bin_data_base64_str = bin_data_base64_bytes.decode("utf-8")
     logger.info(f"binary data base64 encoded string: {bin_data_base64_str}")
-    payload = {"xlsx_base64_encoded": bin_data_base64_str}
+    # forward the trace context so the workflow's spans join this request
+    trace = current_span().trace_context()
+    payload = {"xlsx_base64_encoded": bin_data_base64_str, "trace": trace}
 
     status = HTTPStatus.OK
+    # set when a client call fails, a failed workflow reports its own error
+    err_msg = err_type = None
     resp_body = {
         "metadata": {
-            "stateMachineArn": STATE_MACHINE_ARN
+            "stateMachineArn": STATE_MACHINE_ARN,
+            "correlationId": trace["correlation_id"]
         }
     }
 
     # launch the stepfunction
     try:
-        execution_arn = launch_sfn(STATE_MACHINE_ARN, payload=payload)
+        with span("launch_sfn"):
+            execution_arn = launch_sfn(STATE_MACHINE_ARN, payload=payload)
         resp_body["metadata"]["executionArn"] = execution_arn
     except BotoClientError as e:
         status = HTTPStatus.BAD_GATEWAY
@@ -75,7 +86,8 @@ def lambda_handler(event, context):
     
     # poll the stepfunction
     try:
-        sfn_resp = poll_sfn(execution_arn, step=0.5)
+        with span("poll_sfn"):
+            sfn_resp = poll_sfn(execution_arn, step=0.5)
         resp_status = sfn_resp["status"]
         resp_body["status"] = resp_status
         
@@ -95,7 +107,8 @@ def lambda_handler(event, context):
             logger.info(f"output: {output}")
         
         if resp_status == SfnStatus.FAILED.value:
-            exec_history = get_exec_hist(execution_arn)
+            with span("get_exec_hist"):
+                exec_history = get_exec_hist(execution_arn)
             
             fail_param = "executionFailedEventDetails"
             for exec in exec_history["events"]:
@@ -125,7 +138,8 @@ def lambda_handler(event, context):
         err_type = status.phrase
     finally:
         if status in [HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY]:
-            logger.error(err_msg)
+            if err_msg is not None:
+                logger.error(err_msg)
             return fmt_lambda_resp(status, resp_body, err_msg, err_type)
 
     return fmt_lambda_resp(status, resp_body)
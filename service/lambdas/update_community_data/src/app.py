@@ -2,9 +2,12 @@ import base64
 
 from botocore.exceptions import ClientError as BotoClientError
 
+from observability.profiling import profile_handler
+from observability.tracing import current_span, trace_handler
 from topshelfsoftware_aws_util.client import create_boto3_client
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
+
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
@@ -21,6 +24,8 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("UpdateCommunityData", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
     
@@ -42,9 +47,12 @@ def lambda_handler(event, context):
         raise e
     version_id = resp["VersionId"]
     logger.info(f"s3 obj version id: {version_id}")
+    current_span().set_attribute("dataset_version", version_id)
     
     return {
         "s3_bucket": COMMUNITY_DATA_BUCKET_NAME,
         "s3_object": COMMUNITY_DATA_OBJECT_NAME,
-        "s3_version_id": version_id
+        "s3_version_id": version_id,
+        # the cache warm-up that follows joins the trace of the upload
+        "trace": current_span().trace_context()
     }
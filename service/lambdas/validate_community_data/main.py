@@ -1,6 +1,16 @@
 import argparse
 import base64
+import glob
+import os
+import sys
 
+# the layers are on the path of the deployed Lambdas, add them for local runs
+LAYERS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, "layers")
+sys.path.extend(glob.glob(os.path.join(LAYERS_PATH, "*", "python")))
+
+from observability.profiling import (
+    DEFAULT_PROFILE_PATH, PROFILE_HANDLER_ENV_VAR, PROFILE_PATH_ENV_VAR
+)
 from topshelfsoftware_util.log import get_logger
 
 from src.app import lambda_handler
@@ -19,7 +29,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--excel-file", dest="excel_file", type=str, required=False,
                         help="Excel file containing community spreadsheet data")
+    parser.add_argument("--profile", dest="profile", type=str, nargs="?",
+                        const=DEFAULT_PROFILE_PATH, required=False,
+                        help="Profile the invocation and write the profile to this " \
+                             f"local dir or s3 URL (default: {DEFAULT_PROFILE_PATH})")
     args = parser.parse_args()
+    if args.profile is not None:
+        os.environ[PROFILE_HANDLER_ENV_VAR] = "true"
+        os.environ[PROFILE_PATH_ENV_VAR] = args.profile
 
     event = {}
     if args.excel_file is not None:
@@ -4,14 +4,18 @@ import numbers
 
 import pandas as pd
 
+from observability.profiling import profile_handler
+from observability.tracing import trace_handler
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
 
 from . import communities
 from .enum_needs import Location
-from .enum_wants import HasFeature, GolfCourseQuality, TrailsQuality
+from .enum_wants import (
+    HasFeature, GOLF_COURSE_QLTY_CODES, TRAILS_QLTY_CODES, quality_key
+)
 from .excel import read_excel_sheet
-from .helpers import ignore_space_and_case, lists_equal
+from .helpers import ignore_space_and_case, is_fee, lists_equal
 # ----------------------------------------------------------------------------#
 #                               --- Globals ---                               #
 # ----------------------------------------------------------------------------#
@@ -21,12 +25,8 @@ from .communities import (
 )
 LOCATION_ALLOWED_VALS = [l.value for l in Location]
 HAS_FEATURE_ALLOWED_VALS = [hf.value for hf in HasFeature]
-GOLF_COURSE_QLTY_ALLOWED_VALS = [
-    ignore_space_and_case(gcq.value) for gcq in GolfCourseQuality
-]
-TRAILS_QLTY_ALLOWED_VALS = [
-    ignore_space_and_case(tq.value) for tq in TrailsQuality
-]
+GOLF_COURSE_QLTY_ALLOWED_VALS = list(GOLF_COURSE_QLTY_CODES)  # same lookup used for scoring
+TRAILS_QLTY_ALLOWED_VALS = list(TRAILS_QLTY_CODES)
 
 # ----------------------------------------------------------------------------#
 #                               --- Logging ---                               #
@@ -36,6 +36,8 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("ValidateCommunityData", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
     
@@ -65,7 +67,7 @@ def lambda_handler(event, context):
         communities.HOA_KEY: { "type_": numbers.Number },
         communities.HOME_TOT_KEY: { "type_": numbers.Number },
         communities.HOME_AGE_KEY: { "type_": int },
-        # communities.PRES_KEY: { "type_": numbers.Number }  # this column allows multiple data types
+        # communities.PRES_KEY allows multiple data types, see below
         communities.LINK_KEY: { "type_": str, "nan_allowed": True },
     }
 
@@ -78,6 +80,13 @@ def lambda_handler(event, context):
             f"sheet '{SHEET_NAME_NEEDS}', column '{col}' data must be of type {str(data_types['type_'])}"
         logger.info(f"sheet '{SHEET_NAME_NEEDS}', column '{col}' data is of type {str(data_types['type_'])}")
     
+    # preservation fees are a dollar amount or a percentage of the sale price,
+    # parsed once when RankCommunities loads the dataset
+    for fee in df_needs[communities.PRES_KEY].values.tolist():
+        assert(is_fee(fee)), \
+            f"sheet '{SHEET_NAME_NEEDS}', column '{communities.PRES_KEY}' data must be a number or a percentage of the sale price"
+    logger.info(f"sheet '{SHEET_NAME_NEEDS}', column '{communities.PRES_KEY}' data is a number or a percentage of the sale price")
+
     for loc in df_needs[communities.LOC_KEY].values.tolist():
         loc_list = loc.split('/')
         assert(validate_data(loc_list, LOCATION_ALLOWED_VALS)), \
@@ -114,7 +123,7 @@ def lambda_handler(event, context):
     for val in df_wants[communities.GOLF_COURSE_QLTY_KEY].values.tolist():
         if pd.isna(val):
             continue  # ignore nan values
-        val_list = [ignore_space_and_case(val).split('=')[0]]  # grab just the 1st element of the split
+        val_list = [quality_key(val)]
         assert(validate_data(val_list, GOLF_COURSE_QLTY_ALLOWED_VALS)), \
             f"sheet '{SHEET_NAME_WANTS}', column '{communities.GOLF_COURSE_QLTY_KEY}' does not contain allowed values: {GOLF_COURSE_QLTY_ALLOWED_VALS}"
     logger.info(f"sheet '{SHEET_NAME_WANTS}', column '{communities.GOLF_COURSE_QLTY_KEY}' data contains only allowed values: {GOLF_COURSE_QLTY_ALLOWED_VALS}")
@@ -122,7 +131,7 @@ def lambda_handler(event, context):
     for val in df_wants[communities.TRAILS_QLTY_KEY].values.tolist():
         if pd.isna(val):
             continue  # ignore nan values
-        val_list = [ignore_space_and_case(val)]
+        val_list = [quality_key(val)]
         assert(validate_data(val_list, TRAILS_QLTY_ALLOWED_VALS)), \
             f"sheet '{SHEET_NAME_WANTS}', column '{communities.TRAILS_QLTY_KEY}' does not contain allowed values: {TRAILS_QLTY_ALLOWED_VALS}"
     logger.info(f"sheet '{SHEET_NAME_WANTS}', column '{communities.TRAILS_QLTY_KEY}' data contains only allowed values: {TRAILS_QLTY_ALLOWED_VALS}")
@@ -21,3 +21,19 @@ class TrailsQuality(str, Enum):
     OK = "OK"
     GOOD = "GOOD"
     GREAT = "GREAT"
+
+
+def quality_key(quality: str) -> str:
+    """Normalize a quality rating for an exact lookup: spaces removed, upper case
+    and anything after an '=' dropped (e.g. 'OK= (executive)' -> 'OK')."""
+    return quality.replace(" ", "").upper().split("=")[0]
+
+
+def quality_lookup(quality_enum: Enum) -> dict:
+    """Map each normalized rating of a quality enum to its ordinal code
+    (position in the enum, lowest quality first)."""
+    return {quality_key(q.value): i for i,q in enumerate(quality_enum)}
+
+
+GOLF_COURSE_QLTY_CODES = quality_lookup(GolfCourseQuality)
+TRAILS_QLTY_CODES = quality_lookup(TrailsQuality)
@@ -1,4 +1,5 @@
 from io import BytesIO
+import logging
 from typing import Union
 
 import numpy as np
@@ -42,5 +43,6 @@ def read_excel_sheet(xlsx: Union[str, BytesIO],
     df[pk].replace(to_replace='', value=np.nan, inplace=True)
     df = df[df[pk].notnull()]  # drop row if PK cell is NaN
     df.set_index(pk, inplace=True)
-    logger.debug(df.to_string())
+    if logger.isEnabledFor(logging.DEBUG):  # formatting large sheets is costly
+        logger.debug(df.to_string())
     return df
@@ -1,5 +1,15 @@
 """Helper functions module to support imports and keep lambda_handler clean."""
 
+import numbers
+import re
+
+import pandas as pd
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PERCENTAGE_PATTERN = re.compile(r"(\d*\.?\d+)\s*%")
+PERCENTAGE_OF_PATTERN = re.compile(r"\s*of\s*", re.IGNORECASE)  # joins a rate of a rate
+
 
 def ignore_space_and_case(s: str,
                           ignore_spaces: bool = True,
@@ -15,3 +25,21 @@ def ignore_space_and_case(s: str,
 def lists_equal(list_1: list, list_2: list) -> bool:
     """Compares two lists for element equality."""
     return len(list_1) == len(list_2) and sorted(list_1) == sorted(list_2)
+
+
+def is_fee(value) -> bool:
+    """Checks a fee cell is missing, a dollar amount or a percentage of the
+    sale price (e.g. '.25% of Sale Price', or '.5% of 1% of price'), the forms
+    RankCommunities parses."""
+    if pd.isna(value) or isinstance(value, numbers.Number):
+        return True
+    text = str(value)
+    matches = list(PERCENTAGE_PATTERN.finditer(text))
+    if matches:
+        joins = [text[a.end():b.start()] for a,b in zip(matches, matches[1:])]
+        return all(PERCENTAGE_OF_PATTERN.fullmatch(j) for j in joins)
+    try:
+        float(text.replace("$", "").replace(",", ""))
+    except ValueError:
+        return False
+    return True
@@ -1,5 +1,7 @@
 import json
 
+from observability.profiling import profile_handler
+from observability.tracing import trace_handler
 from topshelfsoftware_util.json import fmt_json
 from topshelfsoftware_util.log import get_logger
 
@@ -17,6 +19,8 @@ logger = get_logger(f"{MODULE_NAME}.{__name__}")
 # ----------------------------------------------------------------------------#
 #                                 --- MAIN ---                                #
 # ----------------------------------------------------------------------------#
+@trace_handler("ValidateInputs", MODULE_NAME)
+@profile_handler(MODULE_NAME)
 def lambda_handler(event, context):
     logger.info(f"event: {fmt_json(event)}")
 
@@ -33,8 +33,20 @@ def validate_payload(payload: dict):
     payload_schema = load_json_schema(PAYLOAD_SCHEMA_FILE)
     try:
         jsonschema.validate(instance=payload, schema=payload_schema)
+        if "what_if" in payload:
+            # the changed needs and wants must make a valid profile too
+            jsonschema.validate(instance=apply_what_if(payload), schema=payload_schema)
         logger.info("Payload structure is valid per JSON schema")
     except jsonschema.ValidationError as e:
         logger.error(e)
         raise e
     return
+
+
+def apply_what_if(payload: dict) -> dict:
+    """Payload of the profile changed by its what-if delta."""
+    what_if = payload["what_if"]
+    changed = {k: v for k,v in payload.items() if k != "what_if"}
+    changed["needs"] = {**payload["needs"], **what_if.get("needs", {})}
+    changed["wants"] = {**payload["wants"], **what_if.get("wants", {})}
+    return changed
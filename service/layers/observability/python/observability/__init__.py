@@ -0,0 +1,2 @@
+"""Profiling and tracing of the Lambda handlers, shared by all Lambdas of the
+service through the observability layer."""
@@ -0,0 +1,162 @@
+"""Opt-in cProfile capture of Lambda invocations.
+
+Profiling is enabled for every invocation with PROFILE_HANDLER=true or for a
+random fraction of invocations with PROFILE_SAMPLE_RATE (e.g. 0.01). Each
+profiled invocation writes two files named after its request ID to
+PROFILE_PATH, a local directory or an s3://bucket/prefix URL:
+
+    <request_id>.pstats     binary stats, open with `python -m pstats`
+    <request_id>.collapsed  collapsed stacks for flamegraph.pl or speedscope
+
+under a subdirectory (key prefix) named after the Lambda's module.
+"""
+
+from collections import defaultdict
+import cProfile
+import functools
+import os
+import pstats
+import random
+import shutil
+import tempfile
+import time
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PROFILE_HANDLER_ENV_VAR = "PROFILE_HANDLER"
+PROFILE_SAMPLE_RATE_ENV_VAR = "PROFILE_SAMPLE_RATE"
+PROFILE_PATH_ENV_VAR = "PROFILE_PATH"
+DEFAULT_PROFILE_PATH = os.path.join(tempfile.gettempdir(), "profiles")
+S3_URL_PREFIX = "s3://"
+MIN_STACK_FRACTION = 1e-4  # collapsed stacks below this share of the total are dropped
+PROFILER_DISABLE_NAME = "<method 'disable' of '_lsprof.Profiler' objects>"
+MAX_STACK_DEPTH = 128
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(__name__)
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def profile_handler(module: str):
+    """Decorate the Lambda handler of `module` to profile the invocations
+    selected by `profiling_enabled`. Other invocations only pay for reading
+    two env vars."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not profiling_enabled():
+                return handler(event, context)
+            # resolve the path before the handler can change the working dir
+            profile_path = get_profile_path()
+            request_id = getattr(context, "aws_request_id", None) \
+                or f"local-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(handler, event, context)
+            finally:
+                try:
+                    save_profile(profiler, profile_path, request_id, module)
+                except Exception as e:
+                    # never fail the invocation because its profile could not be saved
+                    logger.warning(f"failed to save profile of request {request_id}: {e}")
+        return wrapper
+    return decorator
+
+
+def profiling_enabled() -> bool:
+    """Whether to profile this invocation."""
+    if os.environ.get(PROFILE_HANDLER_ENV_VAR, "false").lower() == "true":
+        return True
+    sample_rate = float(os.environ.get(PROFILE_SAMPLE_RATE_ENV_VAR, 0) or 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def get_profile_path() -> str:
+    """Where to write profiles: an s3 URL or an absolute local directory."""
+    profile_path = os.environ.get(PROFILE_PATH_ENV_VAR) or DEFAULT_PROFILE_PATH
+    if profile_path.startswith(S3_URL_PREFIX):
+        return profile_path.rstrip("/")
+    return os.path.abspath(profile_path)
+
+
+def save_profile(profiler: cProfile.Profile, profile_path: str, request_id: str,
+                 module: str) -> list[str]:
+    """Write the pstats and collapsed stacks of a profile of `module`. Returns
+    their paths."""
+    profiler.create_stats()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pstats_fn = os.path.join(tmp_dir, f"{request_id}.pstats")
+        collapsed_fn = os.path.join(tmp_dir, f"{request_id}.collapsed")
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(pstats_fn)
+        with open(collapsed_fn, "w") as fp:
+            fp.write(collapsed_stacks(stats))
+
+        if profile_path.startswith(S3_URL_PREFIX):
+            from topshelfsoftware_aws_util.client import create_boto3_client
+            bucket, _, prefix = profile_path[len(S3_URL_PREFIX):].partition("/")
+            s3_client = create_boto3_client("s3")
+            paths = []
+            for fn in [pstats_fn, collapsed_fn]:
+                key = "/".join(p for p in [prefix, module, os.path.basename(fn)] if p)
+                s3_client.upload_file(fn, bucket, key)
+                paths.append(f"{S3_URL_PREFIX}{bucket}/{key}")
+        else:
+            out_dir = os.path.join(profile_path, module)
+            os.makedirs(out_dir, exist_ok=True)
+            paths = []
+            for fn in [pstats_fn, collapsed_fn]:
+                path = os.path.join(out_dir, os.path.basename(fn))
+                shutil.copyfile(fn, path)
+                paths.append(path)
+    logger.info(f"saved profile of request {request_id} to {', '.join(paths)}")
+    return paths
+
+
+def collapsed_stacks(stats: pstats.Stats) -> str:
+    """Fold a profile into collapsed stacks, one 'a;b;c <microseconds>' line
+    per call path with the self time spent at its end. cProfile only records
+    caller -> callee edges, so below the first call the time of a function is
+    split between its callers by their share of its cumulative time. A path
+    ends at a recursive call, so deeply recursive code (e.g. imports) is under
+    counted; the pstats file is exact."""
+    callees = defaultdict(list)
+    for func,(_, _, _, _, callers) in stats.stats.items():
+        for caller,edge in callers.items():
+            _, _, edge_tt, edge_ct = edge
+            callees[caller].append((func, edge_tt, edge_ct))
+    total_tt = sum(s[2] for s in stats.stats.values()) or 1
+    folded = defaultdict(float)
+
+    def walk(func, stack: list, self_time: float, share: float):
+        folded[";".join(_frame_name(f) for f in stack)] += self_time
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee,edge_tt,edge_ct in callees[func]:
+            callee_ct = stats.stats[callee][3]
+            callee_share = share*edge_ct/callee_ct if callee_ct else 0
+            if callee in stack or callee_share*callee_ct < MIN_STACK_FRACTION*total_tt:
+                continue  # recursion or negligible
+            walk(callee, stack + [callee], edge_tt*share, callee_share)
+
+    for func,(_, _, tt, _, callers) in stats.stats.items():
+        # the profiler records its own `disable` as a root, skip it
+        if not callers and func[2] != PROFILER_DISABLE_NAME:
+            walk(func, [func], tt, 1.0)
+    return "".join(
+        f"{stack} {round(t*1e6)}\n" for stack,t in folded.items() if round(t*1e6) > 0
+    )
+
+
+def _frame_name(func: tuple) -> str:
+    """Name of a pstats function key (file, line, name) as a stack frame."""
+    file_name, line, name = func
+    if file_name == "~":  # built-in
+        return name.replace(";", ":")
+    return f"{os.path.basename(file_name)}:{line}({name})".replace(";", ":")
+
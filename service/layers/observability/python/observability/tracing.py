@@ -0,0 +1,149 @@
+"""Request tracing across the API, state machine and worker Lambdas.
+
+The API entry creates a correlation ID (or takes it from the X-Correlation-Id
+header) and forwards it in the workflow payload under "trace" together with
+the ID of its span. Every handler records a span (start, end, module, stage,
+dataset version, ...) and logs it as a bare JSON line {"span": {...}} so the spans of
+a request can be joined across log groups (see tools/span_tree.py).
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+import uuid
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+TRACE_KEY = "trace"  # payload key carrying the trace context between Lambdas
+CORRELATION_ID_KEY = "correlation_id"
+PARENT_SPAN_ID_KEY = "parent_span_id"
+CORRELATION_ID_HEADER = "x-correlation-id"
+_local = threading.local()  # open spans of the thread's invocation, see _span_stack
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(__name__)
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class Span:
+    """A timed unit of work of a request."""
+    def __init__(self, name: str, correlation_id: str, parent_id: str = None,
+                 stage: str = None, module: str = None, **attributes):
+        self.name = name
+        self.correlation_id = correlation_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.stage = stage
+        self.module = module
+        self.attributes = attributes
+        self.start = None
+        self.end = None
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def trace_context(self) -> dict:
+        """Trace context to forward to downstream Lambdas in their payload."""
+        return {CORRELATION_ID_KEY: self.correlation_id, PARENT_SPAN_ID_KEY: self.span_id}
+
+    def to_dict(self) -> dict:
+        return {
+            "correlation_id": self.correlation_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "module": self.module,
+            "name": self.name,
+            "stage": self.stage,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start)*1000, 3),
+            "status": self.status,
+            **self.attributes
+        }
+
+
+@contextmanager
+def span(name: str, correlation_id: str = None, parent_id: str = None,
+         stage: str = None, module: str = None, **attributes):
+    """Record the enclosed block as a span. Without a correlation ID the span
+    joins the trace of the innermost open span (as its child)."""
+    span_stack = _span_stack()
+    if correlation_id is None and span_stack:
+        correlation_id = span_stack[-1].correlation_id
+        parent_id = parent_id or span_stack[-1].span_id
+        stage = stage or span_stack[-1].stage
+        module = module or span_stack[-1].module
+    s = Span(name, correlation_id or new_correlation_id(), parent_id, stage, module,
+             **attributes)
+    span_stack.append(s)
+    s.start = time.time()
+    try:
+        yield s
+    except Exception as e:
+        s.status = "error"
+        s.set_attribute("error", type(e).__name__)
+        raise
+    finally:
+        s.end = time.time()
+        span_stack.remove(s)
+        # bypass the logger so the line is plain JSON that log tooling can parse
+        print(json.dumps({"span": s.to_dict()}, default=str), flush=True)
+
+
+def trace_handler(stage: str, module: str):
+    """Decorate the Lambda handler of `module` to record its invocation as a
+    span of the workflow `stage`, continuing the trace found in the event if
+    any."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            trace = get_trace_context(event)
+            correlation_id = trace.get(CORRELATION_ID_KEY) or new_correlation_id()
+            logger.info(f"correlation id: {correlation_id}")
+            with span("lambda_handler", correlation_id, trace.get(PARENT_SPAN_ID_KEY), stage,
+                      module, request_id=getattr(context, "aws_request_id", None)):
+                return handler(event, context)
+        return wrapper
+    return decorator
+
+
+def get_trace_context(event) -> dict:
+    """Trace context of an event: the "trace" payload key of workflow events
+    or the correlation ID header of API events."""
+    if not isinstance(event, dict):
+        return {}
+    trace = event.get(TRACE_KEY)
+    if isinstance(trace, dict):
+        return trace
+    headers = event.get("headers") or {}
+    for header,value in headers.items():
+        if header.lower() == CORRELATION_ID_HEADER:
+            return {CORRELATION_ID_KEY: value}
+    return {}
+
+
+def current_span() -> Span:
+    """Innermost open span, None outside of a traced handler."""
+    span_stack = _span_stack()
+    return span_stack[-1] if span_stack else None
+
+
+def new_correlation_id() -> str:
+    return str(uuid.uuid4())
+
+
+def _span_stack() -> list:
+    """Open spans of the current thread, innermost last. Per thread so that
+    invocations run concurrently in one process (e.g. tools/local_sfn.py) do
+    not nest into each other."""
+    if not hasattr(_local, "span_stack"):
+        _local.span_stack = []
+    return _local.span_stack
@@ -8,9 +8,12 @@ PROJ_ROOT_PATH = os.path.join(
 )
 SERVICE_PATH = os.path.join(PROJ_ROOT_PATH, "service")
 LAMBDAS_PATH = os.path.join(SERVICE_PATH, "lambdas")
+LAYERS_PATH = os.path.join(SERVICE_PATH, "layers")
 sys.path.append(PROJ_ROOT_PATH)
 sys.path.append(SERVICE_PATH)
 sys.path.append(LAMBDAS_PATH)
+# the layers are on the path of the deployed Lambdas
+sys.path.extend(glob.glob(os.path.join(LAYERS_PATH, "*", "python")))
 
 # test file paths
 TEST_DATA_PATH = os.path.join(PROJ_ROOT_PATH, "tests", "data")
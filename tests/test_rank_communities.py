@@ -1,6 +1,11 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
 import os
+import subprocess
 import sys
 
+import numpy as np
 import pytest
 
 from topshelfsoftware_util.log import get_logger
@@ -27,15 +32,33 @@ os.environ["COMMUNITY_DATA_OBJECT_NAME"] = ""
 #                           --- Lambda Imports ---                            #
 # ----------------------------------------------------------------------------#
 sys.path.append(os.path.join(LAMBDAS_PATH, MODULE))
-from service.lambdas.rank_communities.src.app import lambda_handler
+from observability.profiling import PROFILE_HANDLER_ENV_VAR, PROFILE_PATH_ENV_VAR
+from service.lambdas.rank_communities.src.__init__ import TCO_YEARS
+from service.lambdas.rank_communities.src.app import (
+    lambda_handler, load_community_store, ranking_cache, result_cache
+)
+from service.lambdas.rank_communities.src.columns import (
+    PRIMARY_KEY, SCORE_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS
+)
 from service.lambdas.rank_communities.src.communities import (
-    pd, PRIMARY_KEY, SCORE_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS,
-    filter_communities, score_communities, rank_communities
+    pd, filter_communities, parse_fee, score_communities, rank_communities
+)
+from service.lambdas.rank_communities.src.enum_wants import (
+    GolfCourseQuality, GOLF_COURSE_QLTY_CODES, quality_key
+)
+from service.lambdas.rank_communities.src.excel import (
+    optimize_dtypes, read_excel_sheet
 )
-from service.lambdas.rank_communities.src.excel import read_excel_sheet
 from service.lambdas.rank_communities.src.exceptions import (
-    UnprocessableContentError, WorksheetNotFoundError
+    InvalidCursorError, UnprocessableContentError, WorksheetNotFoundError
+)
+from service.lambdas.rank_communities.src.metrics import StageTimer, current_rss_mb
+from service.lambdas.rank_communities.src.pagination import encode_cursor
+from service.lambdas.rank_communities.src.pareto import pareto_fronts
+from service.lambdas.rank_communities.src.shared import (
+    attach_feature_block, create_feature_block, filter_and_score
 )
+from service.lambdas.rank_communities.src.store import SORT_KEYS, CommunityStore
 
 # ----------------------------------------------------------------------------#
 #                                --- TESTS ---                                #
@@ -142,6 +165,555 @@ def test_07_lambda_handler_local_data(excel_file, event_file, get_event_as_dict)
         assert actual == expected
 
 
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_08_feature_block(excel_file, event_file, get_event_as_dict):
+    excel_fp = os.path.join(TEST_DATA_PATH, excel_file)
+    df_needs = read_excel_sheet(excel_fp, SHEET_NAME_NEEDS, PRIMARY_KEY)
+    df_wants = read_excel_sheet(excel_fp, SHEET_NAME_WANTS, PRIMARY_KEY)
+    store = CommunityStore.from_frames(df_needs.copy(), df_wants.copy())
+    with create_feature_block(store) as block:
+        worker_block = attach_feature_block(block.descriptor)
+        assert not worker_block.multipliers.flags.writeable
+        
+        # block must filter and score exactly like the DataFrame functions
+        mask = worker_block.filter(get_event_as_dict["needs"])
+        scores = worker_block.score(get_event_as_dict["wants"])
+        df_needs = filter_communities(df_needs, get_event_as_dict["needs"])
+        df_wants = score_communities(df_wants, get_event_as_dict["wants"])
+        assert sorted(worker_block.names[mask]) == sorted(df_needs.index)
+        for name,score in zip(worker_block.names, scores):
+            assert score == df_wants.loc[name, SCORE_KEY]
+
+        # a budget filters on the same total costs as the store
+        needs = {**get_event_as_dict["needs"], "max_total_cost": 700_000, "total_cost_years": 5}
+        assert np.array_equal(worker_block.total_cost(5), store.total_cost(5), equal_nan=True)
+        assert list(worker_block.names[worker_block.filter(needs)]) == \
+            list(store.names[store.filter(needs)])
+        worker_block.close()
+
+
+def test_09_scoring_without_pandas():
+    # workers attaching to a feature block must not pay for importing pandas
+    code = "import sys; import src.scoring, src.shared; assert 'pandas' not in sys.modules"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(LAMBDAS_PATH, MODULE))
+    assert proc.returncode == 0
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_10_community_store(excel_file, event_file, get_event_as_dict):
+    excel_fp = os.path.join(TEST_DATA_PATH, excel_file)
+    df_needs = read_excel_sheet(excel_fp, SHEET_NAME_NEEDS, PRIMARY_KEY)
+    df_wants = read_excel_sheet(excel_fp, SHEET_NAME_WANTS, PRIMARY_KEY)
+    store = CommunityStore.from_frames(df_needs, df_wants)
+    
+    # the store must rank exactly like the DataFrame functions
+    rows = store.filter(get_event_as_dict["needs"])
+    rows, scores = store.rank(rows, store.score(get_event_as_dict["wants"], rows))
+    df_needs = filter_communities(df_needs, get_event_as_dict["needs"])
+    df_wants = score_communities(df_wants, get_event_as_dict["wants"])
+    df = rank_communities(pd.merge(df_needs, df_wants, left_index=True, right_index=True))
+    assert store.names[rows].tolist() == df.index.tolist()
+    assert scores.tolist() == df[SCORE_KEY].tolist()
+
+    # the store is reused until the dataset changes
+    assert load_community_store(excel_fp) is load_community_store(excel_fp)
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_11_optimize_dtypes(excel_file, event_file, get_event_as_dict):
+    excel_fp = os.path.join(TEST_DATA_PATH, excel_file)
+    df_needs = read_excel_sheet(excel_fp, SHEET_NAME_NEEDS, PRIMARY_KEY)
+    df_wants = read_excel_sheet(excel_fp, SHEET_NAME_WANTS, PRIMARY_KEY)
+    store = CommunityStore.from_frames(df_needs.copy(), df_wants.copy())
+    lean_store = CommunityStore.from_frames(optimize_dtypes(df_needs.copy()),
+                                            optimize_dtypes(df_wants.copy()))
+    assert optimize_dtypes(df_wants.copy()).memory_usage(deep=True).sum() \
+        < df_wants.memory_usage(deep=True).sum()
+    
+    # filtering, scoring and output are unchanged by the leaner dtypes
+    rows = store.filter(get_event_as_dict["needs"])
+    assert lean_store.filter(get_event_as_dict["needs"]).tolist() == rows.tolist()
+    scores = store.score(get_event_as_dict["wants"], rows)
+    assert lean_store.score(get_event_as_dict["wants"], rows).tolist() == scores.tolist()
+    assert [r.to_dict() for r in lean_store.records(rows, scores)] \
+        == [r.to_dict() for r in store.records(rows, scores)]
+
+
+@pytest.mark.parametrize("quality,expected_value", [
+    ("OK", GolfCourseQuality.OK), ("Ok", GolfCourseQuality.OK),
+    ("OK= (executive)", GolfCourseQuality.OK),
+    ("OK-Good", GolfCourseQuality.OK_GOOD), ("OK - Good", GolfCourseQuality.OK_GOOD),
+    ("Good", GolfCourseQuality.GOOD), ("Very Good", GolfCourseQuality.VERY_GOOD),
+    ("Great", GolfCourseQuality.GREAT)
+])
+def test_12_quality_lookup(quality, expected_value):
+    # ratings resolve exactly, not by the first enum value they contain
+    code = GOLF_COURSE_QLTY_CODES[quality_key(quality)]
+    assert code == list(GolfCourseQuality).index(expected_value)
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_13_stage_timings(excel_file, event_file, get_event_as_dict, capsys):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    assert "timings" not in lambda_handler(event, None)  # only on request
+    capsys.readouterr()
+
+    event["timings"] = True
+    timings = lambda_handler(event, None)["timings"]
+    assert set(timings["stages"]) == {"filter", "score", "rank", "compile"}
+    assert timings["dataset_cache"] == "hit"
+    assert timings["process_peak_rss_mb"] > 0
+    # the peak memory is measured per stage, not only as the peak of the process
+    stage_peaks = set()
+    if sys.platform == "linux":
+        assert all(s["peak_rss_mb"] > 0 for s in timings["stages"].values())
+        stage_peaks = {f"{name}_peak_rss_mb" for name in timings["stages"]}
+
+    # the stages are also emitted as an EMF record
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()
+               if line.startswith('{"_aws"')]
+    assert len(records) == 1
+    metrics = records[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    assert {m["Name"] for m in metrics} == {
+        "filter_ms", "score_ms", "rank_ms", "compile_ms", "process_peak_rss_mb"
+    } | stage_peaks
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_14_profile_handler(excel_file, event_file, get_event_as_dict, monkeypatch, tmp_path):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    monkeypatch.setenv(PROFILE_HANDLER_ENV_VAR, "true")
+    monkeypatch.setenv(PROFILE_PATH_ENV_VAR, str(tmp_path))
+    context = type("Context", (), {"aws_request_id": "test-request-id"})()
+    lambda_handler(event, context)
+
+    profile_dir = tmp_path / MODULE
+    assert sorted(os.listdir(profile_dir)) == [
+        "test-request-id.collapsed", "test-request-id.pstats"
+    ]
+    stacks = (profile_dir / "test-request-id.collapsed").read_text().splitlines()
+    assert all(line.split(";")[0].startswith("app.py") for line in stacks)
+
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_15_trace_handler(excel_file, event_file, get_event_as_dict, capsys):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["trace"] = {"correlation_id": "test-correlation-id", "parent_span_id": "0123456789abcdef"}
+    lambda_handler(event, None)
+
+    spans = [json.loads(line)["span"] for line in capsys.readouterr().out.splitlines()
+             if line.startswith('{"span"')]
+    assert len(spans) == 1
+    assert spans[0]["correlation_id"] == "test-correlation-id"
+    assert spans[0]["parent_id"] == "0123456789abcdef"
+    assert spans[0]["stage"] == "RankCommunities"
+    assert spans[0]["module"] == MODULE
+    assert spans[0]["dataset_version"].startswith(os.path.abspath(event["excel_file"]))
+    assert spans[0]["status"] == "ok"
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_16_warm_up(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["timings"] = True
+    resp_cold = lambda_handler(event, None)
+    try:
+        summary = lambda_handler({"warmup": True, "excel_file": event["excel_file"]}, None)
+        assert summary["profiles_source"] == "packaged"
+        assert summary["n_cached"] > 0
+
+        # the order of a need's choices does not change the profile
+        for key,value in event["needs"].items():
+            if isinstance(value, list):
+                event["needs"][key] = value[::-1]
+        resp_warm = lambda_handler(event, None)
+        assert resp_warm["timings"]["result_cache"] == "hit"
+        assert "score" not in resp_warm["timings"]["stages"]
+        assert resp_warm["top_communities"] == resp_cold["top_communities"]
+    finally:
+        result_cache["dataset_version"] = None
+        result_cache["results"] = {}
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_17_paginated_ranking(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["timings"] = True
+    top_communities = lambda_handler(event, None)["top_communities"]
+
+    pages = []
+    resp = lambda_handler({**event, "page_size": 2}, None)
+    try:
+        assert resp["timings"]["ranking_cache"] == "miss"
+        pages.append(resp["communities"])
+        while resp["next_cursor"] is not None:
+            resp = lambda_handler({**event, "cursor": resp["next_cursor"]}, None)
+            # later pages slice the cached ranked order without rescoring
+            assert resp["timings"]["ranking_cache"] == "hit"
+            assert "score" not in resp["timings"]["stages"]
+            pages.append(resp["communities"])
+        ranked = [c for page in pages for c in page]
+        assert all(len(page) == 2 for page in pages[:-1])
+        assert [c["rank"] for c in ranked] == list(range(1, resp["n_communities_filtered"] + 1))
+        assert [c["name"] for c in ranked[:3]] == list(top_communities)
+
+        # cursors of another dataset version or profile are rejected
+        stale = encode_cursor("stale-version", "0"*16, 2, 2)
+        with pytest.raises(InvalidCursorError):
+            lambda_handler({**event, "cursor": stale}, None)
+        with pytest.raises(InvalidCursorError):
+            lambda_handler({**event, "cursor": "not-a-cursor"}, None)
+    finally:
+        ranking_cache.clear()
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_18_what_if(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["timings"] = True
+    try:
+        for wants in [{"gated": 6 - event["wants"]["gated"]},
+                      {"gated": 1, "mountain_views": 5, "fishing": 1}]:
+            what_if = lambda_handler({**event, "what_if": {"wants": wants}}, None)
+            # only the changed features are rescored from the cached base scores
+            assert "rescore" in what_if["timings"]["stages"]
+            full = lambda_handler({**event, "wants": {**event["wants"], **wants}}, None)
+            assert list(what_if["top_communities"]) == list(full["top_communities"])
+            for name,record in full["top_communities"].items():
+                assert what_if["top_communities"][name]["homebuyer_score"] == \
+                    pytest.approx(record["homebuyer_score"])
+        assert what_if["timings"]["ranking_cache"] == "hit"
+
+        # a change of needs filters again
+        needs = {"price_range_lower": "200k"}
+        what_if = lambda_handler({**event, "what_if": {"needs": needs}}, None)
+        full = lambda_handler({**event, "needs": {**event["needs"], **needs}}, None)
+        assert "rescore" not in what_if["timings"]["stages"]
+        assert what_if["n_communities_filtered"] == full["n_communities_filtered"]
+        assert what_if["top_communities"] == full["top_communities"]
+    finally:
+        ranking_cache.clear()
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_19_explain(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    top_communities = lambda_handler(event, None)["top_communities"]
+    explained = lambda_handler({**event, "explain": True}, None)["top_communities"]
+    page = lambda_handler({**event, "explain": True, "page_size": 3}, None)["communities"]
+    ranking_cache.clear()
+
+    assert list(explained) == list(top_communities)
+    assert [c["name"] for c in page] == list(top_communities)
+    for record in list(explained.values()) + page:
+        contributions = record["feature_contributions"]
+        assert set(contributions) <= set(event["wants"])
+        assert sum(contributions.values()) == pytest.approx(record["homebuyer_score"])
+    assert all("feature_contributions" not in r for r in top_communities.values())
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("unprocessable"))
+def test_20_relaxations(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    with pytest.raises(UnprocessableContentError) as e:
+        lambda_handler(event, None)
+    details = json.loads(str(e.value))
+    assert details["message"].startswith("All communities have been filtered out")
+    relaxations = details["relaxations"]
+    assert 0 < len(relaxations) <= 3
+    assert [r["cost"] for r in relaxations] == sorted(r["cost"] for r in relaxations)
+
+    # every suggestion leaves the communities it says
+    for relaxation in relaxations:
+        resp = lambda_handler({**event, "needs": {**event["needs"], **relaxation["needs"]}}, None)
+        assert resp["n_communities_filtered"] == relaxation["n_communities"]
+
+    # with a budget too low for any community, the budget is raised along
+    # with the relaxation of another need
+    needs = {**event["needs"], "max_total_cost": 100_000}
+    with pytest.raises(UnprocessableContentError) as e:
+        lambda_handler({**event, "needs": needs}, None)
+    relaxations = json.loads(str(e.value))["relaxations"]
+    assert relaxations and all("max_total_cost" in r["needs"] for r in relaxations)
+    for relaxation in relaxations:
+        resp = lambda_handler({**event, "needs": {**needs, **relaxation["needs"]}}, None)
+        assert resp["n_communities_filtered"] == relaxation["n_communities"]
+
+
+def test_21_payload_schema_copy():
+    # the needs domain of the relaxations comes from a copy of the schema
+    copies = [os.path.join(LAMBDAS_PATH, module, "src", "payload_schema.json")
+              for module in [MODULE, "validate_rank_inputs"]]
+    schemas = []
+    for fn in copies:
+        with open(fn, "r") as fp:
+            schemas.append(json.load(fp))
+    assert schemas[0] == schemas[1]
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1] + get_test_event_files("unprocessable"))
+def test_22_facets(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    try:
+        facets = lambda_handler({**event, "facets": True}, None)["facets"]
+    except UnprocessableContentError as e:
+        facets = json.loads(str(e))["facets"]
+
+    # every count is what filtering with that single choice leaves
+    store = load_community_store(event["excel_file"])
+    choices = {
+        "location": lambda loc: {"location": [loc]},
+        "size_of_community": lambda size: {"size_of_community": [size]},
+        "price_range": lambda bucket: dict(zip(["price_range_lower", "price_range_upper"],
+                                               bucket.split("-"))),
+        "age_of_home": lambda age: {"age_of_home": age},
+    }
+    assert set(facets) == set(choices)
+    for facet,counts in facets.items():
+        assert len(counts) >= 3
+        for option,count in counts.items():
+            needs = {**event["needs"], **choices[facet](option)}
+            assert count == len(store.filter(needs))
+
+
+@pytest.mark.parametrize("costs, expected", [
+    ([[1, 5], [2, 2], [3, 1], [3, 3], [1, 5], [4, 4]], [0, 0, 0, 1, 0, 2]),
+    ([[1, 1, 9], [1, 9, 1], [9, 1, 1], [2, 2, 9], [5, 5, 5]], [0, 0, 0, 1, 0]),
+    ([[1, 2, 3, 4], [4, 3, 2, 1], [2, 3, 4, 5], [np.inf, 0, 0, 0]], [0, 0, 1, 0]),
+])
+def test_23_pareto_fronts(costs, expected):
+    assert pareto_fronts(np.array(costs, dtype=float), n_fronts=2).tolist() == \
+        [f if f < 2 else -1 for f in expected]
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_24_pareto_ranking(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["pareto"] = {"objectives": ["homebuyer_score", "price_avg", "hoa_fee"], "n_fronts": 2}
+    resp = lambda_handler(event, None)
+    fronts = resp["pareto_fronts"]
+    assert 1 <= len(fronts) <= 2
+    assert sum(f["size"] for f in fronts) <= resp["n_communities_filtered"]
+
+    # no community of the first front is dominated by another one ranked
+    def costs(c):
+        return np.array([-c["homebuyer_score"], c["price_avg"], c["hoa_fee"]], dtype=float)
+    first = [costs(c) for c in fronts[0]["communities"]]
+    for c in first:
+        assert not any(np.all(o <= c) and np.any(o < c) for o in first)
+    scores = [c["homebuyer_score"] for c in fronts[0]["communities"]]
+    assert scores == sorted(scores, reverse=True)
+    assert all("total_cost" not in c for f in fronts for c in f["communities"])
+
+    # with a budget the communities of the fronts carry their total cost
+    needs = {**event["needs"], "max_total_cost": 10_000_000}
+    fronts = lambda_handler({**event, "needs": needs}, None)["pareto_fronts"]
+    assert fronts and all(c["total_cost"] <= 10_000_000 for f in fronts for c in f["communities"])
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_25_diversity(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    top_communities = lambda_handler(event, None)["top_communities"]
+
+    # without weight on diversity the ranking order is kept
+    same = lambda_handler({**event, "diversity": {"weight": 0}}, None)["top_communities"]
+    assert same == top_communities
+
+    # the best community is always picked first, the others spread out
+    diverse = lambda_handler({**event, "diversity": {"weight": 0.9, "k": 3}}, None)["top_communities"]
+    assert list(diverse)[0] == list(top_communities)[0]
+    assert len(diverse) == len(top_communities)
+    assert len({c["city"] for c in diverse.values()}) >= \
+        len({c["city"] for c in top_communities.values()})
+
+    # with a budget the picked communities carry their total cost
+    needs = {**event["needs"], "max_total_cost": 10_000_000}
+    diverse = lambda_handler({**event, "needs": needs, "diversity": {"weight": 0.9}},
+                             None)["top_communities"]
+    assert diverse and all("total_cost" in c for c in diverse.values())
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_26_sort_by(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["timings"] = True
+    try:
+        ranked = lambda_handler({**event, "page_size": 50}, None)["communities"]
+        scores = {c["name"]: c["homebuyer_score"] for c in ranked}
+
+        for key in ["price_avg", "hoa_fee", "age_avg", "size"]:
+            for order in ["asc", "desc"]:
+                sort_by = {"key": key, "order": order}
+                resp = lambda_handler({**event, "sort_by": sort_by, "page_size": 50}, None)
+                assert resp["sort_by"] == sort_by
+                # the presorted index is walked instead of ranking by score
+                assert "rank" not in resp["timings"]["stages"]
+                sorted_ = resp["communities"]
+                assert {c["name"]: c["homebuyer_score"] for c in sorted_} == scores
+
+                # missing values last, ties in store order (by total homes)
+                store = load_community_store(event["excel_file"])
+                rows = [int(np.flatnonzero(store.names == c["name"])[0]) for c in sorted_]
+                values = store.columns[SORT_KEYS[key][0]][rows].astype(float)
+                expected = sorted(zip(values, rows), key=lambda vr: (
+                    np.isnan(vr[0]), (vr[0] if order == "asc" else -vr[0]), vr[1]
+                ))
+                assert rows == [r for _,r in expected]
+
+        # the default order of a key is filled in, and the top communities follow it
+        resp = lambda_handler({**event, "sort_by": {"key": "price_avg"}}, None)
+        assert resp["sort_by"] == {"key": "price_avg", "order": "asc"}
+        cheapest = lambda_handler({**event, "sort_by": {"key": "price_avg"}, "page_size": 3},
+                                  None)["communities"]
+        assert list(resp["top_communities"]) == [c["name"] for c in cheapest]
+
+        # a cursor only pages the order it was issued for
+        resp = lambda_handler({**event, "sort_by": {"key": "hoa_fee"}, "page_size": 2}, None)
+        with pytest.raises(InvalidCursorError):
+            lambda_handler({**event, "cursor": resp["next_cursor"]}, None)
+    finally:
+        ranking_cache.clear()
+
+
+def test_27_parse_fee():
+    assert parse_fee(2000) == (2000.0, 0.0)
+    assert parse_fee(".25% of Sale Price") == (0.0, 0.0025)
+    amount, rate = parse_fee(".5% of 1% of\n  price")  # a rate of a rate
+    assert amount == 0.0 and rate == pytest.approx(0.00005)
+    assert np.isnan(parse_fee("1% or 2% of price")[0])
+    assert parse_fee("$1,500") == (1500.0, 0.0)
+    assert np.isnan(parse_fee("ask the HOA")[0])
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_28_total_cost(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    store = load_community_store(event["excel_file"])
+    try:
+        communities = lambda_handler({**event, "sort_by": {"key": "total_cost"},
+                                      "page_size": 50}, None)["communities"]
+        costs = [c["total_cost"] for c in communities]
+        assert costs == sorted(costs)
+        for c in communities:
+            row = int(np.flatnonzero(store.names == c["name"])[0])
+            expected = c["price_avg"] + TCO_YEARS*c["hoa_fee"] + store.preservation_fee[row]
+            assert c["total_cost"] == round(expected)
+
+        # a budget keeps the communities within it, as the pandas reference does
+        budget = int(np.median(costs))
+        needs = {**event["needs"], "max_total_cost": budget, "total_cost_years": 5}
+        resp = lambda_handler({**event, "needs": needs, "page_size": 50}, None)
+        assert all(c["total_cost"] <= budget for c in resp["communities"])
+        df_needs = read_excel_sheet(event["excel_file"], SHEET_NAME_NEEDS, PRIMARY_KEY)
+        assert {c["name"] for c in resp["communities"]} == \
+            set(filter_communities(df_needs, needs).index)
+
+        # a budget below every cost is relaxed to the cheapest community
+        needs = {**event["needs"], "max_total_cost": 0}
+        with pytest.raises(UnprocessableContentError) as e:
+            lambda_handler({**event, "needs": needs}, None)
+        relaxations = json.loads(str(e.value))["relaxations"]
+        raised = [r for r in relaxations if list(r["needs"]) == ["max_total_cost"]]
+        assert len(raised) == 1 and raised[0]["needs"]["max_total_cost"] >= min(costs)
+    finally:
+        ranking_cache.clear()
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_29_compare(excel_file, event_file, get_event_as_dict):
+    event = get_event_as_dict
+    event["excel_file"] = os.path.join(TEST_DATA_PATH, excel_file)
+    event["timings"] = True
+    store = load_community_store(event["excel_file"])
+    try:
+        ranked = lambda_handler({**event, "page_size": 50}, None)["communities"]
+        ranking_cache.clear()
+        filtered_out = next(name for name in store.names if name not in {c["name"] for c in ranked})
+        names = [ranked[-1]["name"], filtered_out, "No Such Community", ranked[0]["name"]]
+
+        for cache in ["miss", "hit"]:
+            resp = lambda_handler({**event, "compare": names}, None)
+            assert resp["timings"]["ranking_cache"] == cache
+            # ranks are counted, not sorted
+            assert "rank" not in resp["timings"]["stages"]
+            assert resp["n_communities_filtered"] == len(ranked)
+            assert resp["not_found"] == ["No Such Community"]
+            last, out, first = resp["communities"]
+            assert (first["rank"], first["name"]) == (1, ranked[0]["name"])
+            assert last == ranked[-1] | {"meets_needs": True}
+            assert out["name"] == filtered_out and out["rank"] is None and not out["meets_needs"]
+            assert out["homebuyer_score"] == lambda_handler(
+                {**event, "compare": [filtered_out]}, None
+            )["communities"][0]["homebuyer_score"]
+            lambda_handler({**event, "page_size": 2}, None)  # caches the ranking
+    finally:
+        ranking_cache.clear()
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="the peak RSS of a stage is read from /proc")
+def test_30_stage_peak_rss():
+    timer = StageTimer()
+    with timer.stage("outer"):
+        with timer.stage("alloc"):
+            buffer = b"x"*(64*2**20)  # touches every page
+            del buffer
+        with timer.stage("noop"):
+            pass
+    stages = timer.as_dict()["stages"]
+    # the buffer was freed, but it still counts towards the peak of its stage
+    assert stages["alloc"]["peak_rss_mb"] >= current_rss_mb() + 32
+    assert stages["noop"]["peak_rss_mb"] <= stages["alloc"]["peak_rss_mb"] - 32
+    assert stages["outer"]["peak_rss_mb"] == stages["alloc"]["peak_rss_mb"]
+
+
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+@pytest.mark.parametrize("event_file", get_test_event_files("valid"))
+def test_31_feature_block_worker_process(excel_file, event_file, get_event_as_dict):
+    excel_fp = os.path.join(TEST_DATA_PATH, excel_file)
+    store = CommunityStore.from_frames(read_excel_sheet(excel_fp, SHEET_NAME_NEEDS, PRIMARY_KEY),
+                                       read_excel_sheet(excel_fp, SHEET_NAME_WANTS, PRIMARY_KEY))
+    hb_needs = {**get_event_as_dict["needs"], "max_total_cost": 700_000}
+    hb_wants = get_event_as_dict["wants"]
+    with create_feature_block(store) as block:
+        # a spawned worker starts from nothing but the pickled descriptor
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+            mask, scores = pool.submit(filter_and_score, block.descriptor, hb_needs, hb_wants).result()
+    assert np.array_equal(np.flatnonzero(mask), store.filter(hb_needs))
+    assert np.array_equal(scores, store.score(hb_wants, np.arange(len(store))))
+
 # ----------------------------------------------------------------------------#
 #                             --- Fixtures ---                                #
 # ----------------------------------------------------------------------------#
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+
+import pytest
+
+from topshelfsoftware_util.log import get_logger
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+from __setup__ import LAMBDAS_PATH
+MODULE = "run_ranking_canary"
+
+# ----------------------------------------------------------------------------#
+#                               --- Logging ---                               #
+# ----------------------------------------------------------------------------#
+logger = get_logger(f"test_{MODULE}")
+
+# ----------------------------------------------------------------------------#
+#                              --- Env Vars ---                               #
+# ----------------------------------------------------------------------------#
+os.environ["STATE_MACHINE_ARN"] = ""
+
+# ----------------------------------------------------------------------------#
+#                           --- Lambda Imports ---                            #
+# ----------------------------------------------------------------------------#
+sys.path.append(os.path.join(LAMBDAS_PATH, MODULE))
+from service.lambdas.run_ranking_canary.src import app
+from service.lambdas.run_ranking_canary.src.canary import (
+    evaluate, load_profiles, select_profiles
+)
+from service.lambdas.validate_rank_inputs.src.validate import validate_payload
+
+# ----------------------------------------------------------------------------#
+#                                --- TESTS ---                                #
+# ----------------------------------------------------------------------------#
+def test_01_canary_profiles_valid():
+    for profile in load_profiles().values():
+        assert validate_payload(profile) == None
+
+
+def test_02_select_profiles():
+    profiles = load_profiles()
+    covered = set()
+    for rotation in range(len(profiles)):
+        selected = select_profiles(profiles, 4, rotation)
+        assert len(selected) == 4
+        covered.update(selected)
+    assert covered == set(profiles)
+
+
+def test_03_evaluate():
+    budgets = {"p50_ms": 100, "p99_ms": 200, "cold_ms": 1000}
+    results = [{"status": "SUCCEEDED", "latency_ms": ms} for ms in [900, 50, 60, 150]]
+    report = evaluate(results, budgets)
+    assert report["passed"]
+    assert report["latency_ms"] == {"cold_ms": 900, "p50_ms": 60, "p99_ms": 150}
+
+    # a slow tail or a failed ranking fails the run
+    assert not evaluate(results + [{"status": "SUCCEEDED", "latency_ms": 250}], budgets)["passed"]
+    report = evaluate(results + [{"status": "FAILED", "latency_ms": 10}], budgets)
+    assert not report["passed"] and report["checks"] == {
+        "p50_ms": True, "p99_ms": True, "cold_ms": True, "errors": False
+    }
+
+
+def test_04_lambda_handler(monkeypatch, capsys):
+    payloads = []
+    output = {"timings": {"stages": {"filter": {"duration_ms": 0.5}},
+                          "dataset_cache": "hit", "dataset_version": "v1"}}
+    monkeypatch.setattr(app, "launch_sfn", lambda arn, payload: payloads.append(payload) or "arn")
+    monkeypatch.setattr(app, "poll_sfn", lambda arn, step: {
+        "status": "SUCCEEDED", "output": json.dumps(output)
+    })
+    report = app.lambda_handler({"n_profiles": 2, "repeat": 3, "rotation": 0}, None)
+
+    assert report["passed"] and report["n_requests"] == 6
+    assert report["dataset_versions"] == ["v1"]
+    assert report["requests"][0]["stages_ms"] == {"filter": 0.5}
+    assert all(p["timings"] and p["trace"]["correlation_id"] for p in payloads)
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()
+               if line.startswith('{"_aws"')]
+    assert len(records) == 1 and records[0]["failed"] == 0
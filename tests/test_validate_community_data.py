@@ -2,6 +2,7 @@ import base64
 import os
 import sys
 
+import pandas as pd
 import pytest
 
 from topshelfsoftware_util.log import get_logger
@@ -23,6 +24,9 @@ logger = get_logger(f"test_{MODULE}")
 # ----------------------------------------------------------------------------#
 sys.path.append(os.path.join(LAMBDAS_PATH, MODULE))
 from service.lambdas.validate_community_data.src.app import lambda_handler
+from service.lambdas.validate_community_data.src.communities import (
+    PRES_KEY, SHEET_NAME_NEEDS
+)
 from service.lambdas.validate_community_data.src.exceptions import (
     WorksheetNotFoundError
 )
@@ -62,6 +66,23 @@ def test_03_lambda_handler_invalid(get_excel_as_encoded_bin):
             raise err
 
 
+@pytest.mark.parametrize("excel_file", get_test_excel_files("v1"))
+def test_04_lambda_handler_invalid_fee(excel_file, tmp_path):
+    # preservation fees must be a number or a percentage of the sale price
+    sheets = pd.read_excel(os.path.join(TEST_DATA_PATH, excel_file), sheet_name=None)
+    needs = sheets[SHEET_NAME_NEEDS]
+    needs[PRES_KEY] = needs[PRES_KEY].astype(object)
+    needs.loc[0, PRES_KEY] = "ask the HOA"
+    excel_fp = tmp_path/excel_file
+    with pd.ExcelWriter(excel_fp) as writer:
+        for sheet_name,df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    event = {
+        "xlsx_base64_encoded": base64.encodebytes(excel_fp.read_bytes())
+    }
+    with pytest.raises(AssertionError, match=PRES_KEY):
+        lambda_handler(event, None)
+
 # ----------------------------------------------------------------------------#
 #                             --- Fixtures ---                                #
 # ----------------------------------------------------------------------------#
@@ -53,3 +53,16 @@ def test_04_lambda_handler_invalid(get_event_as_dict, get_event_as_str):
     
     with pytest.raises(jsonschema.ValidationError):
         lambda_handler(get_event_as_str, None)
+
+
+@pytest.mark.parametrize("event_file", get_test_event_files("valid")[:1])
+def test_05_validate_payload_what_if(get_event_as_dict):
+    event = get_event_as_dict
+    assert validate_payload({**event, "what_if": {"wants": {"gated": 5}}}) == None
+    assert validate_payload({**event, "what_if": {"needs": {"location": ["Central"]}}}) == None
+
+    # the changed profile must be valid too
+    with pytest.raises(jsonschema.ValidationError):
+        validate_payload({**event, "what_if": {"wants": {"gated": 6}}})
+    with pytest.raises(jsonschema.ValidationError):
+        validate_payload({**event, "what_if": {"needs": {"age_of_home": "Brand new"}}})
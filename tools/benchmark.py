@@ -0,0 +1,275 @@
+"""Benchmark the community ranking pipeline on synthetic datasets.
+
+For every dataset size a synthetic workbook is generated (see
+`synthetic_data.py`, cached in the work dir) and each stage of the ranking is
+timed for every homebuyer profile in `tests/events`:
+
+    read_excel_sheet          both sheets of the workbook (once per size)
+    filter_communities        includes clustering the community sizes
+    score_communities
+    rank_communities          merge of the filtered and scored sheets + sort
+    compile_top_communities
+    store_build               CommunityStore.from_frames (once per size)
+    store_filter, store_score, store_rank, store_compile
+
+Each stage runs `--repeat` times, or fewer (at least once) when its runs
+exceed `--budget-s`, and reports latency percentiles, throughput (communities
+per second at the median latency) and the peak memory it allocated
+(tracemalloc, measured in a separate untimed run). The peak RSS of the process after each size is
+reported as well; sizes run smallest first so it bounds the peak of that size.
+
+The large sizes take minutes: the 1M community workbook alone is ~100 MB and
+reading it with openpyxl dominates the run.
+
+Usage (from the project root):
+    python tools/benchmark.py --json-file benchmark_baseline.json
+    python tools/benchmark.py --size 100 --size 10000 --repeat 20
+    python tools/benchmark.py --size 100000 --event 01_valid_event.json
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from synthetic_data import DEFAULT_SEED, PROJ_ROOT_PATH, generate_workbook
+from src import MODULE_NAME
+from src.columns import PRIMARY_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS
+from src.communities import (
+    pd, compile_top_communities, filter_communities, rank_communities,
+    score_communities
+)
+from src.excel import optimize_dtypes, read_excel_sheet
+from src.store import CommunityStore
+from src.store import compile_top_communities as compile_top_records
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+TEST_EVENTS_PATH = os.path.join(PROJ_ROOT_PATH, "tests", "events")
+EVENT_KEYWORDS = ["valid", "unprocessable"]  # events the ranking accepts
+DEFAULT_SIZES = [100, 10_000, 100_000, 1_000_000]
+DEFAULT_WORK_DIR = os.path.join(PROJ_ROOT_PATH, ".benchmarks")
+PERCENTILES = [50, 90, 99]
+N_TOP = 3
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def load_events(event_files: list = None) -> dict:
+    """Homebuyer profiles to benchmark, by event file name. Defaults to every
+    test event the ranking accepts."""
+    if event_files is None:
+        event_files = sorted(
+            fn for fn in os.listdir(TEST_EVENTS_PATH)
+            if set(os.path.splitext(fn)[0].split("_")) & set(EVENT_KEYWORDS)
+        )
+    events = {}
+    for event_file in event_files:
+        with open(os.path.join(TEST_EVENTS_PATH, event_file), "r") as fp:
+            events[event_file] = json.load(fp)
+    return events
+
+
+def time_stage(func, setup, repeat: int, budget_s: float = None) -> list[float]:
+    """Time `func(*setup())` `repeat` times, or fewer (at least once) when the
+    runs exceed the time budget. Only the call is timed, not the setup (e.g.
+    copying the DataFrames the stage modifies in place)."""
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+        if budget_s is not None and sum(times) > budget_s:
+            break
+    return times
+
+
+def trace_stage(func, setup) -> int:
+    """Peak memory (bytes) allocated by one call of `func(*setup())`."""
+    args = setup()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_stage(func, setup, repeat: int, n_communities: int,
+                    budget_s: float = None) -> dict:
+    """Time and trace a stage and summarize it."""
+    times = time_stage(func, setup, repeat, budget_s)
+    summary = summarize_times(times, n_communities)
+    summary["peak_alloc_mb"] = round(trace_stage(func, setup)/2**20, 3)
+    return summary
+
+
+def summarize_times(times: list[float], n_communities: int) -> dict:
+    """Latency percentiles (ms) and throughput (communities/s) of a stage."""
+    times_ms = np.array(times)*1000
+    summary = {"runs": len(times)}
+    summary["min_ms"] = round(float(times_ms.min()), 3)
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(float(np.percentile(times_ms, p)), 3)
+    summary["max_ms"] = round(float(times_ms.max()), 3)
+    median_s = float(np.median(times))
+    summary["communities_per_s"] = round(n_communities/median_s) if median_s > 0 else None
+    return summary
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the process so far."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # bytes on macOS, KB on linux
+    return round(maxrss/scale, 1)
+
+
+def benchmark_dataset(xlsx_fn: str, n_communities: int, events: dict,
+                      repeat: int, read_repeat: int, budget_s: float = None) -> dict:
+    """Benchmark every stage of the ranking on a workbook."""
+    def read_sheets():
+        return (read_excel_sheet(xlsx_fn, SHEET_NAME_NEEDS, PRIMARY_KEY),
+                read_excel_sheet(xlsx_fn, SHEET_NAME_WANTS, PRIMARY_KEY))
+
+    result = {"n_communities": n_communities, "workbook": xlsx_fn}
+    result["read_excel_sheet"] = summarize_times(
+        time_stage(read_sheets, tuple, read_repeat, budget_s), n_communities
+    )
+    df_needs, df_wants = read_sheets()
+
+    def build_store(df_needs, df_wants):
+        return CommunityStore.from_frames(optimize_dtypes(df_needs), optimize_dtypes(df_wants))
+
+    store_setup = lambda: (df_needs.copy(), df_wants.copy())
+    result["store_build"] = benchmark_stage(
+        build_store, store_setup, read_repeat, n_communities, budget_s
+    )
+    store = build_store(*store_setup())
+
+    result["events"] = {}
+    for event_file,event in events.items():
+        needs, wants = event["needs"], event["wants"]
+        df_filtered = filter_communities(df_needs.copy(), needs)
+        df_scored = score_communities(df_wants.copy(), wants)
+        df_ranked = rank_communities(
+            pd.merge(df_filtered, df_scored, left_index=True, right_index=True)
+        )
+        rows = store.filter(needs)
+        scores = store.score(wants, rows)
+        ranked_rows, ranked_scores = store.rank(rows, scores)
+
+        def merge_and_rank(df_filtered, df_scored):
+            return rank_communities(
+                pd.merge(df_filtered, df_scored, left_index=True, right_index=True)
+            )
+
+        stages = {
+            "filter_communities": (filter_communities, lambda: (df_needs.copy(), needs)),
+            "score_communities": (score_communities, lambda: (df_wants.copy(), wants)),
+            "rank_communities": (merge_and_rank, lambda: (df_filtered, df_scored)),
+            "compile_top_communities": (compile_top_communities, lambda: (df_ranked, N_TOP)),
+            "store_filter": (store.filter, lambda: (needs,)),
+            "store_score": (store.score, lambda: (wants, rows)),
+            "store_rank": (store.rank, lambda: (rows, scores)),
+            "store_compile": (compile_top_records,
+                              lambda: (store, ranked_rows, ranked_scores, N_TOP)),
+        }
+        result["events"][event_file] = {"n_communities_filtered": len(rows)}
+        for stage,(func,setup) in stages.items():
+            result["events"][event_file][stage] = benchmark_stage(
+                func, setup, repeat, n_communities, budget_s
+            )
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment() -> dict:
+    """Where the benchmark ran, to tell apart baselines from different hosts."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_report(results: dict):
+    """Print the p50 latency of every stage."""
+    for size,result in results.items():
+        print(f"\n{size} communities (peak RSS {result['peak_rss_mb']} MB)")
+        for stage in ["read_excel_sheet", "store_build"]:
+            print(f"  {stage:<26}{result[stage]['p50_ms']:>12.3f} ms p50")
+        for event_file,stages in result["events"].items():
+            print(f"  {event_file} ({stages['n_communities_filtered']} filtered)")
+            for stage,summary in stages.items():
+                if isinstance(summary, dict):
+                    print(f"    {stage:<24}{summary['p50_ms']:>12.3f} ms p50"
+                          f"{summary['p99_ms']:>12.3f} ms p99"
+                          f"{summary['peak_alloc_mb']:>10.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", dest="sizes", type=int, action="append",
+                        help=f"Number of communities (repeatable), defaults to {DEFAULT_SIZES}")
+    parser.add_argument("--event", dest="event_files", type=str, action="append",
+                        help="Event file in tests/events (repeatable), defaults to all accepted events")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=10,
+                        help="Timed runs of each stage per event")
+    parser.add_argument("--read-repeat", dest="read_repeat", type=int, default=3,
+                        help="Timed runs of reading the workbook and building the store")
+    parser.add_argument("--budget-s", dest="budget_s", type=float, default=60,
+                        help="Stop repeating a stage once its runs took this long (runs at least once)")
+    parser.add_argument("--seed", dest="seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed of the synthetic datasets")
+    parser.add_argument("--work-dir", dest="work_dir", type=str, default=DEFAULT_WORK_DIR,
+                        help="Directory to cache the synthetic workbooks in")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the results (the baseline)")
+    args = parser.parse_args()
+
+    # the Lambda logs every DataFrame it handles, keep the console readable
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith(MODULE_NAME):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    events = load_events(args.event_files)
+    results = {}
+    for size in sorted(args.sizes or DEFAULT_SIZES):
+        xlsx_fn = os.path.join(args.work_dir, f"synthetic_{size}_{args.seed}.xlsx")
+        print(f"benchmarking {size} communities ({xlsx_fn})", flush=True)
+        generate_workbook(xlsx_fn, size, args.seed)
+        results[str(size)] = benchmark_dataset(
+            xlsx_fn, size, events, args.repeat, args.read_repeat, args.budget_s
+        )
+    print_report(results)
+
+    if args.json_file is not None:
+        report = {
+            "environment": environment(),
+            "config": {
+                "sizes": sorted(args.sizes or DEFAULT_SIZES),
+                "events": list(events),
+                "repeat": args.repeat,
+                "read_repeat": args.read_repeat,
+                "budget_s": args.budget_s,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.json_file, "w") as fp:
+            json.dump(report, fp, indent=4)
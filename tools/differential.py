@@ -0,0 +1,338 @@
+"""Differential equivalence and performance regression gate for the ranking.
+
+A reference and a candidate implementation of the ranking rank the same
+randomized homebuyer profiles on the same datasets (the test workbook plus
+synthetic workbooks of `--size` communities) and must agree on
+    - the set of communities left by the needs filter (size clustering included)
+    - the score of every filtered community, within `--rtol`/`--atol`
+    - the top `--top` communities in order. Communities with tied scores may
+      swap places (the pandas ranking sorts unstably) unless `--strict-ties`.
+
+An implementation is `reference` (the frozen ranking of
+tools/reference_ranking.py, which shares no code with the Lambda), `pandas`
+(filter_communities, score_communities and rank_communities of communities.py)
+or `store` (CommunityStore, what the Lambda runs). `pandas` and `store` can be
+taken at a git revision: `pandas@HEAD~1` ranks with the communities.py of the
+previous commit, so a rewrite can be checked against the code it replaces. The
+default reference is `reference`, so code that `pandas` and `store` share
+(e.g. the scoring kernels) is checked too; a deliberate change of the ranking
+has to be made in tools/reference_ranking.py as well.
+
+The filter, score and rank stages of the candidate are timed (median across
+profiles of the fastest of `--repeat` runs) and compared with a baseline
+saved by `--update-baseline`. The run fails (exit code 1) when the results
+diverge or a stage got slower than the baseline by more than `--threshold`.
+
+Usage (from the project root):
+    python tools/differential.py --update-baseline
+    python tools/differential.py
+    python tools/differential.py --reference pandas@HEAD~1 --candidate pandas --size 2000
+    python tools/differential.py --candidate pandas
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+from local_sfn import load_package
+import reference_ranking
+from synthetic_data import (
+    DEFAULT_SEED, PROJ_ROOT_PATH, RANK_COMMUNITIES_PATH, generate_profiles,
+    generate_workbook
+)
+from src import MODULE_NAME
+from src.columns import PRIMARY_KEY, SCORE_KEY, SHEET_NAME_NEEDS, SHEET_NAME_WANTS
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+TEST_EXCEL_FN = os.path.join(PROJ_ROOT_PATH, "tests", "data", "55+_Communities_v1.xlsx")
+DEFAULT_WORK_DIR = os.path.join(PROJ_ROOT_PATH, ".benchmarks")
+DEFAULT_BASELINE_FN = os.path.join(DEFAULT_WORK_DIR, "differential_baseline.json")
+DEFAULT_SIZES = [100, 1000]
+IMPLEMENTATIONS = ["reference", "pandas", "store"]
+STAGES = ["filter", "score", "rank"]
+RANK_COMMUNITIES_DIR = os.path.relpath(RANK_COMMUNITIES_PATH, PROJ_ROOT_PATH)
+REVISION_SEPARATOR = "@"
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class Implementation:
+    """A ranking implementation of the working tree or of a git revision."""
+    def __init__(self, spec: str, work_dir: str):
+        self.spec = spec
+        self.kind, _, self.revision = spec.partition(REVISION_SEPARATOR)
+        if self.kind not in IMPLEMENTATIONS:
+            raise ValueError(f"unknown implementation {self.kind}, expected one of {IMPLEMENTATIONS}")
+        if self.kind == "reference":
+            if self.revision:
+                raise ValueError("the reference implementation cannot be taken at a revision")
+            return
+        src_dir = os.path.join(RANK_COMMUNITIES_PATH, "src")
+        if self.revision:
+            src_dir = os.path.join(checkout_revision(self.revision, work_dir), "src")
+        pkg_name = f"differential_{len(sys.modules)}_src"  # one copy per implementation
+        env = {"COMMUNITY_DATA_BUCKET_NAME": "", "COMMUNITY_DATA_OBJECT_NAME": ""}
+        self.app = load_package(pkg_name, src_dir, env)
+        self.excel = load_package(pkg_name, src_dir, env, "excel")
+        self.communities = load_package(pkg_name, src_dir, env, "communities") \
+            if self.kind == "pandas" else None
+
+    def prepare(self, xlsx_fn: str):
+        """Read a dataset the way the implementation does in the Lambda."""
+        if self.kind == "reference":
+            self.frames = (reference_ranking.read_sheet(xlsx_fn, reference_ranking.SHEET_NAME_NEEDS),
+                           reference_ranking.read_sheet(xlsx_fn, reference_ranking.SHEET_NAME_WANTS))
+        elif self.kind == "pandas":
+            self.frames = (self.excel.read_excel_sheet(xlsx_fn, SHEET_NAME_NEEDS, PRIMARY_KEY),
+                           self.excel.read_excel_sheet(xlsx_fn, SHEET_NAME_WANTS, PRIMARY_KEY))
+        else:
+            self.store = self.app.load_community_store(os.path.abspath(xlsx_fn))
+
+    def rank(self, profile: dict) -> tuple[dict, dict]:
+        """Rank the communities for a profile. Returns the ranked communities
+        ({name: score}, best first) and the duration (s) of each stage."""
+        needs, wants = profile["needs"], profile["wants"]
+        timings = {}
+        if self.kind == "reference":
+            start = time.perf_counter()
+            df_filtered = reference_ranking.filter_communities(self.frames[0], needs)
+            timings["filter"] = time.perf_counter() - start
+            start = time.perf_counter()
+            df_scored = reference_ranking.score_communities(self.frames[1], wants)
+            timings["score"] = time.perf_counter() - start
+            start = time.perf_counter()
+            ranked = reference_ranking.rank_communities(df_filtered, df_scored)
+            timings["rank"] = time.perf_counter() - start
+        elif self.kind == "pandas":
+            pd = self.communities.pd
+            df_needs, df_wants = (df.copy() for df in self.frames)
+            start = time.perf_counter()
+            df_filtered = self.communities.filter_communities(df_needs, needs)
+            timings["filter"] = time.perf_counter() - start
+            start = time.perf_counter()
+            df_scored = self.communities.score_communities(df_wants, wants)
+            timings["score"] = time.perf_counter() - start
+            start = time.perf_counter()
+            df_ranked = self.communities.rank_communities(
+                pd.merge(df_filtered, df_scored, left_index=True, right_index=True)
+            )
+            timings["rank"] = time.perf_counter() - start
+            ranked = dict(zip(df_ranked.index, df_ranked[SCORE_KEY].astype(float)))
+        else:
+            start = time.perf_counter()
+            rows = self.store.filter(needs)
+            timings["filter"] = time.perf_counter() - start
+            start = time.perf_counter()
+            scores = self.store.score(wants, rows)
+            timings["score"] = time.perf_counter() - start
+            start = time.perf_counter()
+            rows, scores = self.store.rank(rows, scores)
+            timings["rank"] = time.perf_counter() - start
+            ranked = dict(zip(self.store.names[rows], scores.astype(float)))
+        return ranked, timings
+
+
+def checkout_revision(revision: str, work_dir: str) -> str:
+    """Extract the rank_communities package of a git revision. Returns its dir."""
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", revision, RANK_COMMUNITIES_DIR],
+        cwd=PROJ_ROOT_PATH, capture_output=True, check=True
+    ).stdout
+    out_dir = tempfile.mkdtemp(prefix="differential_", dir=work_dir)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(out_dir)
+    return os.path.join(out_dir, RANK_COMMUNITIES_DIR)
+
+
+def compare(reference: dict, candidate: dict, n_top: int, rtol: float, atol: float,
+            strict_ties: bool = False) -> list[str]:
+    """Differences between two rankings ({name: score}, best first)."""
+    diffs = []
+    ref_names, cand_names = set(reference), set(candidate)
+    if ref_names != cand_names:
+        diffs.append(f"filtered sets differ: only in reference {sorted(ref_names - cand_names)[:5]}, "
+                     f"only in candidate {sorted(cand_names - ref_names)[:5]}")
+    common = sorted(ref_names & cand_names)
+    ref_scores = np.array([reference[n] for n in common])
+    cand_scores = np.array([candidate[n] for n in common])
+    mismatched = ~np.isclose(cand_scores, ref_scores, rtol=rtol, atol=atol, equal_nan=True)
+    for i in np.flatnonzero(mismatched)[:5]:
+        diffs.append(f"score of {common[i]}: reference {ref_scores[i]!r}, candidate {cand_scores[i]!r}")
+    if mismatched.sum() > 5:
+        diffs.append(f"... {mismatched.sum() - 5} more scores differ")
+
+    ref_top = list(reference)[:n_top]
+    cand_top = list(candidate)[:n_top]
+    if ref_top != cand_top and (strict_ties or not _tie_equivalent(reference, candidate, n_top,
+                                                                     rtol, atol)):
+        diffs.append(f"top {n_top} differ: reference {ref_top}, candidate {cand_top}")
+    return diffs
+
+
+def _tie_equivalent(reference: dict, candidate: dict, n_top: int,
+                    rtol: float, atol: float) -> bool:
+    """Whether the top communities only differ by the order of tied scores:
+    both rankings have the same scores at each position and every candidate
+    community has the score of its position in the reference."""
+    ref_top = np.array(list(reference.values())[:n_top])
+    cand_top = list(candidate.items())[:n_top]
+    if len(ref_top) != len(cand_top):
+        return False
+    for ref_score,(name,cand_score) in zip(ref_top, cand_top):
+        if name not in reference or not np.isclose(reference[name], ref_score, rtol=rtol, atol=atol) \
+                or not np.isclose(cand_score, ref_score, rtol=rtol, atol=atol):
+            return False
+    return True
+
+
+def run_dataset(reference: Implementation, candidate: Implementation, xlsx_fn: str,
+                profiles: list[dict], args) -> dict:
+    """Rank every profile with both implementations, compare the rankings and
+    time the candidate."""
+    reference.prepare(xlsx_fn)
+    candidate.prepare(xlsx_fn)
+    divergences = []
+    timings = {"reference": {s: [] for s in STAGES}, "candidate": {s: [] for s in STAGES}}
+    for i,profile in enumerate(profiles):
+        ref_ranked, ref_times = reference.rank(profile)
+        cand_runs = [candidate.rank(profile) for _ in range(args.repeat)]
+        cand_ranked = cand_runs[0][0]
+        for stage in STAGES:
+            timings["reference"][stage].append(ref_times[stage])
+            timings["candidate"][stage].append(min(t[stage] for _,t in cand_runs))
+        diffs = compare(ref_ranked, cand_ranked, args.top, args.rtol, args.atol, args.strict_ties)
+        if diffs:
+            divergences.append({"profile": i, "needs": profile["needs"], "diffs": diffs})
+    return {
+        "divergences": divergences,
+        "p50_ms": {
+            who: {s: round(float(np.median(t))*1000, 4) for s,t in stages.items()}
+            for who,stages in timings.items()
+        },
+    }
+
+
+def check_regressions(results: dict, baseline: dict, kind: str,
+                      threshold: float, min_delta_ms: float) -> list[str]:
+    """Stages of the candidate slower than the baseline by more than the
+    threshold (and by more than `min_delta_ms`, below which timings are noise)."""
+    regressions = []
+    for dataset,result in results.items():
+        base = baseline.get(kind, {}).get(dataset)
+        if base is None:
+            continue
+        for stage,ms in result["p50_ms"]["candidate"].items():
+            base_ms = base.get(stage)
+            if base_ms is not None and ms > base_ms*(1 + threshold) and ms - base_ms > min_delta_ms:
+                regressions.append(f"{dataset} {stage}: {ms:.3f} ms p50 vs baseline "
+                                   f"{base_ms:.3f} ms (+{(ms/base_ms - 1):.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reference", dest="reference", type=str, default="reference",
+                        help="Reference implementation: reference, or pandas or store optionally @<git revision>")
+    parser.add_argument("--candidate", dest="candidate", type=str, default="store",
+                        help="Candidate implementation: reference, or pandas or store optionally @<git revision>")
+    parser.add_argument("--size", dest="sizes", type=int, action="append",
+                        help=f"Communities in a synthetic dataset (repeatable), defaults to {DEFAULT_SIZES}")
+    parser.add_argument("--datasets", dest="n_datasets", type=int, default=1,
+                        help="Synthetic datasets per size, each with its own seed")
+    parser.add_argument("--profiles", dest="n_profiles", type=int, default=50,
+                        help="Randomized homebuyer profiles per dataset")
+    parser.add_argument("--seed", dest="seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed of the datasets and profiles")
+    parser.add_argument("--top", dest="top", type=int, default=3,
+                        help="Number of top communities that must be ranked alike")
+    parser.add_argument("--rtol", dest="rtol", type=float, default=1e-9,
+                        help="Relative tolerance of the scores")
+    parser.add_argument("--atol", dest="atol", type=float, default=1e-9,
+                        help="Absolute tolerance of the scores")
+    parser.add_argument("--strict-ties", dest="strict_ties", action="store_true",
+                        help="Communities with tied scores must be ranked in the same order")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                        help="Timed runs of the candidate per profile (the fastest counts)")
+    parser.add_argument("--baseline", dest="baseline_fn", type=str, default=DEFAULT_BASELINE_FN,
+                        help="Timings baseline of the candidate")
+    parser.add_argument("--update-baseline", dest="update_baseline", action="store_true",
+                        help="Save the candidate timings as the baseline instead of comparing")
+    parser.add_argument("--threshold", dest="threshold", type=float, default=0.25,
+                        help="Slowdown of a stage vs the baseline that fails the run")
+    parser.add_argument("--min-delta-ms", dest="min_delta_ms", type=float, default=0.05,
+                        help="Slowdowns smaller than this are never regressions (timer noise)")
+    parser.add_argument("--work-dir", dest="work_dir", type=str, default=DEFAULT_WORK_DIR,
+                        help="Directory to cache the synthetic workbooks and revisions in")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the results")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    reference = Implementation(args.reference, args.work_dir)
+    candidate = Implementation(args.candidate, args.work_dir)
+    # the Lambda logs every DataFrame it handles, keep the console readable
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith(MODULE_NAME):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    datasets = {"test_v1": TEST_EXCEL_FN}
+    for size in sorted(args.sizes or DEFAULT_SIZES):
+        for i in range(args.n_datasets):
+            seed = args.seed + i
+            xlsx_fn = os.path.join(args.work_dir, f"synthetic_{size}_{seed}.xlsx")
+            datasets[f"synthetic_{size}_{seed}"] = generate_workbook(xlsx_fn, size, seed)
+    profiles = generate_profiles(args.n_profiles, args.seed)
+
+    print(f"reference {args.reference} vs candidate {args.candidate}: "
+          f"{len(profiles)} profiles on {len(datasets)} datasets")
+    results = {}
+    for dataset,xlsx_fn in datasets.items():
+        results[dataset] = run_dataset(reference, candidate, xlsx_fn, profiles, args)
+        ref_ms, cand_ms = (results[dataset]["p50_ms"][w] for w in ["reference", "candidate"])
+        print(f"  {dataset:<24}{len(results[dataset]['divergences']):>4} divergent profiles  " +
+              "  ".join(f"{s} {cand_ms[s]:.3f} ms ({ref_ms[s]/cand_ms[s]:.1f}x ref)"
+                        if cand_ms[s] > 0 else f"{s} {cand_ms[s]:.3f} ms" for s in STAGES))
+        for d in results[dataset]["divergences"][:3]:
+            print(f"    profile {d['profile']}: " + "; ".join(d["diffs"]))
+
+    failed = any(r["divergences"] for r in results.values())
+    regressions = []
+    if args.update_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline_fn):
+            with open(args.baseline_fn, "r") as fp:
+                baseline = json.load(fp)
+        baseline[candidate.kind] = {d: r["p50_ms"]["candidate"] for d,r in results.items()}
+        with open(args.baseline_fn, "w") as fp:
+            json.dump(baseline, fp, indent=4)
+        print(f"saved the {candidate.kind} timings to {args.baseline_fn}")
+    elif os.path.isfile(args.baseline_fn):
+        with open(args.baseline_fn, "r") as fp:
+            baseline = json.load(fp)
+        regressions = check_regressions(results, baseline, candidate.kind,
+                                        args.threshold, args.min_delta_ms)
+        for r in regressions:
+            print(f"  regression: {r}")
+    else:
+        print(f"no baseline at {args.baseline_fn}, timings not gated (see --update-baseline)")
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as fp:
+            json.dump({"config": vars(args), "results": results, "regressions": regressions},
+                      fp, indent=4)
+    if failed or regressions:
+        print("FAILED: " + ", ".join(
+            (["results diverge"] if failed else []) + ([f"{len(regressions)} regressions"] if regressions else [])
+        ))
+        sys.exit(1)
+    print("OK")
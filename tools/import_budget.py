@@ -0,0 +1,169 @@
+"""Measure the import (cold start) cost of each Lambda package.
+
+Each Lambda is imported in a fresh interpreter with `python -X importtime` so the
+numbers include everything its handler module pulls in. The report lists the
+total import time, the self time attributed to each top-level package
+(pandas, numpy, botocore, ...) and the most expensive modules.
+
+Usage (from the project root):
+    python tools/import_budget.py
+    python tools/import_budget.py --lambda rank_communities --top 20
+    python tools/import_budget.py --module src.shared --lambda rank_communities
+    python tools/import_budget.py --budget-ms 750 --json-file import_budget.json
+"""
+
+import argparse
+from collections import defaultdict
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PROJ_ROOT_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), os.pardir
+)
+LAMBDAS_PATH = os.path.join(PROJ_ROOT_PATH, "service", "lambdas")
+# the layers are on the path of the deployed Lambdas
+LAYER_PATHS = sorted(glob.glob(os.path.join(PROJ_ROOT_PATH, "service", "layers", "*", "python")))
+# env vars read at import time by the Lambda packages
+LAMBDA_ENV_VARS = {
+    "AWS_DEFAULT_REGION": "us-west-2",
+    "COMMUNITY_DATA_BUCKET_NAME": "",
+    "COMMUNITY_DATA_OBJECT_NAME": "",
+    "STATE_MACHINE_ARN": "",
+}
+IMPORTTIME_PREFIX = "import time:"
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def list_lambdas() -> list[str]:
+    """Names of all Lambda packages (directories with a `src/app.py`)."""
+    return sorted(
+        name for name in os.listdir(LAMBDAS_PATH)
+        if os.path.isfile(os.path.join(LAMBDAS_PATH, name, "src", "app.py"))
+    )
+
+
+def measure_imports(lambda_name: str, module: str = "src.app") -> list[dict]:
+    """Import `module` of a Lambda package in a fresh interpreter and return one
+    record per imported module: name, depth, self_us and cumulative_us."""
+    env = {**os.environ, **LAMBDA_ENV_VARS}
+    env["PYTHONPATH"] = os.pathsep.join(LAYER_PATHS + [env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure with warm bytecode caches
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(LAMBDAS_PATH, lambda_name),
+        env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} of {lambda_name} failed:\n{proc.stderr}")
+    return parse_importtime(proc.stderr)
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Parse the output of `python -X importtime`."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len(IMPORTTIME_PREFIX):].split("|")
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1)//2
+        records.append({
+            "name": name.strip(),
+            "depth": depth,
+            "self_us": self_us,
+            "cumulative_us": cumulative_us
+        })
+    return records
+
+
+def summarize(runs: list[list[dict]], module: str, top: int) -> dict:
+    """Summarize repeated measurements of the same import using the median."""
+    root = module.split(".")[0]
+    totals, packages, modules = [], defaultdict(list), defaultdict(list)
+    for records in runs:
+        # modules imported during interpreter startup do not count, only the
+        # tree below the Lambda package itself
+        in_tree = False
+        total = 0
+        run_packages = defaultdict(int)
+        for rec in reversed(records):  # importtime prints children before parents
+            if rec["depth"] == 0:
+                in_tree = rec["name"].split(".")[0] == root
+                if in_tree:
+                    total += rec["cumulative_us"]
+            if in_tree:
+                run_packages[rec["name"].split(".")[0]] += rec["self_us"]
+                modules[rec["name"]].append(rec["cumulative_us"])
+        totals.append(total)
+        for pkg,self_us in run_packages.items():
+            packages[pkg].append(self_us)
+
+    def ms(values: list) -> float:
+        return round(statistics.median(values)/1000, 2)
+
+    return {
+        "module": module,
+        "total_ms": ms(totals),
+        "packages_ms": dict(sorted(
+            ((pkg, ms(v)) for pkg,v in packages.items()), key=lambda x: -x[1]
+        )[:top]),
+        "top_modules_ms": dict(sorted(
+            ((mod, ms(v)) for mod,v in modules.items()), key=lambda x: -x[1]
+        )[:top]),
+    }
+
+
+def print_report(report: dict):
+    """Print the import report of every Lambda."""
+    for lambda_name,summary in report.items():
+        print(f"\n{lambda_name} (import {summary['module']}): {summary['total_ms']:.1f} ms")
+        print("  self time by package:")
+        for pkg,t in summary["packages_ms"].items():
+            print(f"    {t:9.2f} ms  {pkg}")
+        print("  most expensive modules (cumulative):")
+        for mod,t in summary["top_modules_ms"].items():
+            print(f"    {t:9.2f} ms  {mod}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lambda", dest="lambdas", type=str, action="append",
+                        choices=list_lambdas(),
+                        help="Lambda package to measure (repeatable), defaults to all")
+    parser.add_argument("--module", dest="module", type=str, default="src.app",
+                        help="Module to import within each Lambda package")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=5,
+                        help="Number of fresh interpreters per Lambda (median is reported)")
+    parser.add_argument("--top", dest="top", type=int, default=15,
+                        help="Number of most expensive packages/modules to report")
+    parser.add_argument("--budget-ms", dest="budget_ms", type=float, required=False,
+                        help="Exit with an error if any Lambda exceeds this import time")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the report")
+    args = parser.parse_args()
+
+    report = {}
+    for lambda_name in args.lambdas or list_lambdas():
+        runs = [measure_imports(lambda_name, args.module) for _ in range(args.repeat)]
+        report[lambda_name] = summarize(runs, args.module, args.top)
+    print_report(report)
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as fp:
+            json.dump(report, fp, indent=4)
+
+    if args.budget_ms is not None:
+        over_budget = [name for name,s in report.items() if s["total_ms"] > args.budget_ms]
+        if over_budget:
+            print(f"\nover the {args.budget_ms} ms import budget: {', '.join(over_budget)}")
+            sys.exit(1)
@@ -0,0 +1,348 @@
+"""Load test the ranking API by replaying a corpus of ranking requests.
+
+The corpus is the request bodies in `tests/events` (or `--corpus` files and
+directories) plus `--profiles` synthetic homebuyer profiles, replayed in order
+and cycled as needed. Requests are sent to one of the targets:
+
+    inprocess       the API and workflow Lambdas in this process, wired by
+                    `local_sfn.LocalService` (default)
+    http(s)://...   any /rank endpoint: the local server
+                    (`python tools/local_sfn.py serve`) or a deployed API
+
+Load is closed loop (`--concurrency` clients sending back to back) or open
+loop (`--rate` requests per second from up to `--concurrency` clients). In
+open loop the latency counts from the scheduled send time, so a saturated
+target shows up as queueing instead of a lower request rate.
+
+The report gives the throughput (QPS), latency percentiles and histogram,
+status codes, error classes with the status the API maps them to
+(`KNOWN_ERRORS` of run_real_estate_ranking) and the hit rates of the caches
+reported in the stage timings (requests are sent with "timings": true).
+
+Usage (from the project root):
+    python tools/load_test.py --concurrency 4 --requests 200
+    python tools/load_test.py --profiles 1000 --rate 20 --duration-s 60 --json-file load.json
+    python tools/load_test.py --target http://127.0.0.1:3000/rank --concurrency 16 --duration-s 30
+    python tools/load_test.py --target https://<api-id>.execute-api.us-west-2.amazonaws.com/Prod/rank \\
+        --api-key $API_KEY --rate 2 --requests 50
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+
+from local_sfn import LocalService, quiet_lambda_loggers
+from synthetic_data import DEFAULT_SEED, PROJ_ROOT_PATH, generate_profiles
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+TEST_EVENTS_PATH = os.path.join(PROJ_ROOT_PATH, "tests", "events")
+DEFAULT_EXCEL_FN = os.path.join(PROJ_ROOT_PATH, "tests", "data", "55+_Communities_v1.xlsx")
+IN_PROCESS_TARGET = "inprocess"
+RANK_API_LAMBDA = "RunRealEstateRanking"
+PERCENTILES = [50, 90, 99, 99.9]
+# upper bounds (ms) of the latency histogram buckets, the last one is open
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 750, 1000, 2500, 5000, 10000]
+HTTP_TIMEOUT_S = 30
+CACHE_SUFFIX = "_cache"  # stage timing properties reporting a cache hit or miss
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def load_corpus(paths: list[str] = None, n_profiles: int = 0,
+                seed: int = DEFAULT_SEED) -> list[dict]:
+    """Ranking request bodies from JSON files (directories are read in name
+    order) followed by `n_profiles` synthetic profiles."""
+    corpus = []
+    for path in paths or [TEST_EVENTS_PATH]:
+        fns = [os.path.join(path, fn) for fn in sorted(os.listdir(path)) if fn.endswith(".json")] \
+            if os.path.isdir(path) else [path]
+        for fn in fns:
+            with open(fn, "r") as fp:
+                corpus.append(json.load(fp))
+    return corpus + generate_profiles(n_profiles, seed)
+
+
+class InProcessTarget:
+    """The ranking API served by the Lambdas in this process."""
+    def __init__(self, excel_fn: str):
+        self.service = LocalService()
+        self.service.load()
+        quiet_lambda_loggers()
+        self.service.upload_community_data(excel_fn)
+
+    def send(self, payload: dict, headers: dict) -> tuple[int, dict]:
+        resp = self.service.rank(payload, headers)
+        return resp["statusCode"], json.loads(resp["body"])
+
+
+class HttpTarget:
+    """A ranking API endpoint reached over HTTP."""
+    def __init__(self, url: str, api_key: str = None):
+        self.url = url
+        self.api_key = api_key
+
+    def send(self, payload: dict, headers: dict) -> tuple[int, dict]:
+        headers = {"Content-Type": "application/json", **headers}
+        if self.api_key is not None:
+            headers["x-api-key"] = self.api_key
+        req = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"),
+                                     headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT_S) as resp:
+                return resp.status, _json_or_text(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _json_or_text(e.read())
+
+
+def send_request(target, payload: dict, timings: bool = True) -> dict:
+    """Send one request and classify its outcome."""
+    payload = {**payload, "timings": True} if timings else payload
+    headers = {"X-Correlation-Id": str(uuid.uuid4())}
+    start = time.perf_counter()
+    try:
+        status, body = target.send(payload, headers)
+    except Exception as e:  # transport failure, no response
+        return {"status": None, "latency_s": time.perf_counter() - start,
+                "error_class": type(e).__name__, "caches": {}}
+    latency_s = time.perf_counter() - start
+    return {
+        "status": status,
+        "latency_s": latency_s,
+        "error_class": error_class(status, body),
+        "caches": {
+            key: value for key,value in _timings(body).items() if key.endswith(CACHE_SUFFIX)
+        },
+    }
+
+
+def error_class(status: int, body) -> str:
+    """Class of a failed request: the error type reported by the workflow or
+    the API Lambda, else the HTTP status."""
+    if status is not None and status < 400:
+        return None
+    error = body.get("error") if isinstance(body, dict) else None
+    if isinstance(error, dict):
+        return error.get("errorType") or str(status)
+    return str(status)
+
+
+def run_closed_loop(target, corpus: list[dict], concurrency: int,
+                    n_requests: int = None, duration_s: float = None) -> list[dict]:
+    """`concurrency` clients send requests back to back until `n_requests`
+    were sent or `duration_s` elapsed."""
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(n_requests) if n_requests is not None else _count())
+    deadline = time.perf_counter() + duration_s if duration_s is not None else None
+
+    def client():
+        while deadline is None or time.perf_counter() < deadline:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            result = send_request(target, corpus[i % len(corpus)])
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run_open_loop(target, corpus: list[dict], rate: float, concurrency: int,
+                  n_requests: int = None, duration_s: float = None) -> list[dict]:
+    """Send `rate` requests per second from up to `concurrency` clients until
+    `n_requests` were sent or `duration_s` elapsed. Latency counts from the
+    scheduled send time."""
+    if n_requests is None:
+        n_requests = int(rate*duration_s)
+    start = time.perf_counter()
+
+    def scheduled(i: int) -> dict:
+        send_at = start + i/rate
+        result = send_request(target, corpus[i % len(corpus)])
+        # include the time the request waited for a free client
+        result["latency_s"] = time.perf_counter() - send_at
+        return result
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(n_requests):
+            delay_s = start + i/rate - time.perf_counter()
+            if delay_s > 0:
+                time.sleep(delay_s)
+            futures.append(pool.submit(scheduled, i))
+    return [f.result() for f in futures]
+
+
+def summarize(results: list[dict], elapsed_s: float, known_errors: dict) -> dict:
+    """Throughput, latency, status codes, error classes and cache hit rates."""
+    latencies_ms = np.array([r["latency_s"] for r in results])*1000
+    n_ok = sum(1 for r in results if r["error_class"] is None)
+    summary = {
+        "requests": len(results),
+        "elapsed_s": round(elapsed_s, 3),
+        "qps": round(len(results)/elapsed_s, 3) if elapsed_s > 0 else None,
+        "success_qps": round(n_ok/elapsed_s, 3) if elapsed_s > 0 else None,
+        "latency_ms": {},
+        "histogram_ms": {},
+        "status_codes": dict(Counter(str(r["status"]) for r in results)),
+        "error_classes": {},
+        "caches": {},
+    }
+    if len(results) > 0:
+        summary["latency_ms"]["min"] = round(float(latencies_ms.min()), 3)
+        for p in PERCENTILES:
+            summary["latency_ms"][f"p{p:g}"] = round(float(np.percentile(latencies_ms, p)), 3)
+        summary["latency_ms"]["max"] = round(float(latencies_ms.max()), 3)
+        counts = np.bincount(np.searchsorted(HISTOGRAM_BUCKETS_MS, latencies_ms),
+                             minlength=len(HISTOGRAM_BUCKETS_MS) + 1)
+        labels = [f"<={b}" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}"]
+        summary["histogram_ms"] = {label: int(c) for label,c in zip(labels, counts)}
+
+    errors = defaultdict(lambda: {"count": 0, "status_codes": Counter()})
+    for r in results:
+        if r["error_class"] is not None:
+            errors[r["error_class"]]["count"] += 1
+            errors[r["error_class"]]["status_codes"][str(r["status"])] += 1
+    for name,e in errors.items():
+        known_status = known_errors.get(name)
+        summary["error_classes"][name] = {
+            "count": e["count"],
+            "status_codes": dict(e["status_codes"]),
+            # status the API maps the error to, None when it is unexpected (500)
+            "known_status": int(known_status) if known_status is not None else None,
+        }
+
+    caches = defaultdict(Counter)
+    for r in results:
+        for name,outcome in r["caches"].items():
+            caches[name][outcome] += 1
+    for name,outcomes in caches.items():
+        total = sum(outcomes.values())
+        summary["caches"][name] = {
+            **outcomes, "hit_rate": round(outcomes.get("hit", 0)/total, 4)
+        }
+    return summary
+
+
+def print_report(summary: dict):
+    print(f"\n{summary['requests']} requests in {summary['elapsed_s']:.1f} s: "
+          f"{summary['qps']} QPS ({summary['success_qps']} successful)")
+    print("latency: " + "  ".join(f"{k} {v:.1f} ms" for k,v in summary["latency_ms"].items()))
+    n_max = max(summary["histogram_ms"].values(), default=0)
+    for label,count in summary["histogram_ms"].items():
+        bar = "#"*round(40*count/n_max) if n_max else ""
+        print(f"  {label:>8} ms {count:>7} {bar}")
+    print("status codes: " + ", ".join(f"{k}: {v}" for k,v in sorted(summary["status_codes"].items())))
+    for name,e in summary["error_classes"].items():
+        known = f"maps to {e['known_status']}" if e["known_status"] is not None else "unknown error"
+        print(f"  {name:<32}{e['count']:>7}  ({known}, got {e['status_codes']})")
+    for name,c in summary["caches"].items():
+        print(f"{name}: {c['hit_rate']:.1%} hits ({c.get('hit', 0)} hit, {c.get('miss', 0)} miss)")
+
+
+def _timings(body) -> dict:
+    if not isinstance(body, dict):
+        return {}
+    return body.get("metadata", {}).get("timings") or {}
+
+
+def _json_or_text(data: bytes):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data.decode("utf-8", errors="replace")
+
+
+def _count():
+    i = 0
+    while True:
+        yield i
+        i += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", dest="target", type=str, default=IN_PROCESS_TARGET,
+                        help=f"'{IN_PROCESS_TARGET}' or the URL of a /rank endpoint")
+    parser.add_argument("--api-key", dest="api_key", type=str, required=False,
+                        help="API key sent as x-api-key (deployed APIs)")
+    parser.add_argument("--excel-file", dest="excel_file", type=str, default=DEFAULT_EXCEL_FN,
+                        help="Community data workbook of the in-process target")
+    parser.add_argument("--corpus", dest="corpus", type=str, action="append",
+                        help="JSON request file or directory (repeatable), defaults to tests/events")
+    parser.add_argument("--profiles", dest="n_profiles", type=int, default=0,
+                        help="Number of synthetic profiles to add to the corpus")
+    parser.add_argument("--seed", dest="seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed of the synthetic profiles")
+    parser.add_argument("--concurrency", dest="concurrency", type=int, default=1,
+                        help="Number of concurrent clients")
+    parser.add_argument("--rate", dest="rate", type=float, required=False,
+                        help="Requests per second (open loop), default: back to back (closed loop)")
+    parser.add_argument("--requests", dest="n_requests", type=int, required=False,
+                        help="Number of requests to send")
+    parser.add_argument("--duration-s", dest="duration_s", type=float, required=False,
+                        help="Send requests for this long")
+    parser.add_argument("--warmup", dest="warmup", type=int, default=1,
+                        help="Requests sent (and not reported) before the test, e.g. cold starts")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the report")
+    args = parser.parse_args()
+    if args.n_requests is None and args.duration_s is None:
+        args.n_requests = 100
+
+    corpus = load_corpus(args.corpus, args.n_profiles, args.seed)
+    if args.target == IN_PROCESS_TARGET:
+        target = InProcessTarget(args.excel_file)
+        known_errors = target.service.get_lambda(RANK_API_LAMBDA).app.KNOWN_ERRORS
+    else:
+        target = HttpTarget(args.target, args.api_key)
+        known_errors = LocalService().get_lambda(RANK_API_LAMBDA).app.KNOWN_ERRORS
+        quiet_lambda_loggers()
+    for i in range(args.warmup):
+        send_request(target, corpus[i % len(corpus)])
+
+    print(f"sending {args.n_requests or f'{args.duration_s} s of'} requests to {args.target} "
+          f"({len(corpus)} distinct requests, concurrency {args.concurrency}"
+          f"{f', {args.rate}/s' if args.rate else ''})", flush=True)
+    start = time.perf_counter()
+    if args.rate is None:
+        results = run_closed_loop(target, corpus, args.concurrency, args.n_requests, args.duration_s)
+    else:
+        results = run_open_loop(target, corpus, args.rate, args.concurrency,
+                                args.n_requests, args.duration_s)
+    summary = summarize(results, time.perf_counter() - start, known_errors)
+    print_report(summary)
+
+    if args.json_file is not None:
+        report = {
+            "config": {
+                "target": args.target,
+                "corpus": args.corpus or [TEST_EVENTS_PATH],
+                "n_profiles": args.n_profiles,
+                "seed": args.seed,
+                "concurrency": args.concurrency,
+                "rate": args.rate,
+                "requests": args.n_requests,
+                "duration_s": args.duration_s,
+                "warmup": args.warmup,
+            },
+            "summary": summary,
+        }
+        with open(args.json_file, "w") as fp:
+            json.dump(report, fp, indent=4)
@@ -0,0 +1,704 @@
+"""Run the API Lambdas and their Step Functions workflows end to end, in process.
+
+The state machines are read from `service/template.yaml` (DefinitionUri and
+DefinitionSubstitutions), so `sfn_rank.yaml` and `sfn_update_data.yaml` run
+as deployed with each Lambda ARN resolved to the `src.app.lambda_handler` of
+its package. Executions run in a thread per execution like the real service:
+the API Lambdas launch them and poll for the result with the
+`launch_sfn`/`poll_sfn`/`get_exec_hist` calls they use in AWS, which are
+answered in the shape of the Step Functions API (DescribeExecution and
+GetExecutionHistory). Retry and Catch blocks, Parameters (static values and
+"$.a.b" paths) and ResultPath are honored. `--fault-rate` injects
+Lambda.ServiceException errors to exercise them. `serve` exposes the API
+routes over HTTP like API Gateway's Lambda proxy integration.
+
+The community bucket is replaced with `LocalObjectStore`, an in-memory,
+versioned stand-in for the s3 calls the Lambdas make. Each workflow Lambda
+keeps a single warm instance: its invocations are serialized, as with a
+reserved concurrency of 1, which also keeps the `cdtmp` working directories
+of concurrent invocations from interleaving. The API Lambdas only wait on
+their workflow and run concurrently.
+
+Usage (from the project root):
+    python tools/local_sfn.py rank tests/events/01_valid_event.json \\
+        --excel-file tests/data/55+_Communities_v1.xlsx
+    python tools/local_sfn.py update_data tests/data/55+_Communities_v1.xlsx --history
+    python tools/local_sfn.py rank tests/events/01_valid_event.json \\
+        --excel-file tests/data/55+_Communities_v1.xlsx --repeat 20 --fault-rate 0.1 --retry-time-scale 0
+    python tools/local_sfn.py serve --excel-file tests/data/55+_Communities_v1.xlsx --port 3000
+    python tools/local_sfn.py canary --excel-file tests/data/55+_Communities_v1.xlsx
+"""
+
+import argparse
+import base64
+from collections import defaultdict
+from datetime import datetime, timezone
+import glob
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from botocore.exceptions import ClientError
+import yaml
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PROJ_ROOT_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), os.pardir
+)
+SERVICE_PATH = os.path.join(PROJ_ROOT_PATH, "service")
+TEMPLATE_FN = os.path.join(SERVICE_PATH, "template.yaml")
+LAYERS_PATH = os.path.join(SERVICE_PATH, "layers")
+LAYER_PACKAGES = ["observability"]  # packages of the layers in LAYERS_PATH
+LOCAL_REGION = "local"
+LOCAL_ACCOUNT = "000000000000"
+# values of the template parameters the Lambdas read
+LOCAL_PARAMETERS = {
+    "CommunityDataS3Bucket": "local-community-data",
+    "CommunityDataS3Object": "55+_Communities.xlsx",
+}
+# Retry defaults of the Amazon States Language
+DEFAULT_RETRY_INTERVAL_S = 1
+DEFAULT_RETRY_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF_RATE = 2.0
+SUPPORTED_STATE_TYPES = ["Task", "Pass", "Succeed", "Fail"]
+INJECTED_ERROR = "Lambda.ServiceException"
+DEFAULT_PORT = 3000
+CANARY_LOGICAL_ID = "RunRankingCanary"
+LAMBDA_MODULE_NAMES = {}  # Lambda package name -> MODULE_NAME, filled on load
+# the layers are on the path of the deployed Lambdas
+sys.path.extend(glob.glob(os.path.join(LAYERS_PATH, "*", "python")))
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class LocalObjectStore:
+    """In-memory, versioned stand-in for the s3 client calls the Lambdas make
+    (put_object, get_object, head_object, download_file, upload_file)."""
+    def __init__(self):
+        self.objects = defaultdict(list)  # (bucket, key) -> versions, latest last
+        self.lock = threading.Lock()
+
+    def put_object(self, Body, Bucket: str, Key: str, **kwargs) -> dict:
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        data = Body.encode() if isinstance(Body, str) else bytes(Body)
+        version = {
+            "VersionId": uuid.uuid4().hex,
+            "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+            "LastModified": datetime.now(timezone.utc),
+            "Body": data,
+        }
+        with self.lock:
+            self.objects[(Bucket, Key)].append(version)
+        return {"VersionId": version["VersionId"], "ETag": version["ETag"]}
+
+    def head_object(self, Bucket: str, Key: str, VersionId: str = None, **kwargs) -> dict:
+        version = self._get_version(Bucket, Key, VersionId, "HeadObject")
+        return {
+            "VersionId": version["VersionId"],
+            "ETag": version["ETag"],
+            "LastModified": version["LastModified"],
+            "ContentLength": len(version["Body"]),
+        }
+
+    def get_object(self, Bucket: str, Key: str, VersionId: str = None, **kwargs) -> dict:
+        version = self._get_version(Bucket, Key, VersionId, "GetObject")
+        return {
+            **self.head_object(Bucket, Key, version["VersionId"]),
+            "Body": io.BytesIO(version["Body"]),
+        }
+
+    def download_file(self, Bucket: str, Key: str, Filename: str,
+                      ExtraArgs: dict = None, **kwargs):
+        version = self._get_version(Bucket, Key, (ExtraArgs or {}).get("VersionId"), "HeadObject")
+        with open(Filename, "wb") as fp:
+            fp.write(version["Body"])
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: dict = None, **kwargs):
+        with open(Filename, "rb") as fp:
+            self.put_object(fp, Bucket, Key)
+
+    def _get_version(self, bucket: str, key: str, version_id: str, operation: str) -> dict:
+        with self.lock:
+            versions = list(self.objects.get((bucket, key), []))
+        if version_id is not None:
+            versions = [v for v in versions if v["VersionId"] == version_id]
+        if not versions:
+            # head requests carry no error body, s3 only answers 404
+            code = "404" if operation == "HeadObject" else "NoSuchKey"
+            raise ClientError({"Error": {"Code": code, "Message": "Not Found"}}, operation)
+        return versions[-1]
+
+
+class LambdaError(Exception):
+    """Error of a Lambda invocation, as Step Functions reports it."""
+    def __init__(self, error: str, cause: str):
+        super().__init__(error)
+        self.error = error
+        self.cause = cause
+
+
+class LocalContext:
+    """The parts of the Lambda context object the handlers use."""
+    def __init__(self, function_name: str, memory_size: int, timeout_s: int):
+        self.function_name = function_name
+        self.memory_limit_in_mb = memory_size
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.time() + timeout_s
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.time())*1000))
+
+
+class LocalLambda:
+    """A Lambda function of the template, loaded from its package on first
+    invocation. The package is imported under its own name (not `src`) so all
+    Lambdas can live in one process."""
+    def __init__(self, logical_id: str, code_uri: str, memory_size: int,
+                 timeout_s: int, env: dict, serialized: bool = True):
+        self.logical_id = logical_id
+        self.code_path = os.path.join(SERVICE_PATH, code_uri)
+        self.package = os.path.basename(os.path.normpath(code_uri))
+        self.memory_size = memory_size
+        self.timeout_s = timeout_s
+        self.env = env
+        self.app = None
+        self.init_ms = None  # cold start: import time of the handler module
+        self.serialized = serialized
+        self.lock = threading.Lock()
+
+    @property
+    def arn(self) -> str:
+        return f"arn:aws:lambda:{LOCAL_REGION}:{LOCAL_ACCOUNT}:function:{self.logical_id}"
+
+    def load(self):
+        """Import the handler module with the function's environment."""
+        if self.app is not None:
+            return self.app
+        start = time.perf_counter()
+        self.app = load_package(f"{self.package}_src", os.path.join(self.code_path, "src"), self.env)
+        self.init_ms = round((time.perf_counter() - start)*1000, 3)
+        LAMBDA_MODULE_NAMES[self.package] = self.app.MODULE_NAME
+        return self.app
+
+    def invoke(self, event):
+        """Invoke the handler with a JSON copy of the event and return a JSON
+        copy of its output. A raised exception becomes a `LambdaError` whose
+        error is the exception type, like the Python runtime reports it."""
+        with self.lock:
+            app = self.load()
+        if not self.serialized:
+            return self._invoke(app, event)
+        with self.lock:
+            return self._invoke(app, event)
+
+    def _invoke(self, app, event):
+        context = LocalContext(self.logical_id, self.memory_size, self.timeout_s)
+        try:
+            output = app.lambda_handler(json.loads(json.dumps(event)), context)
+            return json.loads(json.dumps(output))
+        except Exception as e:
+            error = type(e).__name__
+            cause = json.dumps({
+                "errorMessage": str(e),
+                "errorType": error,
+                "requestId": context.aws_request_id,
+                "stackTrace": traceback.format_tb(e.__traceback__),
+            })
+            raise LambdaError(error, cause) from e
+
+
+class LocalStepFunctions:
+    """Runs state machine executions in threads and answers the calls the API
+    Lambdas make to the Step Functions service."""
+    def __init__(self, retry_time_scale: float = 1.0, fault_rate: float = 0.0,
+                 seed: int = None):
+        self.state_machines = {}  # arn -> {"name", "definition", "resources"}
+        self.executions = {}  # arn -> execution
+        self.retry_time_scale = retry_time_scale  # 0 retries without waiting
+        self.fault_rate = fault_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def create_state_machine(self, name: str, definition: dict, resources: dict) -> str:
+        """Register a state machine whose Task resources (ARNs) are invoked
+        through `resources`, a dict of ARN -> LocalLambda."""
+        for state_name,state in definition["States"].items():
+            if state["Type"] not in SUPPORTED_STATE_TYPES:
+                raise NotImplementedError(f"state {state_name} of {name}: "
+                                          f"{state['Type']} states are not supported")
+        arn = f"arn:aws:states:{LOCAL_REGION}:{LOCAL_ACCOUNT}:stateMachine:{name}"
+        self.state_machines[arn] = {"name": name, "definition": definition, "resources": resources}
+        return arn
+
+    def launch_sfn(self, state_machine_arn: str, payload: dict) -> str:
+        """Start an execution, return its ARN."""
+        state_machine = self.state_machines[state_machine_arn]
+        name = str(uuid.uuid4())
+        execution = {
+            "executionArn": f"arn:aws:states:{LOCAL_REGION}:{LOCAL_ACCOUNT}:execution:"
+                            f"{state_machine['name']}:{name}",
+            "stateMachineArn": state_machine_arn,
+            "name": name,
+            "status": "RUNNING",
+            "startDate": datetime.now(timezone.utc),
+            "input": json.dumps(payload),
+            "events": [],
+        }
+        with self.lock:
+            self.executions[execution["executionArn"]] = execution
+        thread = threading.Thread(target=self._run, args=(execution, state_machine), daemon=True)
+        thread.start()
+        return execution["executionArn"]
+
+    def describe_execution(self, execution_arn: str) -> dict:
+        """The execution as the DescribeExecution API returns it."""
+        execution = self.executions[execution_arn]
+        return {k: v for k,v in execution.items() if k != "events"}
+
+    def poll_sfn(self, execution_arn: str, step: float = 1) -> dict:
+        """Describe the execution every `step` seconds until it stops, as the
+        API Lambdas do in AWS (the polling interval is part of their latency)."""
+        while True:
+            resp = self.describe_execution(execution_arn)
+            if resp["status"] != "RUNNING":
+                return resp
+            time.sleep(step)
+
+    def get_exec_hist(self, execution_arn: str) -> dict:
+        """The execution history as the GetExecutionHistory API returns it."""
+        return {"events": list(self.executions[execution_arn]["events"])}
+
+    def _run(self, execution: dict, state_machine: dict):
+        definition = state_machine["definition"]
+        self._add_event(execution, "ExecutionStarted", "executionStartedEventDetails", {
+            "input": execution["input"], "roleArn": "local"
+        })
+        state_name = definition["StartAt"]
+        data = json.loads(execution["input"])
+        try:
+            while state_name is not None:
+                state = definition["States"][state_name]
+                data, state_name = self._run_state(execution, state_machine, state_name, state, data)
+        except LambdaError as e:
+            self._stop(execution, "FAILED", "ExecutionFailed", "executionFailedEventDetails",
+                       {"error": e.error, "cause": e.cause})
+            return
+        except Exception as e:  # the emulator itself failed
+            self._stop(execution, "FAILED", "ExecutionFailed", "executionFailedEventDetails",
+                       {"error": "States.Runtime", "cause": f"{type(e).__name__}: {e}"})
+            return
+        self._stop(execution, "SUCCEEDED", "ExecutionSucceeded", "executionSucceededEventDetails",
+                   {"output": json.dumps(data)})
+
+    def _run_state(self, execution: dict, state_machine: dict, state_name: str,
+                   state: dict, data) -> tuple:
+        """Run one state and return its output and the next state (None at the
+        end of the execution)."""
+        state_type = state["Type"]
+        self._add_event(execution, f"{state_type}StateEntered", "stateEnteredEventDetails", {
+            "name": state_name, "input": json.dumps(data)
+        })
+        if state_type == "Fail":
+            raise LambdaError(state.get("Error", "States.Fail"), state.get("Cause", ""))
+        next_state = None if state_type == "Succeed" or state.get("End") else state.get("Next")
+        if state_type == "Pass":
+            data = _apply_result_path(data, state.get("ResultPath", "$"), state.get("Result", data))
+        elif state_type == "Task":
+            local_lambda = state_machine["resources"][state["Resource"]]
+            task_input = _apply_parameters(state["Parameters"], data) if "Parameters" in state else data
+            try:
+                result = self._run_task(execution, local_lambda, state.get("Retry", []), task_input)
+                data = _apply_result_path(data, state.get("ResultPath", "$"), result)
+            except LambdaError as e:
+                catcher = next((c for c in state.get("Catch", []) if _error_matches(e.error, c)), None)
+                if catcher is None:
+                    raise
+                data = _apply_result_path(data, catcher.get("ResultPath", "$"),
+                                          {"Error": e.error, "Cause": e.cause})
+                next_state = catcher["Next"]
+        self._add_event(execution, f"{state_type}StateExited", "stateExitedEventDetails", {
+            "name": state_name, "output": json.dumps(data)
+        })
+        return data, next_state
+
+    def _run_task(self, execution: dict, local_lambda: LocalLambda, retriers: list, data):
+        """Invoke the Lambda of a Task state, retrying as its Retry block says."""
+        attempts = [0]*len(retriers)
+        while True:
+            self._add_event(execution, "LambdaFunctionScheduled",
+                            "lambdaFunctionScheduledEventDetails",
+                            {"resource": local_lambda.arn, "input": json.dumps(data)})
+            self._add_event(execution, "LambdaFunctionStarted")
+            try:
+                if self.fault_rate > 0 and self.random.random() < self.fault_rate:
+                    raise LambdaError(INJECTED_ERROR, "injected by local_sfn --fault-rate")
+                output = local_lambda.invoke(data)
+            except LambdaError as e:
+                self._add_event(execution, "LambdaFunctionFailed",
+                                "lambdaFunctionFailedEventDetails",
+                                {"error": e.error, "cause": e.cause})
+                i = next((i for i,r in enumerate(retriers) if _error_matches(e.error, r)), None)
+                if i is None or attempts[i] >= retriers[i].get("MaxAttempts", DEFAULT_RETRY_MAX_ATTEMPTS):
+                    raise
+                retrier = retriers[i]
+                delay_s = retrier.get("IntervalSeconds", DEFAULT_RETRY_INTERVAL_S) \
+                    * retrier.get("BackoffRate", DEFAULT_RETRY_BACKOFF_RATE)**attempts[i]
+                if "MaxDelaySeconds" in retrier:
+                    delay_s = min(delay_s, retrier["MaxDelaySeconds"])
+                attempts[i] += 1
+                time.sleep(delay_s*self.retry_time_scale)
+                continue
+            self._add_event(execution, "LambdaFunctionSucceeded",
+                            "lambdaFunctionSucceededEventDetails", {"output": json.dumps(output)})
+            return output
+
+    def _stop(self, execution: dict, status: str, event_type: str,
+              details_key: str, details: dict):
+        self._add_event(execution, event_type, details_key, details)
+        if status == "SUCCEEDED":
+            execution["output"] = details["output"]
+        else:
+            execution["error"], execution["cause"] = details["error"], details["cause"]
+        execution["stopDate"] = datetime.now(timezone.utc)
+        execution["status"] = status
+
+    def _add_event(self, execution: dict, event_type: str,
+                   details_key: str = None, details: dict = None):
+        events = execution["events"]
+        event = {
+            "timestamp": datetime.now(timezone.utc),
+            "type": event_type,
+            "id": len(events) + 1,
+            "previousEventId": len(events),
+        }
+        if details_key is not None:
+            event[details_key] = details
+        events.append(event)
+
+
+class LocalService:
+    """The Lambdas and workflows of `service/template.yaml` wired together
+    in process, with the community bucket in a `LocalObjectStore`."""
+    def __init__(self, retry_time_scale: float = 1.0, fault_rate: float = 0.0,
+                 seed: int = None):
+        self.object_store = LocalObjectStore()
+        self.sfn = LocalStepFunctions(retry_time_scale, fault_rate, seed)
+        template = load_template()
+        resources = template["Resources"]
+        defaults = template.get("Globals", {}).get("Function", {})
+
+        functions = {k: r for k,r in resources.items() if r["Type"] == "AWS::Serverless::Function"}
+        workflows = {k: r for k,r in resources.items() if r["Type"] == "AWS::Serverless::StateMachine"}
+        state_machine_arns = {
+            name: f"arn:aws:states:{LOCAL_REGION}:{LOCAL_ACCOUNT}:stateMachine:{name}"
+            for name in workflows
+        }
+
+        def resolve(value):
+            """Resolve the intrinsic functions used for env vars and ARNs."""
+            if isinstance(value, dict) and "Ref" in value:
+                ref = value["Ref"]
+                return state_machine_arns.get(ref) or LOCAL_PARAMETERS.get(ref, ref)
+            if isinstance(value, dict) and "GetAtt" in value:
+                return self.lambdas[value["GetAtt"].split(".")[0]].arn
+            return value
+
+        self.lambdas = {}
+        self.api_routes = {}  # API path -> logical ID
+        for logical_id,resource in functions.items():
+            props = {**defaults, **resource["Properties"]}
+            env = props.get("Environment", {}).get("Variables", {})
+            api_paths = [e["Properties"]["Path"].strip("/")
+                         for e in props.get("Events", {}).values() if e["Type"] == "Api"]
+            self.lambdas[logical_id] = LocalLambda(
+                logical_id, props["CodeUri"], props["MemorySize"], props["Timeout"],
+                {k: str(resolve(v)) for k,v in env.items()}, serialized=not api_paths
+            )
+            for path in api_paths:
+                self.api_routes[path] = logical_id
+
+        by_arn = {l.arn: l for l in self.lambdas.values()}
+        for name,resource in workflows.items():
+            props = resource["Properties"]
+            with open(os.path.join(SERVICE_PATH, props["DefinitionUri"]), "r") as fp:
+                definition = fp.read()
+            for key,value in props.get("DefinitionSubstitutions", {}).items():
+                definition = definition.replace(f"${{{key}}}", resolve(value))
+            self.sfn.create_state_machine(name, yaml.safe_load(definition), by_arn)
+
+    @property
+    def bucket(self) -> str:
+        return LOCAL_PARAMETERS["CommunityDataS3Bucket"]
+
+    @property
+    def object_name(self) -> str:
+        return LOCAL_PARAMETERS["CommunityDataS3Object"]
+
+    def upload_community_data(self, xlsx_fn: str) -> str:
+        """Put a workbook in the community bucket. Returns its version ID."""
+        with open(xlsx_fn, "rb") as fp:
+            return self.object_store.put_object(fp, self.bucket, self.object_name)["VersionId"]
+
+    def get_lambda(self, logical_id: str) -> LocalLambda:
+        """A Lambda of the template, loaded and wired to the local services."""
+        local_lambda = self.lambdas[logical_id]
+        app = local_lambda.load()
+        if hasattr(app, "s3_client"):
+            app.s3_client = self.object_store
+        for name in ["launch_sfn", "poll_sfn", "get_exec_hist"]:
+            if hasattr(app, name):
+                setattr(app, name, getattr(self.sfn, name))
+        return local_lambda
+
+    def load(self):
+        """Load every Lambda (the cold starts) ahead of the first request."""
+        for logical_id in self.lambdas:
+            self.get_lambda(logical_id)
+
+    def call_api(self, path: str, body, headers: dict = None) -> dict:
+        """Call an API route like API Gateway's Lambda proxy integration does and
+        return the Lambda response ({"statusCode", "body"})."""
+        logical_id = self.api_routes[path.strip("/")]
+        self.load()  # the workflow Lambdas must be wired before the first execution
+        event = {
+            "resource": f"/{path.strip('/')}",
+            "httpMethod": "POST",
+            "headers": headers or {},
+            "body": body if isinstance(body, str) else json.dumps(body),
+        }
+        return self.get_lambda(logical_id).invoke(event)
+
+    def rank(self, payload: dict, headers: dict = None) -> dict:
+        """POST a ranking request to /rank."""
+        return self.call_api("rank", payload, headers)
+
+    def update_data(self, xlsx_fn: str, headers: dict = None) -> dict:
+        """POST a workbook to /update_data (API Gateway base64 encodes binary bodies)."""
+        with open(xlsx_fn, "rb") as fp:
+            body = base64.b64encode(fp.read()).decode("utf-8")
+        return self.call_api("update_data", body, headers)
+
+    def canary(self, event: dict = None) -> dict:
+        """Run the ranking canary as its schedule does and return its report."""
+        self.load()
+        return self.get_lambda(CANARY_LOGICAL_ID).invoke(event or {})
+
+
+def load_package(pkg_name: str, src_dir: str, env: dict = None, module: str = "app"):
+    """Import the `src` package of a Lambda from `src_dir` under the name
+    `pkg_name` and return its `module`. `env` is set while the modules read
+    their env vars (on import)."""
+    prev_env = {k: os.environ.get(k) for k in env or {}}
+    os.environ.update(env or {})
+    try:
+        spec = importlib.util.spec_from_file_location(
+            pkg_name, os.path.join(src_dir, "__init__.py"),
+            submodule_search_locations=[src_dir]
+        )
+        pkg = importlib.util.module_from_spec(spec)
+        sys.modules[pkg_name] = pkg
+        spec.loader.exec_module(pkg)
+        return importlib.import_module(f"{pkg_name}.{module}")
+    finally:
+        for k,v in prev_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def serve(service: LocalService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    """Serve the API routes over HTTP (POST /rank, POST /update_data) until
+    interrupted, each request on its own thread."""
+    class ApiHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            path = self.path.split("?")[0].strip("/")
+            if path not in service.api_routes:
+                self._respond(404, json.dumps({"message": "Not Found"}))
+                return
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if path == "update_data":  # binary body, base64 encoded by API Gateway
+                body = base64.b64encode(data).decode("utf-8")
+            else:
+                body = data.decode("utf-8")
+            try:
+                resp = service.call_api(path, body, dict(self.headers))
+            except LambdaError as e:  # unhandled in the API Lambda: API Gateway answers 502
+                self._respond(502, json.dumps({"message": "Internal server error",
+                                               "error": e.error}))
+                return
+            self._respond(resp["statusCode"], resp["body"])
+
+        def _respond(self, status: int, body: str):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # the Lambdas log each request
+
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    print(f"serving {', '.join('/' + p for p in service.api_routes)} on http://{host}:{port}",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def load_template(template_fn: str = TEMPLATE_FN) -> dict:
+    """Read the SAM template, keeping intrinsic functions (e.g. !GetAtt X.Arn)
+    as {"GetAtt": "X.Arn"}."""
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+
+    def intrinsic(loader, tag_suffix, node):
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+        return {tag_suffix: value}
+
+    TemplateLoader.add_multi_constructor("!", intrinsic)
+    with open(template_fn, "r") as fp:
+        return yaml.load(fp, Loader=TemplateLoader)
+
+
+def quiet_lambda_loggers(level: int = logging.WARNING):
+    """The Lambdas log every event they handle (including base64 workbooks),
+    keep the console readable."""
+    names = set(LAMBDA_MODULE_NAMES.values()) | set(LAYER_PACKAGES)
+    for name in list(logging.root.manager.loggerDict):
+        if name.split(".")[0] in names:
+            logging.getLogger(name).setLevel(level)
+
+
+def _apply_parameters(parameters, data):
+    """Task input from a Parameters block: keys ending in ".$" take the value
+    at their path in the state input."""
+    if isinstance(parameters, dict):
+        return {
+            (k[:-2] if k.endswith(".$") else k): (_get_path(data, v) if k.endswith(".$")
+                                                  else _apply_parameters(v, data))
+            for k,v in parameters.items()
+        }
+    return parameters
+
+
+def _apply_result_path(data, result_path: str, result):
+    """State output from a ResultPath: "$" replaces the input with the result,
+    "$.a.b" nests the result in (a copy of) the input and null keeps the input."""
+    if result_path is None:
+        return data
+    if result_path == "$":
+        return result
+    output = json.loads(json.dumps(data))
+    keys = result_path[2:].split(".")
+    node = output
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+    node[keys[-1]] = result
+    return output
+
+
+def _get_path(data, path: str):
+    """Value at a reference path ("$" or "$.a.b")."""
+    for key in path[2:].split(".") if path != "$" else []:
+        data = data[key]
+    return data
+
+
+def _error_matches(error: str, retrier: dict) -> bool:
+    """Whether a Retry (or Catch) block applies to an error."""
+    error_equals = retrier["ErrorEquals"]
+    if "States.ALL" in error_equals:
+        return True
+    if "States.TaskFailed" in error_equals and error != "States.Timeout":
+        return True
+    return error in error_equals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("api", type=str, choices=["rank", "update_data", "serve", "canary"],
+                        help="API route to call, serve the routes over HTTP or run the canary")
+    parser.add_argument("request_file", type=str, nargs="?",
+                        help="JSON request body (rank), Excel workbook (update_data) "
+                             "or canary event (canary)")
+    parser.add_argument("--port", dest="port", type=int, default=DEFAULT_PORT,
+                        help="Port to serve the API on (serve)")
+    parser.add_argument("--excel-file", dest="excel_file", type=str, required=False,
+                        help="Excel workbook to put in the community bucket first")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=1,
+                        help="Number of requests to send")
+    parser.add_argument("--retry-time-scale", dest="retry_time_scale", type=float, default=1.0,
+                        help="Scale of the Retry intervals (0 retries immediately)")
+    parser.add_argument("--fault-rate", dest="fault_rate", type=float, default=0.0,
+                        help=f"Fraction of Lambda invocations failing with {INJECTED_ERROR}")
+    parser.add_argument("--seed", dest="seed", type=int, required=False,
+                        help="Random seed of the injected faults")
+    parser.add_argument("--history", dest="history", action="store_true",
+                        help="Print the execution history of the last request")
+    parser.add_argument("--verbose", dest="verbose", action="store_true",
+                        help="Keep the Lambda logs")
+    args = parser.parse_args()
+
+    service = LocalService(args.retry_time_scale, args.fault_rate, args.seed)
+    service.load()
+    if not args.verbose:
+        quiet_lambda_loggers()
+    if args.excel_file is not None:
+        service.upload_community_data(args.excel_file)
+    if args.api == "serve":
+        serve(service, port=args.port)
+        sys.exit(0)
+    if args.api == "canary":
+        event = {}
+        if args.request_file is not None:
+            with open(args.request_file, "r") as fp:
+                event = json.load(fp)
+        report = service.canary(event)
+        print(json.dumps({k: v for k,v in report.items() if k != "requests"}, indent=4))
+        sys.exit(0 if report["passed"] else 1)
+    if args.request_file is None:
+        parser.error(f"{args.api} requires a request_file")
+
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        if args.api == "rank":
+            with open(args.request_file, "r") as fp:
+                resp = service.rank(json.load(fp))
+        else:
+            resp = service.update_data(args.request_file)
+        elapsed_ms = (time.perf_counter() - start)*1000
+        print(f"request {i + 1}: {resp['statusCode']} in {elapsed_ms:.1f} ms")
+    print(json.dumps(json.loads(resp["body"]), indent=4))
+
+    if args.history:
+        execution_arn = json.loads(resp["body"])["metadata"].get("executionArn")
+        if execution_arn is not None:
+            for event in service.sfn.get_exec_hist(execution_arn)["events"]:
+                details = {k: v for k,v in event.items()
+                           if k not in ["timestamp", "type", "id", "previousEventId"]}
+                print(f"{event['id']:>3} {event['timestamp'].isoformat()} {event['type']:<28}"
+                      f"{json.dumps(details)[:120]}")
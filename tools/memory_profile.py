@@ -0,0 +1,367 @@
+"""Measure the peak memory of each Lambda handler and recommend its MemorySize.
+
+Every Lambda of `service/template.yaml` is run against synthetic workbooks of
+growing size (see `synthetic_data.py`): the workbook is the payload of the
+update data Lambdas (base64 encoded, as the API delivers it) and the dataset
+the ranking Lambdas read from the community bucket. Each function and size
+runs in a fresh interpreter, like a Lambda execution environment, which
+records
+    baseline_mb     RSS of the interpreter before the handler is imported
+    import_mb       peak RSS after importing the handler module (the init phase)
+    peak_rss_mb     peak RSS of the process over all invocations
+    cold_ms         latency of the first invocation
+    warm_ms         latency percentiles of the following invocations
+    hot spots       the source lines holding the most memory at the traced
+                    peak of the first invocation (tracemalloc, in a separate
+                    process as tracing slows the handler down)
+
+The API Lambdas are measured without their workflow: the execution they
+launch is answered with the output recorded from the workflow's last Lambda
+at the same size, so their peak is their own. The profiled processes only
+import the standard library and `local_sfn.py` besides the Lambda package
+(pandas is not loaded unless the Lambda imports it). The peak RSS is read
+from /proc on linux, where it is reset after the set up; elsewhere it is the
+process' ru_maxrss and includes the set up.
+
+Lambda allocates CPU in proportion to memory (one full vCPU at 1769 MB), so
+the warm p99 measured here on a full core is scaled by 1769/MemorySize below
+that to estimate the latency at each tier. The recommended tier is the
+smallest one whose memory covers the peak RSS plus `--headroom` and whose
+estimated p99 meets `--latency-ms`, at the largest size measured.
+
+Usage (from the project root, needs PyYAML):
+    python tools/memory_profile.py
+    python tools/memory_profile.py --size 1000 --size 100000 --latency-ms 500
+    python tools/memory_profile.py --function RankCommunities --json-file memory.json
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from local_sfn import PROJ_ROOT_PATH, LocalService, quiet_lambda_loggers
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+DEFAULT_WORK_DIR = os.path.join(PROJ_ROOT_PATH, ".benchmarks")
+RANK_EVENT_FN = os.path.join(PROJ_ROOT_PATH, "tests", "events", "01_valid_event.json")
+# run order: the API Lambdas replay the output of their workflow's last Lambda
+FUNCTIONS = [
+    "ValidateRankInputs", "RankCommunities", "RunRealEstateRanking",
+    "ValidateCommunityData", "UpdateCommunityData", "RunUpdateCommunityData",
+]
+API_WORKFLOW_OUTPUTS = {  # API Lambda -> Lambda whose output ends its workflow
+    "RunRealEstateRanking": "RankCommunities",
+    "RunUpdateCommunityData": "UpdateCommunityData",
+}
+MEMORY_TIERS_MB = [128, 256, 512, 1024, 1536, 2048, 3008, 4096, 6144, 8192, 10240]
+FULL_VCPU_MB = 1769  # memory at which a function gets one full vCPU
+PERCENTILES = [50, 99]
+DEFAULT_SEED = 42  # of the synthetic workbooks, as in synthetic_data.py
+PROC_STATUS_FN = "/proc/self/status"
+PROC_CLEAR_REFS_FN = "/proc/self/clear_refs"
+SNAPSHOT_GROWTH = 1.1  # snapshot whenever traced memory reaches 110% of the last snapshot
+N_HOT_SPOTS = 5
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+class RecordedWorkflow:
+    """Answers the Step Functions calls of an API Lambda with a succeeded
+    execution returning `output`, without running the workflow."""
+    def __init__(self, output):
+        self.output = output
+
+    def launch_sfn(self, state_machine_arn: str, payload: dict) -> str:
+        json.dumps(payload)  # the client serializes the payload
+        return f"{state_machine_arn}:recorded"
+
+    def poll_sfn(self, execution_arn: str, step: float = 1) -> dict:
+        return {"status": "SUCCEEDED", "output": json.dumps(self.output)}
+
+    def get_exec_hist(self, execution_arn: str) -> dict:
+        return {"events": []}
+
+
+def build_event(function: str, xlsx_fn: str) -> dict:
+    """The event a function receives for a workbook: the base64 workbook on
+    the update data path, the test homebuyer profile on the ranking path."""
+    with open(RANK_EVENT_FN, "r") as fp:
+        profile = json.load(fp)
+    with open(xlsx_fn, "rb") as fp:
+        xlsx_b64 = base64.b64encode(fp.read()).decode("utf-8")
+    return {
+        "ValidateRankInputs": profile,
+        "RankCommunities": profile,
+        "RunRealEstateRanking": {"httpMethod": "POST", "headers": {}, "body": json.dumps(profile)},
+        "ValidateCommunityData": {"xlsx_base64_encoded": xlsx_b64},
+        "UpdateCommunityData": {"xlsx_base64_encoded": xlsx_b64},
+        "RunUpdateCommunityData": {"httpMethod": "POST", "headers": {}, "body": xlsx_b64},
+    }[function]
+
+
+def profile_function(function: str, xlsx_fn: str, repeat: int,
+                     workflow_output=None, traced: bool = False) -> dict:
+    """Run in a fresh process: import the function and invoke it `repeat`
+    times, or once under tracemalloc if `traced` (tracing slows the handler
+    down, the cold invocation is traced as it loads the caches)."""
+    service = LocalService()
+    service.upload_community_data(xlsx_fn)
+    event = build_event(function, xlsx_fn)
+    payload_kb = len(json.dumps(event))/2**10
+    local_lambda = service.lambdas[function]
+    baseline_mb = rss_mb(peak=False)
+    reset_peak_rss()
+
+    service.get_lambda(function)
+    quiet_lambda_loggers()
+    if function in API_WORKFLOW_OUTPUTS:
+        workflow = RecordedWorkflow(workflow_output)
+        for name in ["launch_sfn", "poll_sfn", "get_exec_hist"]:
+            setattr(local_lambda.app, name, getattr(workflow, name))
+    import_mb = rss_mb()
+
+    if traced:
+        output = None
+
+        def invoke():
+            nonlocal output
+            output = local_lambda.invoke(event)
+
+        traced_peak_mb, hot_spots = trace_invocation(invoke)
+        return {"traced_peak_mb": traced_peak_mb, "hot_spots": hot_spots, "output": output}
+
+    times_ms = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = local_lambda.invoke(event)
+        times_ms.append((time.perf_counter() - start)*1000)
+    peak_mb = rss_mb()
+    return {
+        "function": function,
+        "memory_size": local_lambda.memory_size,
+        "payload_kb": round(payload_kb, 1),
+        "baseline_mb": baseline_mb,
+        "import_mb": import_mb,
+        "peak_rss_mb": peak_mb,
+        "cold_ms": round(times_ms[0], 3),
+        "warm_ms": {
+            f"p{p}": round(percentile(times_ms[1:] or times_ms, p), 3) for p in PERCENTILES
+        },
+        "output": output,
+    }
+
+
+def trace_invocation(invoke) -> tuple[float, list[dict]]:
+    """Peak memory traced during `invoke` and the source lines holding the
+    most memory at that peak. A thread snapshots the traces every time the
+    traced memory grows past the last snapshot, the last one is the peak."""
+    tracemalloc.start()
+    done = threading.Event()
+    snapshots = []  # the latest only, earlier ones would count against the peak
+
+    def sample():
+        last = 0
+        while not done.is_set():
+            current, _ = tracemalloc.get_traced_memory()
+            if current > last*SNAPSHOT_GROWTH:
+                snapshots[:] = [tracemalloc.take_snapshot()]
+                last = current
+            time.sleep(0.001)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        invoke()
+    finally:
+        done.set()
+        sampler.join()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stats = snapshots[-1].statistics("lineno") if snapshots else []
+    hot_spots = [
+        {
+            "location": f"{os.path.relpath(s.traceback[0].filename, PROJ_ROOT_PATH)}:{s.traceback[0].lineno}",
+            "size_mb": round(s.size/2**20, 3),
+            "count": s.count,
+        }
+        for s in stats[:N_HOT_SPOTS]
+    ]
+    return round(traced_peak/2**20, 1), hot_spots
+
+
+def run_isolated(function: str, xlsx_fn: str, repeat: int,
+                 workflow_output=None, traced: bool = False) -> dict:
+    """Run `profile_function` in a fresh interpreter."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spec_fn = os.path.join(tmp_dir, "spec.json")
+        result_fn = os.path.join(tmp_dir, "result.json")
+        with open(spec_fn, "w") as fp:
+            json.dump({"function": function, "xlsx_fn": xlsx_fn, "repeat": repeat,
+                       "workflow_output": workflow_output, "traced": traced}, fp)
+        proc = subprocess.run(
+            [sys.executable, os.path.realpath(__file__), "--child", spec_fn, result_fn],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"profiling {function} failed:\n{proc.stderr[-4000:]}")
+        with open(result_fn, "r") as fp:
+            return json.load(fp)
+
+
+def estimate_latency_ms(latency_ms: float, memory_mb: int, cpu_scale: float = 1.0) -> float:
+    """Latency at a memory tier of a single threaded handler measured on a full
+    core `cpu_scale` times as fast as a Lambda vCPU."""
+    return latency_ms*cpu_scale*max(1.0, FULL_VCPU_MB/memory_mb)
+
+
+def recommend_tier(result: dict, latency_ms: float, headroom: float,
+                   cpu_scale: float = 1.0) -> dict:
+    """Smallest memory tier that fits the peak RSS plus headroom and meets
+    the latency target. None if no tier does."""
+    min_memory_mb = result["peak_rss_mb"]*(1 + headroom)
+    p99_ms = result["warm_ms"]["p99"]
+    for tier in MEMORY_TIERS_MB:
+        if tier < min_memory_mb:
+            continue
+        estimate_ms = estimate_latency_ms(p99_ms, tier, cpu_scale)
+        if estimate_ms <= latency_ms:
+            return {
+                "memory_size": tier,
+                "estimated_p99_ms": round(estimate_ms, 3),
+                "estimated_cold_ms": round(estimate_latency_ms(result["cold_ms"], tier, cpu_scale), 3),
+            }
+    return {"memory_size": None, "estimated_p99_ms": None, "estimated_cold_ms": None}
+
+
+def rss_mb(peak: bool = True) -> float:
+    """Peak (since the last `reset_peak_rss`) or current resident set size of
+    the process. Outside of linux the peak is ru_maxrss and the current size
+    is not available (the peak is returned)."""
+    if os.path.isfile(PROC_STATUS_FN):
+        field = "VmHWM:" if peak else "VmRSS:"
+        with open(PROC_STATUS_FN, "r") as fp:
+            for line in fp:
+                if line.startswith(field):
+                    return round(int(line.split()[1])/2**10, 1)  # kB
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # bytes on macOS, KB on linux
+    return round(maxrss/scale, 1)
+
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS (linux only)."""
+    try:
+        with open(PROC_CLEAR_REFS_FN, "w") as fp:
+            fp.write("5")
+    except OSError:
+        pass
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile (numpy is not imported by the profiled processes)."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p/100*len(values)) - 1)]
+
+
+def print_report(results: dict, recommendations: dict):
+    for function,by_size in results.items():
+        print(f"\n{function} (MemorySize {next(iter(by_size.values()))['memory_size']} MB)")
+        print(f"  {'size':>9} {'payload':>11} {'baseline':>9} {'import':>9} {'peak RSS':>10}"
+              f" {'traced':>9} {'cold':>11} {'warm p50':>11} {'warm p99':>11}")
+        for size,r in by_size.items():
+            print(f"  {size:>9} {r['payload_kb']:>8.1f} KB {r['baseline_mb']:>6.1f} MB"
+                  f" {r['import_mb']:>6.1f} MB"
+                  f" {r['peak_rss_mb']:>7.1f} MB {r['traced_peak_mb']:>6.1f} MB"
+                  f" {r['cold_ms']:>8.1f} ms {r['warm_ms']['p50']:>8.1f} ms"
+                  f" {r['warm_ms']['p99']:>8.1f} ms")
+        largest = by_size[max(by_size)]
+        print(f"  hot spots at {max(by_size)} communities:")
+        for h in largest["hot_spots"]:
+            print(f"    {h['size_mb']:>9.3f} MB {h['count']:>9} blocks  {h['location']}")
+        rec = recommendations[function]
+        if rec["memory_size"] is None:
+            print("  recommended MemorySize: none meets the latency target")
+        else:
+            print(f"  recommended MemorySize: {rec['memory_size']} MB"
+                  f" (estimated p99 {rec['estimated_p99_ms']:.1f} ms,"
+                  f" cold {rec['estimated_cold_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        with open(sys.argv[2], "r") as fp:
+            spec = json.load(fp)
+        result = profile_function(**spec)
+        with open(sys.argv[3], "w") as fp:
+            json.dump(result, fp)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", dest="sizes", type=int, action="append",
+                        help=f"Number of communities, repeatable (default {DEFAULT_SIZES})")
+    parser.add_argument("--function", dest="functions", type=str, action="append",
+                        choices=FUNCTIONS, help="Logical ID of a function, repeatable (default all)")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=5,
+                        help="Invocations per function and size")
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=1000,
+                        help="Latency target (warm p99) of every function")
+    parser.add_argument("--headroom", dest="headroom", type=float, default=0.2,
+                        help="Memory headroom over the peak RSS (fraction)")
+    parser.add_argument("--cpu-scale", dest="cpu_scale", type=float, default=1.0,
+                        help="Speed of this machine's core relative to a Lambda vCPU")
+    parser.add_argument("--seed", dest="seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed of the synthetic workbooks")
+    parser.add_argument("--work-dir", dest="work_dir", type=str, default=DEFAULT_WORK_DIR,
+                        help="Directory caching the synthetic workbooks")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the measurements and recommendations")
+    args = parser.parse_args()
+    # only the parent generates workbooks, keep pandas out of the profiled processes
+    from synthetic_data import generate_workbook
+
+    sizes = sorted(args.sizes or DEFAULT_SIZES)
+    functions = [f for f in FUNCTIONS if args.functions is None or f in args.functions]
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    results = {f: {} for f in functions}
+    for size in sizes:
+        xlsx_fn = generate_workbook(
+            os.path.join(args.work_dir, f"synthetic_{size}_{args.seed}.xlsx"), size, args.seed
+        )
+        outputs = {}
+        for function in functions:
+            source = API_WORKFLOW_OUTPUTS.get(function)
+            if source is not None and source not in outputs:
+                outputs[source] = run_isolated(source, xlsx_fn, 1)["output"]
+            print(f"profiling {function} at {size} communities", file=sys.stderr)
+            result = run_isolated(function, xlsx_fn, args.repeat, outputs.get(source))
+            result.update(run_isolated(function, xlsx_fn, 1, outputs.get(source), traced=True))
+            outputs[function] = result.pop("output")
+            results[function][size] = result
+
+    recommendations = {
+        f: recommend_tier(by_size[max(by_size)], args.latency_ms, args.headroom, args.cpu_scale)
+        for f,by_size in results.items()
+    }
+    print_report(results, recommendations)
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as fp:
+            json.dump({
+                "settings": {"latency_ms": args.latency_ms, "headroom": args.headroom,
+                             "cpu_scale": args.cpu_scale, "repeat": args.repeat},
+                "results": results,
+                "recommendations": recommendations,
+            }, fp, indent=4)
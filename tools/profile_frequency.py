@@ -0,0 +1,69 @@
+"""Count the homebuyer profiles of ranking requests from Lambda logs.
+
+The RankCommunities handler span carries the hash and canonical form of the
+request's profile (see `src/profiles.py` of rank_communities). This tool reads
+log files (e.g. an exported CloudWatch log group of RankCommunities), counts
+the requests of every profile and writes the frequency table the warm-up reads
+after each publish of the community data:
+    aws s3 cp profile_frequency.json s3://<bucket>/warmup/profile_frequency.json
+
+Usage (from the project root):
+    python tools/profile_frequency.py logs/*.log --json-file profile_frequency.json
+    python tools/profile_frequency.py logs/*.log --json-file profile_frequency.json --top 100
+"""
+
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+import json
+
+from span_tree import HANDLER_SPAN_NAME, read_spans
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+RANK_MODULE_NAME = "rank_communities"
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def count_profiles(spans: list[dict]) -> dict:
+    """Frequency table of the profiles ranked in the spans, most frequent
+    first. Warm-up invocations carry no profile and are skipped."""
+    counts = Counter()
+    profiles = {}
+    for s in spans:
+        if s["module"] != RANK_MODULE_NAME or s["name"] != HANDLER_SPAN_NAME \
+                or "profile_hash" not in s:
+            continue
+        counts[s["profile_hash"]] += 1
+        profiles[s["profile_hash"]] = s["profile"]
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "n_requests": sum(counts.values()),
+        "profiles": [
+            {"profile_hash": h, "count": count, **profiles[h]}
+            for h,count in counts.most_common()
+        ]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_files", type=str, nargs="+",
+                        help="Log files containing the span lines")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=True,
+                        help="JSON file to write the frequency table")
+    parser.add_argument("--top", dest="top", type=int, required=False,
+                        help="Only keep the most frequent profiles")
+    args = parser.parse_args()
+
+    table = count_profiles(read_spans(args.log_files))
+    if args.top is not None:
+        table["profiles"] = table["profiles"][:args.top]
+    n_requests = table["n_requests"]
+    print(f"{n_requests} requests, {len(table['profiles'])} profiles")
+    for p in table["profiles"][:10]:
+        print(f"  {p['profile_hash']}  {p['count']:>8}  {p['count']/n_requests:>7.1%}")
+
+    with open(args.json_file, "w") as fp:
+        json.dump(table, fp, indent=4)
@@ -0,0 +1,202 @@
+"""Frozen reference ranking of the differential gate (tools/differential.py).
+
+The pandas filter, score and rank of the original communities.py, kept apart
+from the Lambda package on purpose: it imports nothing from `src`, so a bug
+in code the Lambda's implementations share (the workbook reader, the scoring
+kernels, the feature multipliers, the quality lookup) cannot pass the gate
+by being on both sides of it. It is slow and row by row like the original.
+
+Deliberate changes of the ranking are made here by hand as well. Since the
+original:
+    - quality ratings match exactly after normalization (spaces removed,
+      upper case, anything after '=' dropped); unknown ratings score nothing
+    - a `max_total_cost` need keeps the communities whose total cost of
+      ownership (average price, HOA fee over `total_cost_years` and the
+      preservation fee) is within the budget
+"""
+
+from statistics import fmean
+import re
+
+import numpy as np
+import pandas as pd
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PRIMARY_KEY = "Community Name"
+SHEET_NAME_NEEDS = "Sheet1"
+SHEET_NAME_WANTS = "Sheet2"
+SCORE_KEY = "Homebuyer Score"
+
+# homebuyer needs
+LOC_KEY = "Location"
+PRICE_AVG_KEY = "Average Single Family Home Price (90 Days)"
+PRICE_LOW_KEY = "Price Range Low"
+PRICE_HIGH_KEY = "Price Range High"
+HOA_KEY = "HOA/Rec Fee - 2 People Annual Total"
+HOME_TOT_KEY = "Total Homes in community"
+HOME_AGE_KEY = "Average Age of Home"
+PRES_KEY = "Preservation Fee"
+SIZE_KEY = "Size of Community"
+SIZES = ["Small", "Medium", "Large"]
+PRICE_MAX = "Max"
+DOES_NOT_MATTER = "Does not matter"
+TCO_YEARS = 10
+
+# homebuyer wants
+MAX_PREFERENCE = MAX_RATING = 5
+MIN_PREFERENCE = MIN_RATING = 1
+N_GOLF_COURSE_KEY = "# of Golf Courses"
+N_CLUBS_KEY = "# of Clubs Offered"
+GOLF_COURSE_QLTY_KEY = "Golf Course Quality"
+TRAILS_QLTY_KEY = "Walking/Biking Trails"
+PICKLEBALL_KEY = "Competitive Pickleball?"
+YES_NO_WANTS = {
+    "Gated?": "gated",
+    "Nearby Mountain Views?": "mountain_views",
+    "Softball Field?": "softball_field",
+    "Isolated From Rest of City": "isolated_from_city",
+    "Fishing in Community": "fishing",
+    "Woodwork Shop?": "woodwork_shop",
+    "Indoor + Outdoor Pool": "indoor_pool",
+    "Dog Park?": "dog_park",
+}
+GOLF_COURSE_QUALITIES = ["OK", "OK-GOOD", "GOOD", "VERY GOOD", "GREAT"]  # lowest first
+TRAILS_QUALITIES = ["OK", "GOOD", "GREAT"]
+PERCENTAGE_PATTERN = re.compile(r"(\d*\.?\d+)\s*%")
+PERCENTAGE_OF_PATTERN = re.compile(r"\s*of\s*", re.IGNORECASE)
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def read_sheet(xlsx_fn: str, sheet_name: str) -> pd.DataFrame:
+    """Read a sheet indexed by community name, without the rows that have none."""
+    df = pd.read_excel(xlsx_fn, sheet_name=sheet_name)
+    df.rename(columns=lambda x: x.strip(), inplace=True)
+    df[PRIMARY_KEY] = df[PRIMARY_KEY].str.strip()
+    df[PRIMARY_KEY].replace(to_replace="", value=np.nan, inplace=True)
+    df = df[df[PRIMARY_KEY].notnull()]
+    return df.set_index(PRIMARY_KEY)
+
+
+def filter_communities(df: pd.DataFrame, hb_needs: dict) -> pd.DataFrame:
+    """Communities meeting the homebuyer needs, with their size."""
+    lower = 1000*int("".join(filter(str.isdigit, hb_needs["price_range_lower"])))
+    if hb_needs["price_range_upper"].capitalize() == PRICE_MAX:
+        upper = df[PRICE_HIGH_KEY].max()
+    else:
+        upper = 1000*int("".join(filter(str.isdigit, hb_needs["price_range_upper"])))
+    if hb_needs["age_of_home"].capitalize() == DOES_NOT_MATTER:
+        year_built = 0
+    else:
+        year_built = int("".join(filter(str.isdigit, hb_needs["age_of_home"])))
+
+    df = df.sort_values(by=HOME_TOT_KEY)
+    df = df[df[HOME_TOT_KEY].notnull()]
+    df[SIZE_KEY] = cluster_sizes(df[HOME_TOT_KEY].values)
+
+    df = df[df[SIZE_KEY].isin(hb_needs["size_of_community"])]
+    df = df[df[LOC_KEY].str.contains("|".join(hb_needs["location"]))]
+    df = df[(df[PRICE_LOW_KEY].le(lower) & df[PRICE_HIGH_KEY].ge(lower)) | \
+            (df[PRICE_LOW_KEY].le(upper) & df[PRICE_HIGH_KEY].ge(upper)) | \
+            (df[PRICE_LOW_KEY].isin(range(lower, upper+1))) | \
+            (df[PRICE_HIGH_KEY].isin(range(lower, upper+1)))]
+    df = df[df[HOME_AGE_KEY] > year_built]
+    if "max_total_cost" in hb_needs:
+        years = hb_needs.get("total_cost_years", TCO_YEARS)
+        cost = df.apply(lambda x: total_cost(x[PRICE_AVG_KEY], x[HOA_KEY], x[PRES_KEY], years),
+                        axis=1)
+        df = df[cost <= hb_needs["max_total_cost"]]
+    return df
+
+
+def score_communities(df: pd.DataFrame, hb_wants: dict) -> pd.DataFrame:
+    """Score every community by homebuyer wants."""
+    def calc_score(mult: float, preference: int) -> float:
+        return mult*(preference-MIN_PREFERENCE)/(MAX_PREFERENCE-MIN_PREFERENCE)
+
+    def yes_no(value, preference: int) -> float:
+        return 0 if pd.isnull(value) else calc_score(float("Y" in str(value)), preference)
+
+    def competition(value, preference: int) -> float:
+        value = pd.to_numeric(value, errors="coerce")
+        return 0 if pd.isnull(value) else \
+            calc_score((value-MIN_RATING)/(MAX_RATING-MIN_RATING), preference)
+
+    def quality(value, preference: int, qualities: list) -> float:
+        if pd.isnull(value):
+            return 0
+        key = str(value).replace(" ", "").upper().split("=")[0]
+        codes = {q.replace(" ", ""): i for i,q in enumerate(qualities)}
+        if key not in codes:
+            return 0
+        return calc_score(codes[key]/(len(qualities)-1), preference)
+
+    def offerings(value, preference: int, max_offerings: float) -> float:
+        return 0 if pd.isnull(value) else calc_score(value/max_offerings, preference)
+
+    df = df.copy()
+    df[N_GOLF_COURSE_KEY] = pd.to_numeric(df[N_GOLF_COURSE_KEY], errors="coerce")
+    df[N_CLUBS_KEY] = pd.to_numeric(df[N_CLUBS_KEY].astype(str).str.extract(r"(\d+)", expand=False),
+                                    errors="coerce")
+    features = [(key, yes_no, {"preference": int(hb_wants[want])})
+                for key,want in YES_NO_WANTS.items()]
+    features += [
+        (PICKLEBALL_KEY, competition, {"preference": int(hb_wants["competitive_pickleball"])}),
+        (GOLF_COURSE_QLTY_KEY, quality, {"preference": int(hb_wants["quality_golf_courses"]),
+                                         "qualities": GOLF_COURSE_QUALITIES}),
+        (TRAILS_QLTY_KEY, quality, {"preference": int(hb_wants["quality_trails"]),
+                                    "qualities": TRAILS_QUALITIES}),
+        (N_GOLF_COURSE_KEY, offerings, {"preference": int(hb_wants["mult_golf_courses"]),
+                                        "max_offerings": df[N_GOLF_COURSE_KEY].max()}),
+        (N_CLUBS_KEY, offerings, {"preference": int(hb_wants["many_social_clubs"]),
+                                  "max_offerings": df[N_CLUBS_KEY].max()}),
+    ]
+    df[SCORE_KEY] = np.zeros(len(df.index))
+    for key,func,kwargs in features:
+        df[SCORE_KEY] = df.apply(lambda x: x[SCORE_KEY] + func(x[key], **kwargs), axis=1)
+    return df
+
+
+def rank_communities(df_filtered: pd.DataFrame, df_scored: pd.DataFrame) -> dict:
+    """Filtered communities by highest to lowest score ({name: score})."""
+    scores = df_scored.loc[df_filtered.index, SCORE_KEY].astype(float)
+    return dict(scores.sort_values(ascending=False, kind="mergesort").items())
+
+
+def total_cost(price_avg: float, hoa_fee: float, preservation_fee, years: int) -> float:
+    """Total cost of ownership over `years`. A preservation fee is a dollar
+    amount or a rate of the sale price ('.5% of 1% of price' multiplies the
+    rates); missing is no fee, anything else makes the cost unknown (NaN)."""
+    if pd.isnull(preservation_fee):
+        fee = 0.0
+    elif isinstance(preservation_fee, (int, float)):
+        fee = float(preservation_fee)
+    else:
+        text = str(preservation_fee)
+        matches = list(PERCENTAGE_PATTERN.finditer(text))
+        if matches:
+            joins = [text[a.end():b.start()] for a,b in zip(matches, matches[1:])]
+            rate = np.prod([float(m.group(1))/100 for m in matches])
+            fee = rate*price_avg if all(PERCENTAGE_OF_PATTERN.fullmatch(j) for j in joins) else np.nan
+        else:
+            try:
+                fee = float(text.replace("$", "").replace(",", ""))
+            except ValueError:
+                fee = np.nan
+    return float(price_avg) + years*float(hoa_fee) + fee
+
+
+def cluster_sizes(data: np.ndarray) -> list:
+    """Cluster sorted community sizes into small, medium and large with a
+    naive 1-dimensional k-means."""
+    centroids = [np.min(data), data[np.size(data)//2], np.max(data)]
+    changed = True
+    while changed:
+        prev_centroids = centroids.copy()
+        clusters = [[], [], []]
+        for d in data:
+            clusters[int(np.argmin([abs(d - c) for c in centroids]))].append(d)
+        centroids = [fmean(cluster) for cluster in clusters]
+        changed = prev_centroids != centroids
+    return [size for size,cluster in zip(SIZES, clusters) for _ in cluster]
@@ -0,0 +1,170 @@
+"""Rebuild per-request span trees and latency breakdowns from Lambda logs.
+
+Every Lambda handler logs its spans as JSON lines {"span": {...}} (see
+`observability/tracing.py` of the observability layer). This tool reads log files (e.g. exported
+CloudWatch log groups of the API and workflow Lambdas, in any order and with
+any line prefix), joins the spans by correlation ID and prints the span tree of
+every request with the offset and duration of each span.
+
+The latency of a request is split into
+    compute         time spent in the handlers of the workflow Lambdas
+    orchestration   the rest of the API handler: launching and polling the
+                    state machine, state transitions and Lambda invocations
+followed by the p50/p99 of each part (and of every stage) across requests.
+
+Usage (from the project root):
+    python tools/span_tree.py logs/*.log
+    python tools/span_tree.py logs/*.log --correlation-id 7f1c... --json-file spans.json
+"""
+
+import argparse
+from collections import defaultdict
+import json
+
+import numpy as np
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+SPAN_MARKER = '{"span":'
+PERCENTILES = [50, 99]
+HANDLER_SPAN_NAME = "lambda_handler"
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def read_spans(log_files: list[str]) -> list[dict]:
+    """Spans logged in the files, skipping every other line."""
+    decoder = json.JSONDecoder()
+    spans = []
+    for log_file in log_files:
+        with open(log_file, "r") as fp:
+            for line in fp:
+                idx = line.find(SPAN_MARKER)
+                if idx < 0:
+                    continue
+                try:
+                    record, _ = decoder.raw_decode(line[idx:])
+                except json.JSONDecodeError:
+                    continue
+                spans.append(record["span"])
+    return spans
+
+
+def group_by_request(spans: list[dict]) -> dict:
+    """Spans of every request, by correlation ID."""
+    requests = defaultdict(list)
+    for s in spans:
+        requests[s["correlation_id"]].append(s)
+    return dict(requests)
+
+
+def build_tree(spans: list[dict]) -> list[dict]:
+    """Nest the spans of a request under their parents (key "children").
+    Returns the roots: spans whose parent was not logged, earliest first."""
+    nodes = {s["span_id"]: {**s, "children": []} for s in spans}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node["parent_id"])
+        (parent["children"] if parent is not None else roots).append(node)
+    for node in nodes.values():
+        node["children"].sort(key=lambda n: n["start"])
+    return sorted(roots, key=lambda n: n["start"])
+
+
+def breakdown(root: dict) -> dict:
+    """Split the latency of a request into compute (handlers of the Lambdas
+    downstream of the root) and orchestration (the rest of the root). A root
+    without downstream Lambdas is all compute."""
+    total_ms = root["duration_ms"]
+    stages = {}
+    for node in _walk(root):
+        if node["name"] == HANDLER_SPAN_NAME and node["module"] != root["module"]:
+            stages[node["stage"]] = stages.get(node["stage"], 0) + node["duration_ms"]
+    if not stages:  # a worker Lambda invoked directly, e.g. by main.py
+        stages[root["stage"]] = total_ms
+    compute_ms = sum(stages.values())
+    return {
+        "total_ms": round(total_ms, 3),
+        "compute_ms": round(compute_ms, 3),
+        "orchestration_ms": round(total_ms - compute_ms, 3),
+        "stages": {k: round(v, 3) for k,v in stages.items()},
+    }
+
+
+def summarize(breakdowns: list[dict]) -> dict:
+    """Latency percentiles of every part across requests."""
+    values = defaultdict(list)
+    for b in breakdowns:
+        for part in ["total_ms", "compute_ms", "orchestration_ms"]:
+            values[part].append(b[part])
+        for stage,ms in b["stages"].items():
+            values[f"{stage}_ms"].append(ms)
+    return {
+        part: {"n": len(v), **{f"p{p}": round(float(np.percentile(v, p)), 3) for p in PERCENTILES}}
+        for part,v in values.items()
+    }
+
+
+def format_tree(root: dict) -> str:
+    """Indented span tree with offsets from the start of the root."""
+    lines = []
+
+    def visit(node: dict, depth: int):
+        offset_ms = (node["start"] - root["start"])*1000
+        label = f"{node['module']}.{node['name']}"
+        status = "" if node["status"] == "ok" else f"  [{node['status']}: {node.get('error')}]"
+        version = f"  dataset {node['dataset_version']}" if node.get("dataset_version") else ""
+        lines.append(f"{'  '*depth}{label:<{48 - 2*depth}}"
+                     f"+{offset_ms:>10.1f} ms{node['duration_ms']:>12.1f} ms{version}{status}")
+        for child in node["children"]:
+            visit(child, depth + 1)
+
+    visit(root, 0)
+    return "\n".join(lines)
+
+
+def _walk(node: dict):
+    yield node
+    for child in node["children"]:
+        yield from _walk(child)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_files", type=str, nargs="+",
+                        help="Log files containing the span lines")
+    parser.add_argument("--correlation-id", dest="correlation_id", type=str, required=False,
+                        help="Only show the request with this correlation ID")
+    parser.add_argument("--json-file", dest="json_file", type=str, required=False,
+                        help="JSON file to write the trees, breakdowns and summary")
+    args = parser.parse_args()
+
+    requests = group_by_request(read_spans(args.log_files))
+    if args.correlation_id is not None:
+        requests = {k: v for k,v in requests.items() if k == args.correlation_id}
+
+    report = {"requests": {}}
+    breakdowns = []
+    for correlation_id,spans in sorted(requests.items(), key=lambda kv: min(s["start"] for s in kv[1])):
+        roots = build_tree(spans)
+        print(f"\nrequest {correlation_id}")
+        for root in roots:
+            print(format_tree(root))
+        # a request logged end to end has a single root, the API handler
+        b = breakdown(roots[0])
+        breakdowns.append(b)
+        print(f"  total {b['total_ms']:.1f} ms = compute {b['compute_ms']:.1f} ms "
+              f"+ orchestration {b['orchestration_ms']:.1f} ms")
+        report["requests"][correlation_id] = {"spans": roots, "breakdown": b}
+
+    if breakdowns:
+        report["summary"] = summarize(breakdowns)
+        print(f"\n{len(breakdowns)} requests")
+        for part,summary in report["summary"].items():
+            print(f"  {part:<32}" + "".join(
+                f"{summary[f'p{p}']:>12.1f} ms p{p}" for p in PERCENTILES
+            ))
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as fp:
+            json.dump(report, fp, indent=4)
@@ -0,0 +1,211 @@
+"""Generate synthetic community datasets shaped like the community data
+spreadsheet (same sheets, headers and kinds of values as
+`tests/data/55+_Communities_v1.xlsx`) at any number of communities, and
+homebuyer profiles (ranking requests) valid per the payload schema.
+
+The values are drawn from the spellings found in the real spreadsheet
+(e.g. 'OK - Good', '20+', 'Y&N', '.25% of Sale Price') so parsing and
+scoring take the same code paths as on real data. Cells are only left blank
+in the columns `validate_community_data` allows to be blank, so the workbooks
+pass the update data workflow like the real spreadsheet does.
+
+Usage (from the project root):
+    python tools/synthetic_data.py 10000 synthetic_10k.xlsx
+    python tools/synthetic_data.py 1000000 synthetic_1m.xlsx --seed 7
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+# ----------------------------------------------------------------------------#
+#                               --- Globals ---                               #
+# ----------------------------------------------------------------------------#
+PROJ_ROOT_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), os.pardir
+)
+RANK_COMMUNITIES_PATH = os.path.join(
+    PROJ_ROOT_PATH, "service", "lambdas", "rank_communities"
+)
+sys.path.append(RANK_COMMUNITIES_PATH)
+# env vars read at import time by the Lambda package
+os.environ.setdefault("COMMUNITY_DATA_BUCKET_NAME", "")
+os.environ.setdefault("COMMUNITY_DATA_OBJECT_NAME", "")
+from src.columns import (
+    CITY_KEY, DOG_PARK_KEY, FISH_KEY, GATE_KEY, GOLF_COURSE_QLTY_KEY, HOA_KEY,
+    HOME_AGE_KEY, HOME_TOT_KEY, ISOLATED_KEY, LINK_KEY, LOC_KEY, MTN_VIEW_KEY,
+    N_CLUBS_KEY, N_GOLF_COURSE_KEY, N_REC_CENTER_KEY, PICKLEBALL_KEY, POOL_KEY,
+    PRES_KEY, PRICE_AVG_KEY, PRICE_HIGH_KEY, PRICE_LOW_KEY, PRIMARY_KEY,
+    SHEET_NAME_NEEDS, SHEET_NAME_WANTS, SOFTBALL_KEY, TRAILS_QLTY_KEY,
+    WOODWORK_KEY
+)
+PAYLOAD_SCHEMA_FN = os.path.join(
+    PROJ_ROOT_PATH, "service", "lambdas", "validate_rank_inputs", "src", "payload_schema.json"
+)
+# wants the ranking scores that the payload schema does not list
+UNLISTED_WANTS = ["isolated_from_city"]
+DEFAULT_SEED = 42
+MISSING_RATE = 0.03  # fraction of missing cells in the optional columns
+
+CITIES = [
+    "Sun City", "Sun City West", "Surprise", "Buckeye", "Goodyear",
+    "Goodyear (Estrella Mt)", "Peoria", "South Phoenix", "South of Chandler",
+    "Chandler", "Gilbert", "Mesa", "San Tan Valley", "Gold Canyon"
+]
+LOCATIONS = ["West Valley", "West Valley/Central", "Central", "East Valley"]
+GOLF_COURSE_QUALITIES = [
+    "OK", "Ok", "OK= (executive)", "OK - Good", "OK-Good", "Good", "Very Good", "Great"
+]
+TRAILS_QUALITIES = ["OK", "Good", "Great"]
+YES_NO = ["Y", "N"]
+GATED = ["Y", "N", "Y&N"]
+POOL = ["Y", "N", "Outdoor"]
+CLUBS_SUFFIXES = ["", "+"]
+PRESERVATION_FEE_TEXT = [".25% of Sale Price", ".5% of 1% of\n  price"]
+GOLF_COST_TEXT = ["UNK", "$600 (Par 3)", "$1950 (Plus Daily fees)"]
+
+# ----------------------------------------------------------------------------#
+#                                 --- MAIN ---                                #
+# ----------------------------------------------------------------------------#
+def generate_dataset(n_communities: int,
+                     seed: int = DEFAULT_SEED) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Generate the needs (Sheet1) and wants (Sheet2) sheets of a synthetic
+    dataset with `n_communities` rows. The same seed gives the same dataset."""
+    rng = np.random.default_rng(seed)
+    n = n_communities
+    names = [f"Community {i:07d}" for i in range(n)]
+
+    price_low = rng.integers(3, 30, n)*50_000
+    price_high = price_low + rng.integers(1, 20, n)*50_000
+    price_avg = (price_low + (price_high-price_low)*rng.uniform(0.2, 0.8, n)).round(-3)
+    pres_fee = rng.integers(0, 50, n)*100
+    df_needs = pd.DataFrame({
+        PRIMARY_KEY: names,
+        CITY_KEY: rng.choice(CITIES, n),
+        LOC_KEY: rng.choice(LOCATIONS, n),
+        PRICE_AVG_KEY: price_avg.astype(int),
+        PRICE_LOW_KEY: price_low,
+        PRICE_HIGH_KEY: price_high,
+        HOA_KEY: rng.integers(300, 6000, n),
+        HOME_TOT_KEY: np.exp(rng.uniform(np.log(50), np.log(30_000), n)).astype(int),
+        HOME_AGE_KEY: rng.integers(1960, 2024, n),
+        PRES_KEY: _with_text(rng, pres_fee.astype(object), PRESERVATION_FEE_TEXT, 0.05),
+        LINK_KEY: [f"https://www.example.com/{i}" for i in range(n)],
+    })
+
+    n_golf_courses = rng.integers(0, 9, n).astype(float)
+    golf_quality = rng.choice(GOLF_COURSE_QUALITIES, n).astype(object)
+    golf_quality[n_golf_courses == 0] = np.nan
+    n_clubs = [f"{c}{s}" if s else c for c,s in zip(
+        rng.integers(1, 30, n)*5, rng.choice(CLUBS_SUFFIXES, n)
+    )]
+    df_wants = pd.DataFrame({
+        PRIMARY_KEY: names,
+        "Unlimited Golf Annual Cost (1 Person)":
+            _with_text(rng, rng.integers(10, 70, n).astype(object)*100, GOLF_COST_TEXT, 0.1),
+        N_GOLF_COURSE_KEY: n_golf_courses,
+        GOLF_COURSE_QLTY_KEY: golf_quality,
+        N_CLUBS_KEY: _with_missing(rng, np.array(n_clubs, dtype=object)),
+        "Raquet Courts": _with_missing(rng, rng.choice(YES_NO, n).astype(object)),
+        POOL_KEY: rng.choice(POOL, n).astype(object),
+        TRAILS_QLTY_KEY: _with_missing(rng, rng.choice(TRAILS_QUALITIES, n).astype(object)),
+        N_REC_CENTER_KEY: _with_missing(rng, rng.integers(0, 9, n).astype(float)),
+        FISH_KEY: rng.choice(YES_NO, n).astype(object),
+        "Rentals OK?": _with_missing(rng, np.full(n, "Y", dtype=object)),
+        DOG_PARK_KEY: rng.choice(YES_NO, n).astype(object),
+        "Lots Still Available?": _with_missing(rng, rng.choice(YES_NO, n).astype(object)),
+        GATE_KEY: rng.choice(GATED, n).astype(object),
+        WOODWORK_KEY: rng.choice(YES_NO, n).astype(object),
+        MTN_VIEW_KEY: rng.choice(YES_NO, n).astype(object),
+        SOFTBALL_KEY: rng.choice(YES_NO, n).astype(object),
+        ISOLATED_KEY: rng.choice(YES_NO, n).astype(object),
+        PICKLEBALL_KEY: rng.integers(1, 6, n).astype(float),
+    })
+    return df_needs, df_wants
+
+
+def write_workbook(xlsx_fn: str, df_needs: pd.DataFrame, df_wants: pd.DataFrame):
+    """Write the sheets of a dataset to an Excel workbook."""
+    with pd.ExcelWriter(xlsx_fn, engine="openpyxl") as writer:
+        df_needs.to_excel(writer, sheet_name=SHEET_NAME_NEEDS, index=False)
+        df_wants.to_excel(writer, sheet_name=SHEET_NAME_WANTS, index=False)
+
+
+def generate_workbook(xlsx_fn: str, n_communities: int,
+                      seed: int = DEFAULT_SEED, overwrite: bool = False) -> str:
+    """Generate a synthetic workbook unless it already exists. Returns its path."""
+    if overwrite or not os.path.isfile(xlsx_fn):
+        write_workbook(xlsx_fn, *generate_dataset(n_communities, seed))
+    return xlsx_fn
+
+
+def generate_profiles(n_profiles: int, seed: int = DEFAULT_SEED) -> list[dict]:
+    """Generate homebuyer profiles (ranking request payloads) that are valid
+    per the payload schema, with every need and want drawn at random."""
+    with open(PAYLOAD_SCHEMA_FN, "r") as fp:
+        schema = json.load(fp)["properties"]
+    needs_schema = schema["needs"]["properties"]
+    wants_schema = schema["wants"]["properties"]
+    lower_prices = needs_schema["price_range_lower"]["enum"]
+    upper_prices = needs_schema["price_range_upper"]["enum"]
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for i in range(n_profiles):
+        # upper_prices[j] > lower_prices[i] whenever j >= i
+        lower = int(rng.integers(len(lower_prices)))
+        upper = int(rng.integers(lower, len(upper_prices)))
+        needs = {
+            "price_range_lower": lower_prices[lower],
+            "price_range_upper": upper_prices[upper],
+            "age_of_home": str(rng.choice(needs_schema["age_of_home"]["enum"])),
+        }
+        for key in ["location", "size_of_community"]:
+            options = needs_schema[key]["items"]["enum"]
+            n_options = int(rng.integers(1, 3))
+            needs[key] = [str(o) for o in rng.choice(options, n_options, replace=False)]
+        wants = {
+            key: int(rng.integers(prop["minimum"], prop["maximum"] + 1))
+            for key,prop in wants_schema.items()
+        }
+        for key in UNLISTED_WANTS:
+            wants[key] = int(rng.integers(1, 6))
+        profiles.append({
+            "needs": needs,
+            "wants": wants,
+            "email_address": f"profile{i:06d}@example.com",
+            "email_homebuyer": False,
+        })
+    return profiles
+
+
+def _with_missing(rng: np.random.Generator, values: np.ndarray,
+                  rate: float = MISSING_RATE) -> np.ndarray:
+    """Blank out a random fraction of the cells."""
+    values = values.astype(object) if values.dtype.kind not in "fO" else values
+    values[rng.random(len(values)) < rate] = np.nan
+    return values
+
+
+def _with_text(rng: np.random.Generator, values: np.ndarray, texts: list,
+               rate: float) -> np.ndarray:
+    """Replace a random fraction of numeric cells with free text."""
+    replace = rng.random(len(values)) < rate
+    values[replace] = rng.choice(texts, int(replace.sum()))
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("n_communities", type=int,
+                        help="Number of communities (rows) in the dataset")
+    parser.add_argument("xlsx_fn", type=str,
+                        help="Excel file to write")
+    parser.add_argument("--seed", dest="seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed, the same seed gives the same dataset")
+    args = parser.parse_args()
+
+    generate_workbook(args.xlsx_fn, args.n_communities, args.seed, overwrite=True)
+    print(f"wrote {args.n_communities} communities to {args.xlsx_fn}")